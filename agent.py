@@ -1,80 +1,353 @@
 # agent.py
+import asyncio
 import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
 from deepseek_client import DeepSeekClient
+from llm_cache import create_cache
+from metrics import logger, registry, span
+from plan_parser import PlanStreamParser
+from scan_jobs import FINISHED, default_scan_params
 from tushare_tools import (
+    backtest_strategy,
     get_stock_match_days,
     get_all_live_stocks,
-    get_stock_data
+    get_stock_data,
+    get_indexed_match_days,
+    get_strategy_match_days,
+    list_strategies,
+    resolve_stock
 )
 
 SAFE_FUNCTIONS = {
     "get_stock_match_days": get_stock_match_days,
     "get_all_live_stocks": get_all_live_stocks,
-    "get_stock_data": get_stock_data
+    "get_stock_data": get_stock_data,
+    "resolve_stock": resolve_stock,
+    "get_strategy_match_days": get_strategy_match_days,
+    "list_strategies": list_strategies,
+    "backtest_strategy": backtest_strategy
 }
 
+# Seconds a single tool call may take when several calls run in parallel
+TOOL_TIMEOUT = float(os.environ.get("TOOL_TIMEOUT", "120"))
+TOOL_WORKERS = int(os.environ.get("TOOL_WORKERS", "8"))
+# Market-wide scans asked from the chat run as scan jobs in this mode (see scan_jobs.py); per_stock
+# reports matches as they are found, batch fetches the market by trade date and reports them at the end
+AGENT_SCAN_MODE = os.environ.get("AGENT_SCAN_MODE", "per_stock")
+# Seconds between job status polls while streaming a scan job
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1"))
+
+SYSTEM_PROMPT = (
+    "You are a Tushare expert agent. "
+    "Given a user query about stock data or trading trends, "
+    "decide which Tushare function to call and what parameters to use. "
+    "Return a JSON object with fields: {function, params, reasoning}, in that order."
+    "When the query needs several independent lookups (e.g. comparing stocks), return "
+    "{calls:[{function, params}, ...], reasoning} instead; the calls run in parallel."
+    "Allowed functions: get_stock_match_days, get_stock_data, get_all_live_stocks, resolve_stock, "
+    "get_strategy_match_days, list_strategies, backtest_strategy."
+    "Use resolve_stock to look up a ts_code from a stock name, code or pinyin initials instead of listing all stocks."
+    "get_stock_match_days accepts optional 'strategy' and 'strategy_params' (thresholds); "
+    "get_strategy_match_days runs several strategies on one stock in a single pass. Strategies: "
+    + "; ".join(f"{s['name']} {s['params']}: {s['description']}" for s in list_strategies()) + ".\n"
+    "backtest_strategy measures forward returns, hit rates and drawdowns of a strategy's signals; "
+    "'param_grid' maps threshold names to lists of values to sweep, 'horizons' are holding periods in bars, "
+    "'ts_codes' limits it to some stocks (omit for the whole market).\n"
+    "Examples:\n"
+    "- 'List all live stocks' → {function:'get_all_live_stocks', params:{}, reasoning:'User wants all listed stocks'}\n"
+    "- 'Get stock data for 600519.SH this month' → {function:'get_stock_data', params:{'ts_code':'600519.SH','start_date':'20250901','end_date':'20250930'}, reasoning:'User asked for historical data.'}\n"
+    "- 'Find strong uptrend stocks recently' → {function:'get_stock_match_days', params:{'start_date':'20240101','end_date':'20241010'}, reasoning:'User asked for trend-based analysis.'}\n"
+    "- 'Compare 600519.SH and 000858.SZ this month' → {calls:[{function:'get_stock_data', params:{'ts_code':'600519.SH','start_date':'20250901','end_date':'20250930'}}, {function:'get_stock_data', params:{'ts_code':'000858.SZ','start_date':'20250901','end_date':'20250930'}}], reasoning:'Two independent stock data lookups.'}\n"
+    "- '贵州茅台的代码是多少' → {function:'resolve_stock', params:{'query':'贵州茅台'}, reasoning:'User wants the ts_code of a stock name.'}\n"
+    "- '600519.SH 最近一年放量突破的日子，量比 2 倍' → {function:'get_stock_match_days', params:{'ts_code':'600519.SH','start_date':'20240101','end_date':'20241231','strategy':'volume_breakout','strategy_params':{'volume_ratio':2}}, reasoning:'User asked for a volume breakout with a custom threshold.'}\n"
+    "- '回测 match_policy 量比 2 到 4 倍在 2023 年的表现' → {function:'backtest_strategy', params:{'start_date':'20230101','end_date':'20231231','strategy':'match_policy','param_grid':{'volume_ratio':[2,3,4]},'horizons':[5,10,20]}, reasoning:'User wants a parameter sweep backtest.'}\n"
+)
+
+
+def parse_decision(response: str) -> dict:
+    """Parse the LLM plan, falling back to a default decision when it is not valid JSON."""
+    try:
+        return json.loads(response)
+    except json.JSONDecodeError:
+        return {
+            "function": "get_stock_match_days",
+            "params": {},
+            "reasoning": f"Failed to parse DeepSeek output, fallback used. Raw response: {response}"
+        }
+
+
+def decision_calls(decision: dict) -> list:
+    """Normalize a plan to a list of {function, params}: either a single call or a "calls" list."""
+    if isinstance(decision.get("calls"), list):
+        return [{"function": call.get("function"), "params": call.get("params") or {}}
+                for call in decision["calls"] if isinstance(call, dict)]
+    return [{"function": decision.get("function"), "params": decision.get("params", {})}]
+
+
+def run_sync(coroutine):
+    """
+    asyncio.run that also works in a thread already running an event loop (where asyncio.run raises):
+    the coroutine then runs on a fresh loop in a helper thread while this thread waits for it.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="run-sync") as runner:
+        return runner.submit(asyncio.run, coroutine).result()
+
+
+def _log_late_call(function: str, timed_out_at: float, future):
+    """Done callback of a tool call that already timed out: its result is dropped, but not silently."""
+    if future.cancelled():
+        logger.info("%s timed out before it started and was cancelled", function)
+    else:
+        logger.warning("%s finished %.1fs after it timed out, result dropped", function,
+                       time.monotonic() - timed_out_at)
+
+
+def call_key(call: dict) -> str:
+    """Identity of a tool call, used to run identical calls only once."""
+    return json.dumps(call, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def scan_job_progress(job: dict, elapsed: float) -> dict:
+    """Progress of a scan job in the shape the UI shows: {job_id, status, done, total, eta}."""
+    done, total = job["done"], job["total"]
+    return {"job_id": job["job_id"], "status": job["status"], "done": done, "total": total,
+            "eta": elapsed / done * (total - done) if done else None}
+
+
 class TushareAgent:
-    def __init__(self):
-        self.llm = DeepSeekClient()
+    """
+    :param job_queue: scan_jobs.JobQueue served by a running WorkerPool; market-wide match-day queries are
+                      submitted to it as jobs. Without one they run as a single batch call, like any other tool.
+    """
+
+    def __init__(self, job_queue=None):
+        self.job_queue = job_queue
+        self.llm = DeepSeekClient(cache=create_cache())
+        # Runs Tushare calls dispatched while the LLM is still streaming
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        # Runs the individual calls of a multi-call plan; separate from self.executor so an early
+        # dispatched plan waiting on its calls can never starve them of workers
+        self.tool_executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS)
+
+    def _messages(self, query: str) -> list:
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": query}
+        ]
 
     def interpret_query(self, query: str) -> dict:
         """
         Use DeepSeek to interpret user's query and output a structured plan.
         """
-        system_prompt = (
-            "You are a Tushare expert agent. "
-            "Given a user query about stock data or trading trends, "
-            "decide which Tushare function to call and what parameters to use. "
-            "Return a JSON object with fields: {function, params, reasoning}."
-            "Allowed functions: get_stock_match_days, get_stock_data, get_all_live_stocks."
-            "Examples:\n"
-            "- 'List all live stocks' → {function:'get_all_live_stocks', params:{}, reasoning:'User wants all listed stocks'}\n"
-            "- 'Get stock data for 600519.SH this month' → {function:'get_stock_data', params:{'ts_code':'600519.SH','start_date':'20250901','end_date':'20250930'}, reasoning:'User asked for historical data.'}\n"
-            "- 'Find strong uptrend stocks recently' → {function:'get_stock_match_days', params:{'start_date':'20240101','end_date':'20241010'}, reasoning:'User asked for trend-based analysis.'}\n"
-        )
-
-        response = self.llm.chat([
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": query}
-        ])
+        response = self.llm.chat(self._messages(query))
 
         # Try parsing JSON result
-        try:
-            decision = json.loads(response)
-        except json.JSONDecodeError:
-            decision = {
-                "function": "get_stock_match_days",
-                "params": {},
-                "reasoning": f"Failed to parse DeepSeek output, fallback used. Raw response: {response}"
-            }
+        return parse_decision(response)
 
-        return decision
+    async def ainterpret_query(self, query: str) -> dict:
+        """interpret_query for async callers, over DeepSeekClient.achat."""
+        return parse_decision(await self.llm.achat(self._messages(query)))
+
+    def interpret_query_stream(self, query: str):
+        """
+        Streaming variant of interpret_query. Yields ("plan", decision) as soon as function and params
+        (or the calls list) are complete, ("reasoning", text) while the reasoning streams, and ("final", decision) at the end.
+        """
+        parser = PlanStreamParser()
+        plan_sent = False
+        for chunk in self.llm.chat_stream(self._messages(query)):
+            parser.feed(chunk)
+            if not plan_sent and (parser.ready("function", "params") or parser.ready("calls")):
+                plan_sent = True
+                yield "plan", {key: parser.fields[key] for key in ("function", "params", "calls") if key in parser.fields}
+            if "reasoning" in parser.partial or "reasoning" in parser.fields:
+                yield "reasoning", parser.partial_string("reasoning")
+
+        if parser.complete:
+            decision = parser.fields
+        else:
+            # Not a plain JSON object (e.g. wrapped in prose): fall back to the full-text parse
+            decision = parse_decision(parser.buffer)
+        yield "final", decision
 
     def handle_query(self, query: str) -> dict:
         """
         Interpret query → route to correct Tushare function → return results.
         """
-        decision = self.interpret_query(query)
+        return self.execute_decision(self.interpret_query(query))
+
+    async def ahandle_query(self, query: str) -> dict:
+        """
+        handle_query for async callers (async Gradio handlers, LangGraph nodes): neither the LLM call nor
+        the tool calls block the event loop.
+        """
+        return await self.aexecute_decision(await self.ainterpret_query(query))
+
+    def handle_query_stream(self, query: str):
+        """
+        Same as handle_query, but streams: the LLM reasoning is yielded while it is generated, the
+        Tushare call starts as soon as function and params are parsed, and a market-wide scan
+        (get_stock_match_days without ts_code) runs as a scan job whose progress and partial results
+        are yielded until it ends.
+        """
+        future = None
+        decision = {}
+        for event, value in self.interpret_query_stream(query):
+            if event == "plan" and not self._is_market_scan(value):
+                # Overlap the data fetch with the rest of the LLM generation
+                future = self.executor.submit(self.execute_decision, value)
+            elif event == "reasoning":
+                yield {"function_called": None, "params_used": {}, "reasoning": value, "result": None}
+            elif event == "final":
+                decision = value
+
+        if not self._is_market_scan(decision):
+            if future is None:
+                result = self.execute_decision(decision)
+            else:
+                result = dict(future.result(), reasoning=decision.get("reasoning", ""))
+            yield result
+            return
+        yield from self._stream_scan_job(decision)
+
+    def _stream_scan_job(self, decision: dict):
+        """Answer a market-wide match-day query from the signal index, or submit it as a scan job and poll it."""
         func_name = decision.get("function")
         params = decision.get("params", {})
-        reasoning = decision.get("reasoning", "")
-        print("get choice")
+        base = {"function_called": func_name, "params_used": params, "reasoning": decision.get("reasoning", "")}
+        try:
+            indexed = get_indexed_match_days(**params)
+            if indexed is not None:
+                # The signal index already covers this range: answer from it instead of scanning
+                yield dict(base, result=[{"ts_code": ts_code, "match_days": days} for ts_code, days in indexed.items()])
+                return
+            job_id = self.job_queue.submit(default_scan_params(
+                params.get("start_date"), params.get("end_date"), params.get("freq", "D"), AGENT_SCAN_MODE,
+                params.get("strategy"), params.get("strategy_params"), params.get("ma")))
+        except Exception as e:
+            yield dict(base, result=f"❌ Error while executing {func_name}: {e}")
+            return
+
+        # The job keeps running in the workers if the client goes away; it stays visible in the scan jobs tab
+        t_start = time.time()
+        last = None
+        while True:
+            job = self.job_queue.get(job_id)
+            if (job["status"], job["done"]) != last:
+                last = job["status"], job["done"]
+                yield dict(base, progress=scan_job_progress(job, time.time() - t_start),
+                           result=self.job_queue.results(job_id))
+            if job["status"] in FINISHED:
+                break
+            time.sleep(JOB_POLL_INTERVAL)
+        if job["status"] != "done":
+            yield dict(base, progress=scan_job_progress(job, time.time() - t_start),
+                       result=f"❌ Scan job {job_id} {job['status']}" + (f": {job['error']}" if job["error"] else ""))
+
+    def _is_market_scan(self, decision: dict) -> bool:
+        return (self.job_queue is not None and decision.get("function") == "get_stock_match_days"
+                and not decision.get("params", {}).get("ts_code"))
+
+    def _run_call(self, func_name: str, params: dict):
+        """Run one whitelisted Tushare function; failures come back as an error string."""
         if func_name not in SAFE_FUNCTIONS:
-            return {
-                "error": f"Unsafe or unknown function '{func_name}'",
+            return f"❌ Unsafe or unknown function '{func_name}'"
+        try:
+            logger.info("invoke %s %s", func_name, params)
+            with span("tool_call", function=func_name):
+                return SAFE_FUNCTIONS[func_name](**params)
+        except Exception as e:
+            return f"❌ Error while executing {func_name}: {e}"
+
+    async def execute_calls(self, calls: list, timeout: float = TOOL_TIMEOUT) -> list:
+        """
+        Run independent tool calls concurrently with asyncio.gather. Identical calls run once, and a
+        call that exceeds the timeout reports an error; its worker thread cannot be interrupted, so it is
+        counted and logged when it finally completes.
+        :return: one {function, params, result} per distinct call, in plan order
+        """
+        unique = {}
+        for call in calls:
+            unique.setdefault(call_key(call), call)
+        if len(unique) < len(calls):
+            logger.info("dropped %d duplicate tool calls", len(calls) - len(unique))
+
+        async def run(call):
+            future = self.tool_executor.submit(self._run_call, call["function"], call["params"])
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            except asyncio.TimeoutError:
+                registry.inc("tool_call_timeouts_total", function=call["function"],
+                             help="Tool calls of multi-call plans that hit TOOL_TIMEOUT")
+                future.add_done_callback(partial(_log_late_call, call["function"], time.monotonic()))
+                return f"❌ {call['function']} timed out after {timeout:g}s"
+
+        results = await asyncio.gather(*(run(call) for call in unique.values()))
+        return [{"function": call["function"], "params": call["params"], "result": result}
+                for call, result in zip(unique.values(), results)]
+
+    def execute_decision(self, decision: dict) -> dict:
+        """
+        Run the Tushare function(s) chosen by interpret_query. A plan with several calls runs them in
+        parallel and returns their results as a list.
+        Also works from a thread that is running an event loop, by blocking it; async callers (async
+        Gradio handlers, LangGraph nodes) should await aexecute_decision instead.
+        """
+        calls, rejected = self._check_plan(decision)
+        if rejected is not None:
+            return rejected
+        if len(calls) > 1:
+            return self._merged_response(decision, run_sync(self.execute_calls(calls)))
+        return self._single_response(decision, self._run_call(calls[0]["function"], calls[0]["params"]))
+
+    async def aexecute_decision(self, decision: dict) -> dict:
+        """execute_decision for async callers: tool calls run in the tool executor without blocking the loop."""
+        calls, rejected = self._check_plan(decision)
+        if rejected is not None:
+            return rejected
+        if len(calls) > 1:
+            return self._merged_response(decision, await self.execute_calls(calls))
+        result = await asyncio.get_running_loop().run_in_executor(
+            self.tool_executor, self._run_call, calls[0]["function"], calls[0]["params"])
+        return self._single_response(decision, result)
+
+    @staticmethod
+    def _check_plan(decision: dict) -> tuple:
+        """(calls, None) for a runnable plan, or (None, error response)."""
+        reasoning = decision.get("reasoning", "")
+        calls = decision_calls(decision)
+        if not calls:
+            return None, {"error": "The plan contains no tool calls", "reasoning": reasoning}
+        if len(calls) == 1 and calls[0]["function"] not in SAFE_FUNCTIONS:
+            return None, {
+                "error": f"Unsafe or unknown function '{calls[0]['function']}'",
                 "reasoning": reasoning
             }
+        return calls, None
 
-        try:
-            print("=== invoke:", func_name)
-            result = SAFE_FUNCTIONS[func_name](**params)
-            print("=== result", result)
-        except Exception as e:
-            result = f"❌ Error while executing {func_name}: {e}"
+    @staticmethod
+    def _merged_response(decision: dict, merged: list) -> dict:
+        return {
+            "function_called": [item["function"] for item in merged],
+            "params_used": [item["params"] for item in merged],
+            "reasoning": decision.get("reasoning", ""),
+            "result": merged
+        }
 
+    @staticmethod
+    def _single_response(decision: dict, result) -> dict:
+        call = decision_calls(decision)[0]
         return {
-            "function_called": func_name,
-            "params_used": params,
-            "reasoning": reasoning,
+            "function_called": call["function"],
+            "params_used": call["params"],
+            "reasoning": decision.get("reasoning", ""),
             "result": result
         }
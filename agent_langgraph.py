@@ -1,24 +1,32 @@
 # agent_langgraph.py
 from langchain.agents import Tool, AgentExecutor, create_openai_functions_agent
 from langchain.chat_models import ChatOpenAI
+from result_shaping import dumps, get_result_page, shape_for_llm
 from tushare_tools import get_stock_data, get_stock_match_days, get_all_live_stocks
 
 # 1️⃣ 定义工具（Tools）
+# 工具结果按 token 预算压缩后再交给模型（摘要 + 最近若干行，列式编码），
+# 被截断的完整结果可以通过 GetResultPage 按 handle 分页读取
 tools = [
     Tool(
         name="GetStockData",
-        func=lambda ts_code, start_date, end_date: get_stock_data(ts_code, start_date, end_date).to_dict(orient="records"),
+        func=lambda ts_code, start_date, end_date: shape_for_llm(get_stock_data(ts_code, start_date, end_date)),
         description="Get historical stock data for a given stock code between start_date and end_date. Arguments: ts_code, start_date, end_date"
     ),
     Tool(
         name="GetStockMatchDays",
-        func=lambda start_date, end_date: get_stock_match_days(start_date=start_date, end_date=end_date),
+        func=lambda start_date, end_date: shape_for_llm(get_stock_match_days(ts_code=None, start_date=start_date, end_date=end_date)),
         description="Get stocks with strong uptrend based on predefined strategy. Arguments: start_date, end_date"
     ),
     Tool(
         name="GetAllLiveStocks",
-        func=lambda: [s.__dict__ for s in get_all_live_stocks()],
+        func=lambda: shape_for_llm(get_all_live_stocks()),
         description="List all currently listed stocks. No arguments required."
+    ),
+    Tool(
+        name="GetResultPage",
+        func=lambda handle, offset=0, limit=50: dumps(get_result_page(handle, int(offset), int(limit))),
+        description="Read more rows of a truncated tool result. Arguments: handle, offset, limit"
     )
 ]
 
@@ -1,26 +1,81 @@
-from dotenv import load_dotenv
+import time
+T_START = time.perf_counter()
+import logging
 import os
+from threading import Lock, Thread
 # 加载环境变量
 from dotenv import load_dotenv
 load_dotenv()
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
 import gradio as gr
-from agent import TushareAgent
+from metrics import METRICS_PORT, logger, start_metrics_server
+
+# 启动后在后台预热的内容，逗号分隔：agent（导入 tushare 并创建 TushareAgent）、symbols（股票代码表）、
+# llm（建立到 DeepSeek 的连接）；默认不预热，第一次使用时再创建
+PREWARM = os.environ.get("PREWARM", "")
+
+# TushareAgent 在第一次提问时才创建，启动时不导入 agent / tushare_tools / tushare
+_agent = None
+_agent_lock = Lock()
+# 全市场扫描任务队列在第一次使用或启动界面时才创建（打开 SQLite），导入 app 时不创建
+_job_queue = None
+_job_queue_lock = Lock()
 
+def get_job_queue():
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            from scan_jobs import JobQueue
+            _job_queue = JobQueue()
+    return _job_queue
 
+def get_agent():
+    global _agent
+    with _agent_lock:
+        if _agent is None:
+            from agent import TushareAgent
+            # 全市场扫描提交到任务队列，由后台 worker 执行
+            _agent = TushareAgent(job_queue=get_job_queue())
+    return _agent
 
-# 创建 TushareAgent 实例
-agent = TushareAgent()
+def prewarm(targets):
+    for target in targets:
+        t_start = time.perf_counter()
+        try:
+            if target == "agent":
+                get_agent()
+            elif target == "symbols":
+                from tushare_tools import get_all_live_stocks
+                get_all_live_stocks()
+            elif target == "llm":
+                llm = get_agent().llm
+                llm.session.head(llm.url, timeout=5)
+            else:
+                logger.warning("unknown prewarm target %s", target)
+                continue
+        except Exception as e:
+            logger.warning("prewarm %s failed: %s", target, e)
+            continue
+        logger.info("prewarmed %s in %.2fs", target, time.perf_counter() - t_start)
+
+def format_progress(progress: dict) -> str:
+    if not progress:
+        return ""
+    text = f"Job {progress['job_id']} {progress['status']}: scanned {progress['done']}/{progress['total']} stocks"
+    return text + (f", ETA {progress['eta']:.0f}s" if progress['eta'] is not None else "")
 
 def run_agent(query):
     try:
-        # 调用 Agent 执行查询
-        res = agent.handle_query(query)
-        # 返回 reasoning 和 result
-        return res["reasoning"], res["result"]
+        # 调用 Agent 执行查询，全市场扫描时逐步返回进度和已匹配的股票
+        for res in get_agent().handle_query_stream(query):
+            progress = format_progress(res.get("progress"))
+            reasoning = f"{res['reasoning']}\n\n{progress}" if progress else res["reasoning"]
+            # 返回 reasoning 和 result
+            yield reasoning, res.get("result", res.get("error"))
 
     except Exception as e:
         # 捕获所有异常并在 Gradio 页面显示错误信息
-        return f"An error occurred: {str(e)}", {}
+        yield f"An error occurred: {str(e)}", {}
 
 # 定义 Gradio 界面
 iface = gr.Interface(
@@ -44,6 +99,71 @@ iface = gr.Interface(
     """
 )
 
+def strategy_choices():
+    # 策略列表在页面加载时才读取，启动时不导入 strategies（numpy / pandas）
+    from strategies import STRATEGIES
+    return gr.update(choices=list(STRATEGIES))
+
+def submit_scan(start_date, end_date, freq, mode, strategy):
+    from scan_jobs import default_scan_params, format_job
+    job_queue = get_job_queue()
+    # 只提交任务，不在请求线程里扫描；界面通过定时轮询展示进度
+    job_id = job_queue.submit(default_scan_params(start_date or None, end_date or None, freq, mode, strategy))
+    return job_id, format_job(job_queue.get(job_id)), []
+
+def poll_scan(job_id):
+    if not job_id:
+        return "", []
+    from scan_jobs import format_job
+    job_queue = get_job_queue()
+    job = job_queue.get(job_id)
+    # 运行中也返回已写入的部分结果
+    return format_job(job), job_queue.results(job_id) if job else []
+
+def cancel_scan(job_id):
+    if job_id:
+        get_job_queue().cancel(job_id)
+    return poll_scan(job_id)
+
+def list_scans():
+    return [[job['job_id'], job['status'], f"{job['done']}/{job['total']}", job['matched'], job['created_at']]
+            for job in get_job_queue().list_jobs()]
+
+with gr.Blocks() as scan_ui:
+    gr.Markdown("Market-wide scans run as background jobs; progress and partial results refresh every few seconds.")
+    with gr.Row():
+        start_input = gr.Textbox(label="Start date (YYYYMMDD)", placeholder="default: two years ago")
+        end_input = gr.Textbox(label="End date (YYYYMMDD)", placeholder="default: today")
+        freq_input = gr.Dropdown(["D", "W", "M"], value="D", label="Frequency")
+        mode_input = gr.Dropdown(["per_stock", "batch", "parallel"], value="batch", label="Mode")
+        strategy_input = gr.Dropdown(["match_policy"], value="match_policy", label="Strategy")
+    with gr.Row():
+        submit_button = gr.Button("Submit scan", variant="primary")
+        cancel_button = gr.Button("Cancel")
+    job_id_box = gr.Textbox(label="Job ID (paste an earlier ID to follow it)")
+    status_box = gr.Textbox(label="Status")
+    results_box = gr.JSON(label="Matched Stocks")
+    jobs_table = gr.Dataframe(headers=["job_id", "status", "progress", "matched", "created_at"], label="Recent jobs")
+
+    submit_button.click(submit_scan, [start_input, end_input, freq_input, mode_input, strategy_input],
+                        [job_id_box, status_box, results_box])
+    cancel_button.click(cancel_scan, job_id_box, [status_box, results_box])
+    timer = gr.Timer(2)
+    timer.tick(poll_scan, job_id_box, [status_box, results_box])
+    timer.tick(list_scans, None, jobs_table)
+    scan_ui.load(strategy_choices, None, strategy_input)
+
+demo = gr.TabbedInterface([iface, scan_ui], ["Ask the agent", "Market scan jobs"])
+
 if __name__ == '__main__':
+    # 在 Gradio 旁边暴露 Prometheus 指标：http://localhost:9100/metrics
+    start_metrics_server(METRICS_PORT)
+    # 后台执行扫描任务，上次中断的任务从断点继续
+    from scan_jobs import WorkerPool
+    WorkerPool(get_job_queue()).start()
+    if PREWARM:
+        Thread(target=prewarm, args=([target.strip() for target in PREWARM.split(",") if target.strip()],),
+               daemon=True).start()
+    logger.info("startup took %.2fs", time.perf_counter() - T_START)
     # 启动 Gradio 界面
-    iface.launch(server_name="0.0.0.0", server_port=7860, debug=True)
+    demo.launch(server_name="0.0.0.0", server_port=7860, debug=True)
@@ -0,0 +1,133 @@
+import asyncio
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import Lock
+from typing import Callable, Dict, List
+
+from metrics import logger, registry, span
+from result_shaping import dumps, get_result_page, shape_for_llm
+
+# 异步工具层：tushare_tools 的函数都是同步阻塞的，这里把它们放到有界线程池中执行，
+# 每个工具单独限制并发数并设置超时，LangGraph 的异步节点可以用 asyncio.gather 并行调用而不阻塞事件循环
+# 线程池大小由 ASYNC_TOOL_WORKERS 控制，超时由 TOOL_TIMEOUT 控制（与 agent.py 相同）
+
+ASYNC_TOOL_WORKERS = int(os.environ.get("ASYNC_TOOL_WORKERS", "8"))
+TOOL_TIMEOUT = float(os.environ.get("TOOL_TIMEOUT", "120"))
+
+# 每个工具同时在执行的调用数上限；全市场列表只需要一次请求，多个调用排队后会命中缓存
+TOOL_CONCURRENCY = {
+    'get_stock_data': 4,
+    'get_stock_match_days': 4,
+    'get_all_live_stocks': 1,
+}
+
+_executor = None
+_executor_lock = Lock()
+# asyncio.Semaphore 绑定到首次使用它的事件循环，按事件循环分别创建
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=ASYNC_TOOL_WORKERS, thread_name_prefix="tool")
+    return _executor
+
+
+def _semaphore(name: str) -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphores = _semaphores.setdefault(loop, {})
+    if name not in semaphores:
+        semaphores[name] = asyncio.Semaphore(TOOL_CONCURRENCY.get(name, ASYNC_TOOL_WORKERS))
+    return semaphores[name]
+
+
+def _release(loop: asyncio.AbstractEventLoop, semaphore: asyncio.Semaphore):
+    """ 线程结束时归还名额；事件循环已关闭时名额随循环一起丢弃 """
+    try:
+        loop.call_soon_threadsafe(semaphore.release)
+    except RuntimeError:
+        pass
+
+
+async def run_tool(name: str, func: Callable, *args, timeout: float = TOOL_TIMEOUT, **kwargs):
+    """
+    在线程池中执行同步函数，受该工具的并发上限约束
+    超时会抛出 asyncio.TimeoutError；已在执行的线程不会被中断，它继续占用该工具的名额，
+    直到线程结束（结果被丢弃），所以同一工具在途的线程数不会超过上限
+    """
+    semaphore = _semaphore(name)
+    await semaphore.acquire()
+    loop = asyncio.get_running_loop()
+    try:
+        future = get_executor().submit(partial(func, *args, **kwargs))
+    except BaseException:
+        semaphore.release()
+        raise
+    future.add_done_callback(lambda _: _release(loop, semaphore))
+    try:
+        with span("async_tool", tool=name):
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except asyncio.TimeoutError:
+        registry.inc("async_tool_timeouts_total", tool=name, help="Async tool calls that hit TOOL_TIMEOUT")
+        logger.warning("%s timed out after %gs", name, timeout)
+        raise
+
+
+async def aget_stock_data(ts_code: str, start_date: str, end_date: str, freq: str = 'D', timeout: float = TOOL_TIMEOUT):
+    from tushare_tools import get_stock_data
+    return await run_tool('get_stock_data', get_stock_data, ts_code, start_date, end_date, freq, timeout=timeout)
+
+
+async def aget_stock_match_days(ts_code: str, start_date: str, end_date: str, freq: str = 'D',
+                                strategy: str = 'match_policy', strategy_params: dict = None,
+                                timeout: float = TOOL_TIMEOUT) -> list:
+    from tushare_tools import get_stock_match_days
+    return await run_tool('get_stock_match_days', get_stock_match_days, ts_code, start_date, end_date, freq,
+                          strategy=strategy, strategy_params=strategy_params, timeout=timeout)
+
+
+async def aget_all_live_stocks(timeout: float = TOOL_TIMEOUT) -> list:
+    from tushare_tools import get_all_live_stocks
+    return await run_tool('get_all_live_stocks', get_all_live_stocks, timeout=timeout)
+
+
+# --- LangChain 工具：结果按 token 预算压缩成字符串（result_shaping），供 LangGraph 节点和模型使用 ---
+
+async def _stock_data_tool(ts_code: str, start_date: str, end_date: str, freq: str = 'D') -> str:
+    return shape_for_llm(await aget_stock_data(ts_code, start_date, end_date, freq))
+
+
+async def _match_days_tool(ts_code: str, start_date: str, end_date: str, freq: str = 'D',
+                           strategy: str = 'match_policy') -> str:
+    return shape_for_llm(await aget_stock_match_days(ts_code, start_date, end_date, freq, strategy))
+
+
+async def _live_stocks_tool() -> str:
+    return shape_for_llm(await aget_all_live_stocks())
+
+
+async def _result_page_tool(handle: str, offset: int = 0, limit: int = 50) -> str:
+    return dumps(get_result_page(handle, offset, limit))
+
+
+TOOL_SPECS: Dict[str, tuple] = {
+    'get_stock_data': (_stock_data_tool, "获取单只股票在 [start_date, end_date] 的日线行情和均线，"
+                                         "日期格式 YYYYMMDD，例如 ts_code='600519.SH'"),
+    'get_stock_match_days': (_match_days_tool, "返回单只股票在区间内满足策略的交易日列表，"
+                                               "strategy 默认为 match_policy"),
+    'get_all_live_stocks': (_live_stocks_tool, "列出当前上市的全部股票（代码和名称），无需参数"),
+    'get_result_page': (_result_page_tool, "按 handle 分页读取被截断的工具结果，offset 为起始行，limit 为行数"),
+}
+
+
+def langchain_tools() -> List:
+    """ 构造 LangChain 异步工具（延迟导入 langchain，只在 LangGraph 脚本中需要） """
+    from langchain_core.tools import StructuredTool
+
+    return [StructuredTool.from_function(coroutine=coroutine, name=name, description=description)
+            for name, (coroutine, description) in TOOL_SPECS.items()]
@@ -0,0 +1,207 @@
+import itertools
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from metrics import span
+from strategies import build_strategy, evaluate_strategies
+from strategy_engine import DEFAULT_MA, put_mask, take_bars, trading_order
+
+# 向量化回测：在 (日期 × 股票) 面板上整列计算信号之后 N 根 K 线的收益、胜率、持有期回撤和等权净值曲线
+# 参数网格中的所有组合共用同一份面板和派生列，一次求出 (组合 × 日期 × 股票) 的信号掩码
+# 默认 entry_lag=1：策略需要后一根 K 线确认，信号日之后一根 K 线的收盘价才能入场，避免未来函数
+
+DEFAULT_HORIZONS = [5, 10, 20]
+
+
+def _shifted(close: np.ndarray, lag: int) -> np.ndarray:
+    """ 位置 t 为 close[t + lag]，越界为 NaN """
+    result = np.full(close.shape, np.nan)
+    if lag < len(close):
+        result[:len(close) - lag] = close[lag:]
+    return result
+
+
+def _put_values(values: np.ndarray, order) -> np.ndarray:
+    """ 把紧凑序列上的 (len(horizons), 日期, 股票) 结果逐个持有期放回原来的日期位置 """
+    if order is None:
+        return values
+    return np.stack([put_mask(value, order) for value in values])
+
+
+def forward_returns(close: np.ndarray, horizons: List[int], entry_lag: int = 1) -> np.ndarray:
+    """
+    按每只股票自己的交易日序列计算（strategy_engine.trading_order），停牌日不占用入场延迟和持有期
+    :param close: (日期 × 股票) 收盘价，停牌日为 NaN
+    :return: (len(horizons), 日期, 股票)，信号之后第 lag 根 K 线入场、再持有 h 根 K 线的收益，持有期没有走完为 NaN
+    """
+    close = np.asarray(close, dtype=float)
+    order = trading_order(close)
+    bars = take_bars(close, order)
+    entry = _shifted(bars, entry_lag)
+    result = np.empty((len(horizons),) + close.shape)
+    for i, horizon in enumerate(horizons):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result[i] = _shifted(bars, entry_lag + horizon) / entry - 1
+    return _put_values(result, order)
+
+
+def max_adverse_excursion(close: np.ndarray, horizons: List[int], entry_lag: int = 1) -> np.ndarray:
+    """
+    持有期内相对入场价的最大回撤（<= 0），形状同 forward_returns，同样按每只股票的交易日序列计算
+    按持有 K 线数逐步取最小值，每一步都是整面板运算
+    """
+    close = np.asarray(close, dtype=float)
+    order = trading_order(close)
+    bars = take_bars(close, order)
+    result = np.empty((len(horizons),) + close.shape)
+    worst = np.zeros(close.shape)
+    entry = _shifted(bars, entry_lag)
+    for step in range(1, max(horizons) + 1):
+        price = _shifted(bars, entry_lag + step)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            worst = np.fmin(worst, price / entry - 1)
+        for i, horizon in enumerate(horizons):
+            if horizon == step:
+                # 紧凑序列中 NaN 只出现在末尾：出场 K 线存在时整个持有期都有 K 线，否则持有期没有走完
+                result[i] = np.where(np.isfinite(price) & np.isfinite(entry), worst, np.nan)
+    return _put_values(result, order)
+
+
+def holding_weights(entries: np.ndarray, horizon: int) -> np.ndarray:
+    """
+    :param entries: (..., 日期, 股票) 入场掩码
+    :return: 同形状的持仓数，位置 t 为在 [t - horizon, t - 1] 入场、因而承担第 t 天收益的仓位数
+    """
+    total = np.cumsum(entries, axis=-2, dtype=np.int32)
+    padded = np.concatenate([np.zeros_like(total[..., :1, :]), total], axis=-2)
+    count = entries.shape[-2]
+    t = np.arange(count)
+    return padded[..., t, :] - padded[..., np.maximum(t - horizon, 0), :]
+
+
+def max_drawdown(equity: np.ndarray) -> np.ndarray:
+    """ 沿最后一维计算净值曲线的最大回撤（<= 0） """
+    return np.min(equity / np.maximum.accumulate(equity, axis=-1) - 1, axis=-1)
+
+
+def equity_curves(signals: np.ndarray, close: np.ndarray, horizons: List[int], entry_lag: int = 1) -> np.ndarray:
+    """
+    每个信号在 entry_lag 根 K 线后按收盘价等权买入，持有 horizon 根 K 线
+    :param signals: (组合, 日期, 股票) 信号掩码
+    :return: (组合, len(horizons), 日期) 的净值曲线，空仓的日子收益为 0
+    """
+    close = np.asarray(close, dtype=float)
+    # 日收益相对于该股票上一根 K 线的收盘价，停牌前后的涨跌计入复牌当天
+    order = trading_order(close)
+    bars = take_bars(close, order)
+    daily = np.full(close.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        daily[1:] = bars[1:] / bars[:-1] - 1
+    daily = put_mask(daily, order)
+    valid = np.isfinite(daily)
+    daily = np.where(valid, daily, 0.0)
+
+    entries = np.zeros(signals.shape, dtype=bool)
+    entries[:, entry_lag:] = signals[:, :signals.shape[1] - entry_lag]
+    curves = np.ones((signals.shape[0], len(horizons), signals.shape[1]))
+    for i, horizon in enumerate(horizons):
+        weights = holding_weights(entries, horizon) * valid
+        invested = weights.sum(axis=-1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.where(invested > 0, (weights * daily).sum(axis=-1) / invested, 0.0)
+        curves[:, i] = np.cumprod(1 + returns, axis=-1)
+    return curves
+
+
+def backtest_signals(signals: np.ndarray, close: np.ndarray, horizons: List[int] = DEFAULT_HORIZONS,
+                     entry_lag: int = 1) -> Dict[str, np.ndarray]:
+    """
+    :param signals: (组合, 日期, 股票) 信号掩码
+    :return: {指标名: (组合, len(horizons)) 数组} 以及 equity: (组合, len(horizons), 日期)
+    """
+    returns = forward_returns(close, horizons, entry_lag)
+    adverse = max_adverse_excursion(close, horizons, entry_lag)
+    shape = (signals.shape[0], len(horizons))
+    stats = {name: np.full(shape, np.nan) for name in
+             ('mean_return', 'median_return', 'hit_rate', 'avg_drawdown', 'worst_drawdown')}
+    stats['signals'] = np.zeros(shape, dtype=int)
+    for i in range(len(horizons)):
+        # 只统计持有期已经走完的信号
+        valid = signals & np.isfinite(returns[i])
+        count = valid.sum(axis=(1, 2))
+        stats['signals'][:, i] = count
+        masked = np.where(valid, returns[i], np.nan)
+        drawdowns = np.where(valid, adverse[i], np.nan)
+        has = count > 0
+        with np.errstate(invalid='ignore'):
+            stats['mean_return'][has, i] = np.nanmean(masked[has], axis=(1, 2))
+            stats['median_return'][has, i] = np.nanmedian(masked[has].reshape(has.sum(), -1), axis=1)
+            stats['hit_rate'][has, i] = (masked[has] > 0).sum(axis=(1, 2)) / count[has]
+            stats['avg_drawdown'][has, i] = np.nanmean(drawdowns[has], axis=(1, 2))
+            stats['worst_drawdown'][has, i] = np.nanmin(drawdowns[has], axis=(1, 2))
+    equity = equity_curves(signals, close, horizons, entry_lag)
+    stats['total_return'] = equity[..., -1] - 1
+    stats['max_drawdown'] = max_drawdown(equity)
+    stats['equity'] = equity
+    return stats
+
+
+def expand_grid(grid: Dict[str, list] = None) -> List[dict]:
+    """ {参数: 取值列表} 展开为参数组合列表，空网格只有一个默认组合 """
+    if not grid:
+        return [{}]
+    names = list(grid)
+    values = [value if isinstance(value, (list, tuple)) else [value] for value in grid.values()]
+    return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+
+def run_sweep(panel: Dict[str, pd.DataFrame], strategy: str = 'match_policy', grid: Dict[str, list] = None,
+              horizons: List[int] = DEFAULT_HORIZONS, start_date: str = None, end_date: str = None,
+              ma: list = DEFAULT_MA, entry_lag: int = 1, with_equity: bool = False) -> pd.DataFrame:
+    """
+    对参数网格中的每个组合回测同一策略
+    :param panel: 包含 open/close/pre_close/vol/ma* 的 (日期 × 股票) 面板，结束日应晚于 end_date 以便计算收益
+    :param start_date, end_date: 只统计该区间内的信号
+    :return: 每个 (参数组合, 持有期) 一行
+    """
+    arrays = {name: frame.to_numpy() for name, frame in panel.items()}
+    return run_sweep_arrays(arrays, panel['close'].index.to_numpy(), strategy, grid, horizons, start_date, end_date,
+                            ma, entry_lag, with_equity)
+
+
+def run_sweep_arrays(arrays: Dict[str, np.ndarray], dates: np.ndarray, strategy: str = 'match_policy',
+                     grid: Dict[str, list] = None, horizons: List[int] = DEFAULT_HORIZONS, start_date: str = None,
+                     end_date: str = None, ma: list = DEFAULT_MA, entry_lag: int = 1,
+                     with_equity: bool = False) -> pd.DataFrame:
+    """
+    run_sweep 的数组版本，可以直接传入 panel_store.PanelStore.view() 的 memmap 视图
+    :param arrays: {字段: (日期 × 股票) 数组}
+    :param dates: 与数组第 0 维对应的日期
+    """
+    combos = expand_grid(grid)
+    dates = np.asarray(dates)
+    in_range = np.ones(len(dates), dtype=bool)
+    if start_date:
+        in_range &= dates >= start_date
+    if end_date:
+        in_range &= dates <= end_date
+
+    with span("backtest", strategy=strategy):
+        rules = {str(i): build_strategy(strategy, params) for i, params in enumerate(combos)}
+        masks = evaluate_strategies(arrays, rules, ma)
+        signals = np.stack([masks[str(i)] for i in range(len(combos))]) & in_range[None, :, None]
+        stats = backtest_signals(signals, arrays['close'], horizons, entry_lag)
+
+    rows = []
+    for c, params in enumerate(combos):
+        for h, horizon in enumerate(horizons):
+            row = {'strategy': strategy, 'params': params, 'horizon': horizon}
+            for name, values in stats.items():
+                if name != 'equity':
+                    row[name] = values[c, h].item()
+            if with_equity:
+                row['equity'] = dict(zip(dates.tolist(), np.round(stats['equity'][c, h], 4).tolist()))
+            rows.append(row)
+    return pd.DataFrame(rows)
@@ -0,0 +1,155 @@
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Callable, Optional
+
+import pandas as pd
+
+from indicators import add_moving_averages
+from metrics import span
+
+# 本地 K 线缓存：按 (ts_code, freq, adj) 存储原始 OHLCV，均线由本地收盘价重新计算
+BAR_STORE_PATH = os.environ.get("TUSHARE_BAR_STORE", "data/bars.sqlite")
+
+BAR_FIELDS = ['open', 'high', 'low', 'close', 'pre_close', 'change', 'pct_chg', 'vol', 'amount']
+
+# 每根 K 线对应的自然日数，用于估算均线需要的回看区间
+_CALENDAR_DAYS_PER_BAR = {'D': 1.6, 'W': 7.5, 'M': 31}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bars (
+    ts_code TEXT NOT NULL,
+    freq TEXT NOT NULL,
+    adj TEXT NOT NULL,
+    trade_date TEXT NOT NULL,
+    open REAL, high REAL, low REAL, close REAL, pre_close REAL,
+    change REAL, pct_chg REAL, vol REAL, amount REAL,
+    PRIMARY KEY (ts_code, freq, adj, trade_date)
+);
+CREATE TABLE IF NOT EXISTS coverage (
+    ts_code TEXT NOT NULL,
+    freq TEXT NOT NULL,
+    adj TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    PRIMARY KEY (ts_code, freq, adj)
+);
+"""
+
+
+def shift_date(date: str, days: int) -> str:
+    """ 将 YYYYMMDD 格式的日期平移若干自然日 """
+    return (datetime.strptime(date, '%Y%m%d') + timedelta(days=days)).strftime('%Y%m%d')
+
+
+def lookback_start(start_date: str, freq: str = 'D', ma: list = None) -> str:
+    """ 计算最长均线所需的回看起始日期，保证 start_date 当天的均线完整 """
+    if not ma:
+        return start_date
+    days = int(max(ma) * _CALENDAR_DAYS_PER_BAR.get(freq, 1.6)) + 15
+    return shift_date(start_date, -days)
+
+
+def lookahead_end(end_date: str, freq: str = 'D', bars: int = 0) -> str:
+    """ 计算 end_date 之后再取 bars 根 K 线所需的结束日期（不超过今天），用于计算信号之后的收益 """
+    if not bars:
+        return end_date
+    days = int(bars * _CALENDAR_DAYS_PER_BAR.get(freq, 1.6)) + 15
+    return min(shift_date(end_date, days), datetime.now().strftime('%Y%m%d'))
+
+
+class BarStore:
+    """
+    SQLite 实现的 K 线缓存
+    读取时只向 fetcher 补拉缓存区间之外的数据，当天的 K 线每次都会重新拉取（可能尚未收盘）
+    """
+
+    def __init__(self, path: str = BAR_STORE_PATH,
+                 fetcher: Callable[[str, str, str, str, Optional[str]], pd.DataFrame] = None):
+        self.path = path
+        self.fetcher = fetcher
+        self._lock = Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.executescript(_SCHEMA)
+
+    def get_bars(self, ts_code: str, start_date: str, end_date: str, freq: str = 'D',
+                 adj: Optional[str] = None, ma: list = None) -> pd.DataFrame:
+        """
+        返回 [start_date, end_date] 区间的 K 线，格式与 pro_bar 一致（按日期倒序，含 ma{n} / ma_v_{n} 列）
+        """
+        fetch_start = lookback_start(start_date, freq, ma)
+        self._top_up(ts_code, fetch_start, end_date, freq, adj)
+
+        with span("frame_build", source="bar_store"):
+            df = self._read(ts_code, fetch_start, end_date, freq, adj)
+            if ma:
+                df = add_moving_averages(df, ma)
+            df = df[df['trade_date'] >= start_date]
+            return df.iloc[::-1].reset_index(drop=True)
+
+    def invalidate(self, ts_code: str, freq: str = 'D', adj: Optional[str] = None):
+        """ 删除某个 key 的缓存，例如前复权数据在除权除息后需要整体重新拉取 """
+        key = (ts_code, freq, adj or '')
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM bars WHERE ts_code=? AND freq=? AND adj=?", key)
+            self._conn.execute("DELETE FROM coverage WHERE ts_code=? AND freq=? AND adj=?", key)
+
+    def clear(self):
+        """ 清空全部缓存 """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM bars")
+            self._conn.execute("DELETE FROM coverage")
+
+    def _top_up(self, ts_code, start_date, end_date, freq, adj):
+        """ 只拉取缓存区间两端缺失的部分 """
+        coverage = self._coverage(ts_code, freq, adj)
+        if coverage is None:
+            self._fetch_and_save(ts_code, start_date, end_date, freq, adj)
+            return
+        cached_start, cached_end = coverage
+        if start_date < cached_start:
+            self._fetch_and_save(ts_code, start_date, shift_date(cached_start, -1), freq, adj)
+        if end_date > cached_end:
+            self._fetch_and_save(ts_code, shift_date(cached_end, 1), end_date, freq, adj)
+
+    def _fetch_and_save(self, ts_code, start_date, end_date, freq, adj):
+        df = self.fetcher(ts_code, start_date, end_date, freq, adj)
+        # 当天可能尚未收盘，不计入已缓存区间，下次读取时会再次拉取
+        today = datetime.now().strftime('%Y%m%d')
+        covered_end = min(end_date, shift_date(today, -1))
+
+        key = (ts_code, freq, adj or '')
+        with self._lock, self._conn:
+            if df is not None and len(df) > 0:
+                rows = [key + (row.trade_date,) + tuple(getattr(row, field) for field in BAR_FIELDS)
+                        for row in df.reindex(columns=['trade_date'] + BAR_FIELDS).itertuples(index=False)]
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO bars VALUES ({','.join('?' * (4 + len(BAR_FIELDS)))})", rows)
+            coverage = self._coverage_locked(*key)
+            if coverage is not None:
+                start_date = min(start_date, coverage[0])
+                covered_end = max(covered_end, coverage[1])
+            if covered_end >= start_date:
+                self._conn.execute("INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?, ?)",
+                                   key + (start_date, covered_end))
+
+    def _coverage(self, ts_code, freq, adj):
+        with self._lock:
+            return self._coverage_locked(ts_code, freq, adj or '')
+
+    def _coverage_locked(self, ts_code, freq, adj):
+        return self._conn.execute(
+            "SELECT start_date, end_date FROM coverage WHERE ts_code=? AND freq=? AND adj=?",
+            (ts_code, freq, adj)).fetchone()
+
+    def _read(self, ts_code, start_date, end_date, freq, adj) -> pd.DataFrame:
+        with self._lock:
+            df = pd.read_sql_query(
+                f"SELECT ts_code, trade_date, {', '.join(BAR_FIELDS)} FROM bars "
+                "WHERE ts_code=? AND freq=? AND adj=? AND trade_date BETWEEN ? AND ? ORDER BY trade_date",
+                self._conn, params=(ts_code, freq, adj or '', start_date, end_date))
+        return df
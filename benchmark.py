@@ -0,0 +1,306 @@
+"""
+离线性能基准：用合成的 tushare 数据源和本地假 DeepSeek 服务测量扫描链路和 agent 链路
+
+    python benchmark.py --stocks 500 --latency 0.02 --error-rate 0.01 --output bench.json
+    python benchmark.py --compare bench.json --threshold 0.1
+
+每个阶段输出总耗时、吞吐（条/秒）、单次 p50/p99 延迟和峰值内存；--compare 时与基线对比，
+任一阶段退化超过阈值则以非零状态码退出
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from datetime import datetime, timedelta
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from metrics import registry
+
+# 基准使用独立的临时缓存，且不走 LLM 缓存，必须在导入项目模块之前设置
+_TMP_DIR = tempfile.mkdtemp(prefix="tushare-bench-")
+os.environ["TUSHARE_BAR_STORE"] = os.path.join(_TMP_DIR, "bars.sqlite")
+os.environ["SYMBOL_MASTER_PATH"] = os.path.join(_TMP_DIR, "stock_basic.csv")
+# 关闭信号索引和列式面板：不读取开发机上已有的 data/signals.sqlite、data/panel，测量的是实际计算链路
+os.environ["SIGNAL_INDEX_PATH"] = ""
+os.environ["PANEL_STORE_PATH"] = ""
+os.environ.setdefault("LLM_CACHE", "")
+
+RATE_LIMIT_MESSAGE = "抱歉，您每分钟最多访问该接口500次"
+
+
+class FakeTushare:
+    """
+    合成的 tushare 数据源，同时充当 ts 模块（pro_bar）和 pro 接口（stock_basic / trade_cal / daily）
+    数据按 ts_code 固定随机种子生成，多次运行结果一致
+    """
+
+    def __init__(self, stocks: int = 200, latency: float = 0.02, error_rate: float = 0.0, seed: int = 0):
+        self.ts_codes = [f"{600000 + i:06d}.SH" for i in range(stocks)]
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self._lock = threading.Lock()
+        end = datetime.now()
+        self.dates = pd.bdate_range(end - timedelta(days=365 * 4), end).strftime('%Y%m%d')
+
+    def _request(self) -> bool:
+        """ 模拟一次网络请求，返回本次是否失败 """
+        with self._lock:
+            self.calls += 1
+            failed = self.random.random() < self.error_rate
+        time.sleep(self.latency)
+        return failed
+
+    @lru_cache(maxsize=None)
+    def _bars(self, ts_code: str) -> pd.DataFrame:
+        rng = np.random.default_rng(zlib.crc32(ts_code.encode()))
+        days = len(self.dates)
+        close = np.round(10 * np.cumprod(1 + rng.normal(0, 0.03, days)), 2)
+        pre_close = np.concatenate([[close[0]], close[:-1]])
+        open_price = np.round(pre_close * (1 + rng.normal(0, 0.02, days)), 2)
+        vol = np.round(rng.uniform(1e4, 2e4, days) * np.where(rng.random(days) < 0.15, 5, 1), 2)
+        return pd.DataFrame({
+            'ts_code': ts_code, 'trade_date': self.dates, 'open': open_price,
+            'high': np.maximum(open_price, close) * 1.01, 'low': np.minimum(open_price, close) * 0.99,
+            'close': close, 'pre_close': pre_close, 'change': close - pre_close,
+            'pct_chg': (close / pre_close - 1) * 100, 'vol': vol, 'amount': vol * close,
+        })
+
+    def pro_bar(self, ts_code=None, start_date=None, end_date=None, freq='D', adj=None, ma=None, **kwargs):
+        # 与真实 pro_bar 一致：出错时吞掉异常返回 None
+        if self._request():
+            return None
+        df = self._bars(ts_code)
+        df = df[(df['trade_date'] >= start_date) & (df['trade_date'] <= end_date)].iloc[::-1]
+        return df.reset_index(drop=True)
+
+    def stock_basic(self, list_status='L', **kwargs):
+        if self._request():
+            raise Exception(RATE_LIMIT_MESSAGE)
+        return pd.DataFrame({'ts_code': self.ts_codes, 'name': [f"股票{code[:6]}" for code in self.ts_codes]})
+
+    def trade_cal(self, exchange='SSE', start_date=None, end_date=None, is_open='1', **kwargs):
+        if self._request():
+            raise Exception(RATE_LIMIT_MESSAGE)
+        return pd.DataFrame({'cal_date': [d for d in self.dates if start_date <= d <= end_date]})
+
+    def daily(self, trade_date=None, **kwargs):
+        if self._request():
+            raise Exception(RATE_LIMIT_MESSAGE)
+        return self._market().get(trade_date, pd.DataFrame()).reset_index(drop=True)
+
+    @lru_cache(maxsize=None)
+    def _market(self) -> dict:
+        market = pd.concat([self._bars(code) for code in self.ts_codes], ignore_index=True)
+        return dict(tuple(market.groupby('trade_date')))
+
+
+class _FakeDeepSeekHandler(BaseHTTPRequestHandler):
+    """ 假 DeepSeek 接口：固定延迟后返回一个 get_stock_data 计划，支持 SSE 流式 """
+    protocol_version = 'HTTP/1.0'
+    latency = 0.5
+    plan = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        content = json.dumps(self.plan, ensure_ascii=False)
+        time.sleep(self.latency)
+        self.send_response(200)
+        if body.get('stream'):
+            self.send_header('Content-Type', 'text/event-stream')
+            self.end_headers()
+            for i in range(0, len(content), 8):
+                chunk = {'choices': [{'delta': {'content': content[i:i + 8]}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+        payload = json.dumps({'choices': [{'message': {'content': content}}],
+                              'usage': {'prompt_tokens': 300, 'completion_tokens': 40}}).encode()
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_fake_deepseek(latency: float, plan: dict) -> ThreadingHTTPServer:
+    handler = type('Handler', (_FakeDeepSeekHandler,), {'latency': latency, 'plan': plan})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def summarize(name: str, latencies: list, elapsed: float, peak_memory: int, items: int) -> dict:
+    latencies = np.asarray(latencies) if latencies else np.asarray([elapsed])
+    return {
+        'stage': name,
+        'items': items,
+        'elapsed': elapsed,
+        'throughput': items / elapsed if elapsed else 0.0,
+        'p50': float(np.percentile(latencies, 50)),
+        'p99': float(np.percentile(latencies, 99)),
+        'peak_memory_mb': peak_memory / 1024 / 1024,
+    }
+
+
+def run_stage(name: str, func, items: int) -> dict:
+    """ 执行一个阶段，func 返回单次延迟列表 """
+    tracemalloc.start()
+    t_start = time.perf_counter()
+    latencies = func()
+    elapsed = time.perf_counter() - t_start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = summarize(name, latencies, elapsed, peak, items)
+    print(f"[{name}] {result['elapsed']:.2f}s, {result['throughput']:.1f}/s, "
+          f"p50={result['p50'] * 1000:.1f}ms, p99={result['p99'] * 1000:.1f}ms, "
+          f"peak={result['peak_memory_mb']:.1f}MB")
+    return result
+
+
+def run_benchmarks(args) -> dict:
+    fake = FakeTushare(stocks=args.stocks, latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+
+    import tushare_tools
+    from fetch_scheduler import FetchScheduler
+    tushare_tools.ts = fake
+    tushare_tools.pro = fake
+    tushare_tools.scheduler = FetchScheduler(default_limit=args.rate_limit, limits={
+        endpoint: args.rate_limit for endpoint in ('pro_bar', 'daily', 'stock_basic', 'trade_cal')},
+        max_workers=args.workers, base_delay=0.05)
+
+    end_date = datetime.now().strftime('%Y%m%d')
+    start_date = (datetime.now() - timedelta(days=365 * 2)).strftime('%Y%m%d')
+    stocks = tushare_tools.get_all_live_stocks()
+    results = []
+
+    def match_days():
+        latencies = []
+        for stock in stocks[:args.sample]:
+            t_start = time.perf_counter()
+            tushare_tools.get_stock_match_days(stock.ts_code, start_date, end_date, 'D')
+            latencies.append(time.perf_counter() - t_start)
+        return latencies
+
+    def scan(warm: bool):
+        def run():
+            if not warm:
+                tushare_tools.bar_store.clear()
+            latencies = []
+            t_last = time.perf_counter()
+            for _ in tushare_tools.scan_match_days(start_date, end_date, 'D', stocks=stocks):
+                now = time.perf_counter()
+                latencies.append(now - t_last)
+                t_last = now
+            return latencies
+        return run
+
+    def batch():
+        from market_panel import load_market_panel, match_days_from_panel
+        panel = load_market_panel(fake, start_date, end_date, 'D', scheduler=tushare_tools.scheduler)
+        match_days_from_panel(panel)
+        return []
+
+    def agent():
+        plan = {'function': 'get_stock_data',
+                'params': {'ts_code': stocks[0].ts_code, 'start_date': start_date, 'end_date': end_date},
+                'reasoning': 'benchmark'}
+        server = start_fake_deepseek(args.llm_latency, plan)
+        os.environ['DEEPSEEK_API_URL'] = f"http://127.0.0.1:{server.server_address[1]}/"
+        import deepseek_client
+        deepseek_client.DEEPSEEK_API_URL = os.environ['DEEPSEEK_API_URL']
+        from agent import TushareAgent
+        tushare_agent = TushareAgent()
+        latencies = []
+        try:
+            for _ in range(args.agent_queries):
+                t_start = time.perf_counter()
+                tushare_agent.handle_query("Get stock data for the benchmark stock")
+                latencies.append(time.perf_counter() - t_start)
+        finally:
+            server.shutdown()
+        return latencies
+
+    stages = {
+        'match_days_cold': (match_days, min(args.sample, len(stocks))),
+        'scan_cold': (scan(warm=False), len(stocks)),
+        'scan_warm': (scan(warm=True), len(stocks)),
+        'scan_batch': (batch, len(stocks)),
+        'agent': (agent, args.agent_queries),
+    }
+    for name in args.stages or stages:
+        func, items = stages[name]
+        results.append(run_stage(name, func, items))
+
+    return {
+        'config': vars(args),
+        'tushare_calls': fake.calls,
+        'fetch_stats': tushare_tools.scheduler.stats(),
+        'metrics': registry.snapshot(),
+        'stages': results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """ 返回退化超过阈值的阶段：耗时和 p99 变大或吞吐下降 """
+    regressions = []
+    previous = {stage['stage']: stage for stage in baseline['stages']}
+    for stage in current['stages']:
+        base = previous.get(stage['stage'])
+        if base is None:
+            continue
+        for metric, worse in (('elapsed', 1), ('p99', 1), ('throughput', -1)):
+            if not base[metric]:
+                continue
+            change = (stage[metric] - base[metric]) / base[metric]
+            if change * worse > threshold:
+                regressions.append(f"{stage['stage']}.{metric}: {base[metric]:.4f} -> {stage[metric]:.4f} "
+                                   f"({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the scan pipeline and agent path")
+    parser.add_argument('--stocks', type=int, default=200, help="synthetic universe size")
+    parser.add_argument('--sample', type=int, default=50, help="stocks timed one by one in match_days_cold")
+    parser.add_argument('--latency', type=float, default=0.02, help="fake tushare latency per call (s)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fake tushare failure probability")
+    parser.add_argument('--rate-limit', type=float, default=6000, help="scheduler quota per endpoint (per minute)")
+    parser.add_argument('--workers', type=int, default=16, help="scheduler worker threads")
+    parser.add_argument('--llm-latency', type=float, default=0.5, help="fake DeepSeek latency (s)")
+    parser.add_argument('--agent-queries', type=int, default=5)
+    parser.add_argument('--stages', nargs='*', help="subset of stages to run")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the report to this JSON file")
+    parser.add_argument('--compare', help="baseline report to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="allowed relative regression")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
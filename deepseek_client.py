@@ -1,15 +1,56 @@
+import asyncio
+import json
 import os
+import weakref
+from threading import Lock
+
 import requests
-from twisted.spread.pb import respond
+from requests.adapters import HTTPAdapter
+
+from llm_cache import make_cache_key
+from metrics import logger, record_llm_usage, registry, span
+from single_flight import single_flight
 
 DEEPSEEK_API_URL = os.environ.get("DEEPSEEK_API_URL")
 DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY")
+# Max pooled keep-alive connections (sync) and max in-flight requests per client (async)
+DEEPSEEK_POOL_SIZE = int(os.environ.get("DEEPSEEK_POOL_SIZE", "16"))
+DEEPSEEK_MAX_CONCURRENCY = int(os.environ.get("DEEPSEEK_MAX_CONCURRENCY", "8"))
+
+_session = None
+_session_lock = Lock()
+
+
+def get_session() -> requests.Session:
+    """Process-wide session so every client reuses pooled keep-alive connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=DEEPSEEK_POOL_SIZE, pool_maxsize=DEEPSEEK_POOL_SIZE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def _chat_key(client, messages, model: str = "deepseek-chat", **params) -> tuple:
+    """Coalescing key: the same normalized request to the same endpoint."""
+    return client.url, make_cache_key(messages, model=model, **params)
 
 
 class DeepSeekClient:
-    def __init__(self, url: str = None, api_key: str = None):
+    def __init__(self, url: str = None, api_key: str = None, cache=None,
+                 max_concurrency: int = DEEPSEEK_MAX_CONCURRENCY):
         self.url = url or DEEPSEEK_API_URL
         self.api_key = api_key or DEEPSEEK_API_KEY
+        # Optional response cache for chat(), see llm_cache.MemoryCache / SQLiteCache
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.session = get_session()
+        # (httpx.AsyncClient, asyncio.Semaphore) per event loop, created on the first achat() call in that
+        # loop: both are bound to the loop they were created in, and callers may use several loops
+        # (asyncio.run per request, one loop per Gradio worker thread)
+        self._async_clients = weakref.WeakKeyDictionary()
         if not self.url:
             raise ValueError("DEEPSEEK_API_URL is not set")
 
@@ -22,7 +63,7 @@ class DeepSeekClient:
             "max_tokens": max_tokens,
             "temperature": temperature,
         }
-        resp = requests.post(self.url, json=payload, headers=headers, timeout=30)
+        resp = self.session.post(self.url, json=payload, headers=headers, timeout=30)
         resp.raise_for_status()
         data = resp.json()
         # Expecting data contains 'text' or similar key — adapt to your DeepSeek response schema
@@ -30,11 +71,115 @@ class DeepSeekClient:
             return data.get("text") or data.get("output") or str(data)
         return str(data)
 
-    def chat(self, messages):
-        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
-        payload = {"model": "deepseek-chat", "messages": messages}
-        resp = requests.post(self.url, headers=headers, json=payload, timeout=60)
-        print(headers, payload)
-        print("resp.text = ", resp.text)
-        print("""resp.json()["choices"][0]["message"]["content"]""", resp.json()["choices"][0]["message"]["content"])
-        return resp.json()["choices"][0]["message"]["content"]
\ No newline at end of file
+    def _chat_headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    def _cache_lookup(self, messages, model, params):
+        """Return (cache key, cached content); both None when caching is off."""
+        if self.cache is None:
+            return None, None
+        key = make_cache_key(messages, model=model, **params)
+        cached = self.cache.get(key)
+        registry.inc("llm_response_cache_total", result="hit" if cached is not None else "miss",
+                     help="DeepSeek response cache lookups")
+        return key, cached
+
+    @single_flight("deepseek_chat", key=_chat_key)
+    def chat(self, messages, model: str = "deepseek-chat", **params):
+        """
+        Chat completion. Identical (normalized) requests are served from the cache when one is set,
+        and concurrent identical requests share a single HTTP call.
+        """
+        key, cached = self._cache_lookup(messages, model, params)
+        if cached is not None:
+            return cached
+
+        headers = self._chat_headers()
+        payload = {"model": model, "messages": messages, **params}
+        with span("llm_request", mode="chat", model=model):
+            resp = self.session.post(self.url, headers=headers, json=payload, timeout=60)
+        logger.debug("chat payload=%s response=%s", payload, resp.text)
+        resp.raise_for_status()
+        data = resp.json()
+        record_llm_usage(data.get("usage"), model)
+        content = data["choices"][0]["message"]["content"]
+        if key is not None:
+            self.cache.set(key, content)
+        return content
+
+    def chat_stream(self, messages, model: str = "deepseek-chat", **params):
+        """Streaming chat completion (SSE). Yields content deltas as they arrive."""
+        key, cached = self._cache_lookup(messages, model, params)
+        if cached is not None:
+            yield cached
+            return
+
+        payload = {"model": model, "messages": messages, "stream": True,
+                   "stream_options": {"include_usage": True}, **params}
+        parts = []
+        with span("llm_request", mode="stream", model=model), \
+                self.session.post(self.url, headers=self._chat_headers(), json=payload, timeout=60, stream=True) as resp:
+            resp.raise_for_status()
+            resp.encoding = "utf-8"
+            for line in resp.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                # With include_usage the last chunk carries the token counts and no choices
+                record_llm_usage(chunk.get("usage"), model)
+                choices = chunk.get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        if key is not None:
+            self.cache.set(key, "".join(parts))
+
+    @single_flight("deepseek_achat", key=_chat_key)
+    async def achat(self, messages, model: str = "deepseek-chat", **params):
+        """
+        Async chat completion over a pooled httpx client, at most max_concurrency requests in flight per
+        event loop. Cached and coalesced like chat().
+        """
+        key, cached = self._cache_lookup(messages, model, params)
+        if cached is not None:
+            return cached
+
+        client, semaphore = self._async_client()
+        payload = {"model": model, "messages": messages, **params}
+        async with semaphore:
+            with span("llm_request", mode="async", model=model):
+                resp = await client.post(self.url, headers=self._chat_headers(), json=payload)
+        resp.raise_for_status()
+        data = resp.json()
+        record_llm_usage(data.get("usage"), model)
+        content = data["choices"][0]["message"]["content"]
+        if key is not None:
+            self.cache.set(key, content)
+        return content
+
+    def _async_client(self) -> tuple:
+        """The (client, semaphore) of the running event loop."""
+        loop = asyncio.get_running_loop()
+        pair = self._async_clients.get(loop)
+        if pair is None:
+            # httpx is only needed on the async path, so it is not imported at startup
+            import httpx
+            limits = httpx.Limits(max_connections=self.max_concurrency,
+                                  max_keepalive_connections=self.max_concurrency)
+            pair = self._async_clients[loop] = (httpx.AsyncClient(limits=limits, timeout=60),
+                                                asyncio.Semaphore(self.max_concurrency))
+        return pair
+
+    async def aclose(self):
+        """Close the async connection pool of the running event loop."""
+        pair = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if pair is not None:
+            await pair[0].aclose()
+
+    def cache_stats(self) -> dict:
+        """Hit/miss counters of the response cache."""
+        return self.cache.stats() if self.cache is not None else {}
\ No newline at end of file
@@ -0,0 +1,179 @@
+import os
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from typing import Callable, Dict, Iterable, List
+
+from metrics import registry, span
+
+# tushare 调用调度：按接口限流（令牌桶）、限流报错时带抖动的指数退避重试、统计吞吐
+DEFAULT_RATE_LIMIT = int(os.environ.get("TUSHARE_RATE_LIMIT", "200"))  # 每分钟请求数
+
+# 常见接口的每分钟配额，取决于 tushare 积分，可在创建 FetchScheduler 时覆盖
+DEFAULT_LIMITS = {
+    'pro_bar': DEFAULT_RATE_LIMIT,
+    'daily': DEFAULT_RATE_LIMIT,
+    'weekly': DEFAULT_RATE_LIMIT,
+    'monthly': DEFAULT_RATE_LIMIT,
+    'stock_basic': 60,
+    'trade_cal': 60,
+}
+
+# tushare 超出配额时的报错信息片段
+_RATE_LIMIT_MESSAGES = ('最多访问', '访问频率', '频次', 'rate limit', 'too many requests')
+
+
+class RateLimitError(Exception):
+    """ 接口返回超出配额 """
+
+
+class NoDataError(Exception):
+    """
+    接口没有返回数据：代码无效、已退市或区间内没有 K 线
+    pro_bar 也会把超出配额吞掉后返回空，所以只重试一次
+    """
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    """ 服务端报超出配额：需要退避，并让共用该接口配额的线程一起退让 """
+    if isinstance(exc, RateLimitError):
+        return True
+    message = str(exc).lower()
+    return any(fragment in message for fragment in _RATE_LIMIT_MESSAGES)
+
+
+def is_retryable(exc: Exception) -> bool:
+    """ 限流、网络错误和无数据可以重试，参数错误等其它异常直接抛出 """
+    return isinstance(exc, (OSError, NoDataError)) or is_rate_limited(exc)
+
+
+class TokenBucket:
+    """ 线程安全的令牌桶，rate_per_minute 为每分钟补充的令牌数 """
+
+    def __init__(self, rate_per_minute: float, burst: int = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1, int(rate_per_minute / 10))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = Lock()
+
+    def acquire(self):
+        """ 取一个令牌，令牌不足时阻塞等待 """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self):
+        """ 服务端已经报限流时清空令牌，让其它线程一起退让 """
+        with self._lock:
+            self.tokens = 0
+            self.updated = time.monotonic()
+
+
+class FetchScheduler:
+    """
+    在 tushare 接口前面做限流调度
+    :param limits: {接口名: 每分钟请求数}，未配置的接口使用 default_limit
+    :param max_workers: 同时在途的请求数上限
+    :param max_pending: 排队任务上限，超过时 submit 阻塞（背压）
+    :param max_retries: 限流和网络错误的重试次数；无数据（NoDataError）最多重试 max_no_data_retries 次
+    """
+
+    def __init__(self, limits: Dict[str, float] = None, default_limit: float = DEFAULT_RATE_LIMIT,
+                 max_workers: int = 16, max_pending: int = 256, max_retries: int = 8,
+                 base_delay: float = 1.0, max_delay: float = 60.0, max_no_data_retries: int = 1):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.default_limit = default_limit
+        self.max_retries = max_retries
+        self.max_no_data_retries = max_no_data_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._buckets = {}
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._pending = BoundedSemaphore(max_pending)
+        self._started = time.monotonic()
+        self._counters = defaultdict(lambda: defaultdict(int))
+        self._latency = defaultdict(float)
+
+    def _bucket(self, endpoint: str) -> TokenBucket:
+        with self._lock:
+            if endpoint not in self._buckets:
+                self._buckets[endpoint] = TokenBucket(self.limits.get(endpoint, self.default_limit))
+            return self._buckets[endpoint]
+
+    def _count(self, endpoint: str, name: str, value: int = 1):
+        with self._lock:
+            self._counters[endpoint][name] += value
+
+    def call(self, endpoint: str, func: Callable, *args, **kwargs):
+        """
+        在当前线程同步调用 func，受 endpoint 的配额限制
+        限流时清空令牌桶并退避重试；网络错误和无数据只在当前线程退避重试，不影响其它线程
+        """
+        bucket = self._bucket(endpoint)
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            t_start = time.monotonic()
+            try:
+                with span("tushare_fetch", endpoint=endpoint):
+                    result = func(*args, **kwargs)
+            except Exception as e:
+                retries = self.max_no_data_retries if isinstance(e, NoDataError) else self.max_retries
+                if attempt >= retries or not is_retryable(e):
+                    self._count(endpoint, 'failures')
+                    raise
+                self._count(endpoint, 'retries')
+                registry.inc("tushare_fetch_retries_total", endpoint=endpoint)
+                if is_rate_limited(e):
+                    bucket.drain()
+                # 全抖动退避，避免所有线程在同一时刻重新打满配额
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+                continue
+            with self._lock:
+                self._counters[endpoint]['requests'] += 1
+                self._latency[endpoint] += time.monotonic() - t_start
+            return result
+
+    def submit(self, endpoint: str, func: Callable, *args, **kwargs) -> Future:
+        """ 异步提交一次受限流的调用，排队任务过多时阻塞 """
+        return self.submit_task(self.call, endpoint, func, *args, **kwargs)
+
+    def submit_task(self, func: Callable, *args, **kwargs) -> Future:
+        """ 在调度器线程池里执行任意任务（任务内部自行通过 call 访问接口），同样受背压约束 """
+        self._pending.acquire()
+        future = self._executor.submit(func, *args, **kwargs)
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+
+    def map(self, func: Callable, items: Iterable) -> List[Future]:
+        """ 为每个 item 提交 func(item)，返回与 items 顺序一致的 future 列表 """
+        return [self.submit_task(func, item) for item in items]
+
+    def stats(self) -> dict:
+        """ 各接口的请求数、重试数、失败数、平均耗时和吞吐（请求/秒） """
+        elapsed = time.monotonic() - self._started
+        with self._lock:
+            stats = {}
+            for endpoint, counters in self._counters.items():
+                requests = counters['requests']
+                stats[endpoint] = {
+                    'requests': requests,
+                    'retries': counters['retries'],
+                    'failures': counters['failures'],
+                    'avg_latency': self._latency[endpoint] / requests if requests else None,
+                    'throughput': requests / elapsed if elapsed else 0.0,
+                }
+            return stats
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,53 @@
+import argparse
+import re
+import subprocess
+import sys
+import time
+
+# 导入耗时报告：在子进程中用 python -X importtime 导入指定模块，按累计耗时列出最慢的顶层导入
+# 用法：python import_profile.py app --top 20
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile_imports(module: str):
+    """
+    :return: (总耗时秒数, [(模块名, 自身耗时 us, 累计耗时 us, 嵌套层级)])
+    """
+    t_start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True)
+    elapsed = time.perf_counter() - t_start
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr[-2000:]}")
+    entries = []
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return elapsed, entries
+
+
+def report(module: str, top: int = 20, depth: int = 2) -> str:
+    elapsed, entries = profile_imports(module)
+    # 只看前 depth 层，避免同一份耗时在父子模块上重复出现
+    rows = sorted((entry for entry in entries if entry[3] < depth), key=lambda entry: -entry[2])[:top]
+    lines = [f"import {module}: {elapsed:.2f}s wall (interpreter start included)",
+             f"{'cumulative ms':>14} {'self ms':>9}  module"]
+    for name, self_us, cumulative_us, level in rows:
+        lines.append(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {'  ' * level}{name}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time profile of a module")
+    parser.add_argument('module', nargs='?', default='app')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--depth', type=int, default=2, help="nesting levels to include")
+    args = parser.parse_args()
+    print(report(args.module, args.top, args.depth))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+from collections import deque
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+
+# 本地技术指标：均线由原始收盘价/成交量计算，不再依赖 pro_bar 的 ma 参数
+# 所有数组约定第 0 维为时间（由旧到新）
+# 窗口和在整数上精确计算（价格按分、即 10^-decimals 为单位），不同起点、批量 / 面板 / 增量路径
+# 对同一天得到完全相同的和；保留两位小数时也在整数上做四舍五入，不经过浮点舍入
+
+PRICE_DECIMALS = 2
+
+
+def to_units(values, decimals: int = PRICE_DECIMALS):
+    """ 把价格（或成交量）换算成 10^-decimals 为单位的 int64，NaN 记为 0，另返回有效位置掩码 """
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    units = np.zeros(values.shape, dtype=np.int64)
+    units[valid] = np.rint(values[valid] * 10 ** decimals)
+    return units, valid
+
+
+def round_units(total, window: int):
+    """ 窗口和（整数）除以 window 后四舍五入到整数单位（.5 向上），与起点和累加顺序无关 """
+    return (2 * total + window) // (2 * window)
+
+
+def rolling_mean(values: np.ndarray, window: int, decimals: int = PRICE_DECIMALS,
+                 rounded: bool = False) -> np.ndarray:
+    """
+    用整数累加和计算滑动平均，前 window-1 个位置以及窗口内有 NaN 的位置为 NaN
+    支持一维序列和 (时间 × 股票) 的二维数组
+    :param decimals: 输入按 10^-decimals 取整后参与计算（价格为分）
+    :param rounded: True 时结果四舍五入到 decimals 位小数
+    """
+    units, valid = to_units(values, decimals)
+    out = np.full(units.shape, np.nan)
+    if window <= 0 or len(units) < window:
+        return out
+    cumsum = np.cumsum(units, axis=0)
+    missing = np.cumsum(~valid, axis=0)
+    total = cumsum[window - 1:].copy()
+    total[1:] -= cumsum[:-window]
+    gaps = missing[window - 1:].copy()
+    gaps[1:] -= missing[:-window]
+    scale = 10 ** decimals
+    mean = round_units(total, window) / scale if rounded else total / (window * scale)
+    out[window - 1:] = np.where(gaps == 0, mean, np.nan)
+    return out
+
+
+def rolling_mean_skipna(values: np.ndarray, window: int, decimals: int = PRICE_DECIMALS,
+                        rounded: bool = False) -> np.ndarray:
+    """ 逐列只在非 NaN 的位置上计算滑动平均（停牌日不参与计算，结果仍为 NaN） """
+    values = np.asarray(values, dtype=float)
+    out = np.full(values.shape, np.nan)
+    if values.ndim == 1:
+        valid = ~np.isnan(values)
+        out[valid] = rolling_mean(values[valid], window, decimals, rounded)
+        return out
+    for i in range(values.shape[1]):
+        out[:, i] = rolling_mean_skipna(values[:, i], window, decimals, rounded)
+    return out
+
+
+def moving_averages(values: np.ndarray, windows: Iterable[int], skipna: bool = False,
+                    rounded: bool = False) -> Dict[int, np.ndarray]:
+    """ 一次计算多条均线，返回 {窗口: 均线数组} """
+    func = rolling_mean_skipna if skipna else rolling_mean
+    return {window: func(values, window, rounded=rounded) for window in windows}
+
+
+def add_moving_averages(df: pd.DataFrame, ma: list, ascending: bool = True) -> pd.DataFrame:
+    """
+    在 df 上添加 ma{n} 和 ma_v_{n} 列，列名和两位小数的精度与 pro_bar 一致
+    :param ascending: df 是否按日期升序排列；pro_bar 的原始返回为倒序
+    """
+    step = 1 if ascending else -1
+    close = df['close'].to_numpy(dtype=float)[::step]
+    vol = df['vol'].to_numpy(dtype=float)[::step]
+    for days in ma:
+        df[f'ma{days}'] = rolling_mean(close, days, rounded=True)[::step]
+        df[f'ma_v_{days}'] = rolling_mean(vol, days, rounded=True)[::step]
+    return df
+
+
+class MovingAverageState:
+    """
+    增量均线：保存最近 max(windows) 个值（整数单位）和每个窗口的整数累加和，新 K 线到达时 O(窗口数) 更新
+    整数加减没有累积误差，长时间运行的结果与 rolling_mean 对同一天的计算完全相同
+    """
+
+    def __init__(self, windows: Iterable[int], decimals: int = PRICE_DECIMALS):
+        self.windows = list(windows)
+        self.decimals = decimals
+        self.scale = 10 ** decimals
+        self.values = deque(maxlen=max(self.windows))
+        self.sums = {window: 0 for window in self.windows}
+        # 每个窗口内 NaN 的个数
+        self.gaps = {window: 0 for window in self.windows}
+
+    @classmethod
+    def from_history(cls, windows: Iterable[int], values: Iterable[float]) -> 'MovingAverageState':
+        """ 用按时间升序排列的历史值初始化 """
+        state = cls(windows)
+        for value in values:
+            state.update(value)
+        return state
+
+    def update(self, value: float, rounded: bool = False) -> Dict[int, float]:
+        """
+        追加一个新值，返回 {窗口: 最新均线}，历史不足或窗口内有 NaN 的窗口为 NaN
+        :param rounded: True 时与 rolling_mean(rounded=True) 一样四舍五入到 decimals 位小数
+        """
+        value = float(value)
+        # NaN 记为 None，窗口内出现 None 时该窗口的均线为 NaN（与 rolling_mean 一致）
+        units = None if value != value else int(round(value * self.scale))
+        for window in self.windows:
+            self.sums[window] += units or 0
+            self.gaps[window] += units is None
+            if len(self.values) >= window:
+                dropped = self.values[-window]
+                self.sums[window] -= dropped or 0
+                self.gaps[window] -= dropped is None
+        self.values.append(units)
+        return self.current(rounded)
+
+    def current(self, rounded: bool = False) -> Dict[int, float]:
+        """ 当前各窗口的均线值 """
+        result = {}
+        for window in self.windows:
+            if len(self.values) < window or self.gaps[window]:
+                result[window] = float('nan')
+            elif rounded:
+                result[window] = round_units(self.sums[window], window) / self.scale
+            else:
+                result[window] = self.sums[window] / (window * self.scale)
+        return result
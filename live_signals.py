@@ -0,0 +1,183 @@
+import argparse
+import heapq
+from collections import deque, namedtuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+from indicators import MovingAverageState
+from strategy_engine import DEFAULT_MA
+
+# 增量信号计算：match_policy 需要后一天（next_day）才能确认，批量路径每次都重算全部历史
+# 这里为每只股票只保存最近三根 K 线和均线的滚动累加和，新 K 线到达时 O(1) 更新，
+# 并确认前一根 K 线是否满足策略，结果与 strategy_engine.match_days_from_frame 一致
+
+BAR_FIELDS = ['ts_code', 'trade_date', 'open', 'close', 'pre_close', 'vol']
+
+# 一个被确认的信号：trade_date 为满足策略的 K 线（cur_day），confirmed_on 为确认它的后一根 K 线
+Signal = namedtuple('Signal', ['ts_code', 'trade_date', 'confirmed_on'])
+
+# 窗口中保存的单根 K 线，只留策略需要的值
+_Bar = namedtuple('_Bar', ['trade_date', 'vol', 'is_up', 'ma_in_range_count'])
+
+
+def _is_up(open_price: float, close_price: float, pre_close: float) -> bool:
+    """ 与 strategy_engine.is_up 相同：收盘价高于昨收，或高于开盘价（NaN 比较为 False） """
+    return close_price > pre_close or close_price > open_price
+
+
+def _ma_in_range_count(open_price: float, close_price: float, pre_close: float, moving_averages) -> int:
+    """ 与 strategy_engine.moving_averages_in_range 相同：开盘价或收盘价缺失时区间无效，昨收缺失时忽略昨收 """
+    if open_price != open_price or close_price != close_price:
+        return 0
+    low = min(open_price, close_price)
+    if pre_close < low:
+        low = pre_close
+    high = max(open_price, close_price)
+    return sum(1 for ma in moving_averages if low <= ma <= high)
+
+
+class SymbolSignalState:
+    """
+    单只股票的滚动状态：均线累加和（MovingAverageState）+ 最近三根 K 线
+    每根 K 线的计算量只与均线条数有关，与历史长度无关
+    """
+    __slots__ = ('ts_code', 'ma', 'volume_ratio', 'min_ma_in_range', 'ma_state', 'window')
+
+    def __init__(self, ts_code: str, ma: list = DEFAULT_MA, volume_ratio: float = 3, min_ma_in_range: int = 4):
+        self.ts_code = ts_code
+        self.ma = list(ma)
+        self.volume_ratio = volume_ratio
+        self.min_ma_in_range = min_ma_in_range
+        self.ma_state = MovingAverageState(self.ma)
+        self.window = deque(maxlen=3)
+
+    @property
+    def last_date(self) -> Optional[str]:
+        return self.window[-1].trade_date if self.window else None
+
+    def update(self, trade_date: str, open_price: float, close_price: float, pre_close: float,
+               vol: float) -> Optional[Signal]:
+        """
+        追加一根 K 线，返回被它确认的信号（前一根 K 线满足策略时），否则返回 None
+        日期不晚于上一根 K 线的重复数据会被忽略
+        """
+        if self.window and trade_date <= self.window[-1].trade_date:
+            return None
+        # 与 add_moving_averages 相同的整数累加和与四舍五入，保留两位小数，长时间运行也没有累积误差
+        averages = self.ma_state.update(close_price, rounded=True)
+        moving_averages = [averages[days] for days in self.ma]
+        self.window.append(_Bar(trade_date, vol, _is_up(open_price, close_price, pre_close),
+                                _ma_in_range_count(open_price, close_price, pre_close, moving_averages)))
+        if len(self.window) < 3:
+            return None
+        pre_day, cur_day, next_day = self.window
+        if self._matches(pre_day, cur_day, next_day):
+            return Signal(self.ts_code, cur_day.trade_date, next_day.trade_date)
+        return None
+
+    def _matches(self, pre_day: _Bar, cur_day: _Bar, next_day: _Bar) -> bool:
+        if not (pre_day.is_up and cur_day.is_up and next_day.is_up):
+            return False
+        if not (_ratio(cur_day.vol, pre_day.vol) > self.volume_ratio
+                and _ratio(cur_day.vol, next_day.vol) > self.volume_ratio):
+            return False
+        return cur_day.ma_in_range_count >= self.min_ma_in_range
+
+
+def _ratio(numerator: float, denominator: float) -> float:
+    """ 与 numpy 的除法一致：x / 0 为 inf，0 / 0 为 NaN """
+    if denominator == 0:
+        return float('inf') if numerator > 0 else float('nan')
+    return numerator / denominator
+
+
+class LiveSignalEvaluator:
+    """
+    按股票维护 SymbolSignalState，逐根喂入 K 线（可以来自本地 K 线缓存、回放的行情流或实时推送）
+    :param on_signal: 每确认一个信号时回调，例如发送提醒
+    """
+
+    def __init__(self, ma: list = DEFAULT_MA, volume_ratio: float = 3, min_ma_in_range: int = 4,
+                 on_signal: Callable[[Signal], None] = None):
+        self.ma = list(ma)
+        self.volume_ratio = volume_ratio
+        self.min_ma_in_range = min_ma_in_range
+        self.on_signal = on_signal
+        self.states: Dict[str, SymbolSignalState] = {}
+
+    def state(self, ts_code: str) -> SymbolSignalState:
+        state = self.states.get(ts_code)
+        if state is None:
+            state = self.states[ts_code] = SymbolSignalState(ts_code, self.ma, self.volume_ratio,
+                                                             self.min_ma_in_range)
+        return state
+
+    def on_bar(self, bar: dict, emit: bool = True) -> Optional[Signal]:
+        """
+        :param bar: 包含 ts_code / trade_date / open / close / pre_close / vol 的一根 K 线
+        :param emit: False 时只更新状态（预热历史数据），不触发 on_signal
+        """
+        signal = self.state(bar['ts_code']).update(bar['trade_date'], float(bar['open']), float(bar['close']),
+                                                   float(bar['pre_close']), float(bar['vol']))
+        if signal is not None and emit and self.on_signal is not None:
+            self.on_signal(signal)
+        return signal
+
+    def run(self, bars: Iterable[dict], emit: bool = True) -> List[Signal]:
+        """ 依次处理一段行情流，返回其中确认的全部信号 """
+        signals = []
+        for bar in bars:
+            signal = self.on_bar(bar, emit)
+            if signal is not None:
+                signals.append(signal)
+        return signals
+
+    def warm_up(self, df: pd.DataFrame):
+        """ 用 pro_bar 格式的历史 K 线（按日期倒序）预热一只股票的状态，只更新状态不发出信号 """
+        self.run(bars_from_frame(df), emit=False)
+
+
+def bars_from_frame(df: pd.DataFrame) -> Iterator[dict]:
+    """ 把 pro_bar 格式的 DataFrame 按日期升序转成 K 线流 """
+    if df is None or len(df) == 0:
+        return iter(())
+    df = df.sort_values('trade_date', kind='stable')
+    return iter(df[BAR_FIELDS].to_dict(orient='records'))
+
+
+def replay_bars(frames: Iterable[pd.DataFrame]) -> Iterator[dict]:
+    """ 把多只股票的历史 K 线按交易日合并成一条行情流，模拟收盘后逐只推送 """
+    return heapq.merge(*(bars_from_frame(df) for df in frames), key=lambda bar: (bar['trade_date'], bar['ts_code']))
+
+
+def bars_from_store(bar_store, ts_codes: Iterable[str], start_date: str, end_date: str,
+                    freq: str = 'D') -> Iterator[dict]:
+    """ 从本地 K 线缓存（bar_store.BarStore）读取 [start_date, end_date] 的行情流，缺失部分由缓存补拉 """
+    return replay_bars(bar_store.get_bars(ts_code, start_date, end_date, freq=freq) for ts_code in ts_codes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay bars from the local bar store through the live evaluator")
+    parser.add_argument('ts_codes', nargs='+')
+    parser.add_argument('--start', required=True, help="first bar to alert on, YYYYMMDD")
+    parser.add_argument('--end', required=True)
+    parser.add_argument('--freq', default='D')
+    args = parser.parse_args()
+
+    from bar_store import lookback_start, shift_date
+    from tushare_tools import bar_store
+
+    if bar_store is None:
+        print("bar store is disabled (TUSHARE_BAR_STORE is empty)")
+        return
+    evaluator = LiveSignalEvaluator(on_signal=lambda signal: print(
+        f"{signal.ts_code} {signal.trade_date} (confirmed on {signal.confirmed_on})"))
+    # 均线所需的历史只用来预热，不发出提醒
+    evaluator.run(bars_from_store(bar_store, args.ts_codes, lookback_start(args.start, args.freq, DEFAULT_MA),
+                                  shift_date(args.start, -1), args.freq), emit=False)
+    evaluator.run(bars_from_store(bar_store, args.ts_codes, args.start, args.end, args.freq))
+
+
+if __name__ == "__main__":
+    main()
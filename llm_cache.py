@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+# LLM 响应缓存：key 由规范化后的消息列表和模型参数生成，支持 TTL 和 LRU 淘汰
+LLM_CACHE = os.environ.get("LLM_CACHE", "memory")  # memory / sqlite / 空字符串表示关闭
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "data/llm_cache.sqlite")
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "1024"))
+
+
+def _normalize_text(text: str) -> str:
+    """ 统一全角/半角并合并空白，让只差空格的问题命中同一条缓存 """
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def make_cache_key(messages: list, **params) -> str:
+    """ 由消息列表和模型参数生成缓存 key """
+    normalized = [{"role": message["role"], "content": _normalize_text(message.get("content") or "")}
+                  for message in messages]
+    payload = json.dumps({"messages": normalized, "params": params}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0}
+
+
+class MemoryCache(_CacheStats):
+    """ 进程内 LRU 缓存 """
+
+    def __init__(self, ttl: float = LLM_CACHE_TTL, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        super().__init__()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[1] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache(_CacheStats):
+    """ 磁盘缓存，进程重启后仍然有效，按最近访问时间做 LRU 淘汰 """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        super().__init__()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value, created_at FROM llm_cache WHERE key=?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM llm_cache WHERE key=?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at=? WHERE key=?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?)", (key, value, now, now))
+            overflow = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN "
+                    "(SELECT key FROM llm_cache ORDER BY accessed_at LIMIT ?)", (overflow,))
+                self.evictions += overflow
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_cache")
+
+
+def create_cache(backend: str = LLM_CACHE):
+    """ 按配置创建缓存，backend 为空时返回 None（不缓存） """
+    if not backend:
+        return None
+    if backend == "memory":
+        return MemoryCache()
+    if backend == "sqlite":
+        return SQLiteCache()
+    raise ValueError(f"Unknown LLM_CACHE backend '{backend}'")
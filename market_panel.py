@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from bar_store import lookback_start
+from indicators import moving_averages
+from metrics import logger, span
+from strategy_engine import DEFAULT_MA, match_policy_mask_by_symbol
+
+# 全市场按交易日批量拉取：每个 trade_date 一次请求拿到所有股票，再透视成 (日期 × 股票) 面板
+PANEL_FIELDS = ['open', 'high', 'low', 'close', 'pre_close', 'vol', 'amount']
+
+# 不同周期对应的按 trade_date 拉取全市场的接口
+_MARKET_ENDPOINTS = {'D': 'daily', 'W': 'weekly', 'M': 'monthly'}
+
+
+def get_trade_dates(pro, start_date: str, end_date: str, freq: str = 'D', scheduler=None) -> List[str]:
+    """ 获取区间内的交易日；周线/月线取每周/每月最后一个交易日 """
+    kwargs = dict(exchange='SSE', start_date=start_date, end_date=end_date, is_open='1')
+    cal = scheduler.call('trade_cal', pro.trade_cal, **kwargs) if scheduler else pro.trade_cal(**kwargs)
+    dates = pd.Series(sorted(cal['cal_date']))
+    if freq == 'D':
+        return dates.tolist()
+    period = pd.to_datetime(dates).dt.to_period('W' if freq == 'W' else 'M')
+    return dates.groupby(period.values).last().tolist()
+
+
+def fetch_market_bars(pro, trade_dates: List[str], freq: str = 'D', max_workers: int = 5,
+                      scheduler=None, progress: Callable[[int, int], None] = None) -> pd.DataFrame:
+    """
+    逐个交易日拉取全市场 K 线，返回长表；传入 scheduler 时由其限流和重试
+    :param progress: 每拉完一个交易日调用 progress(已完成数, 总数)；回调抛出异常时取消剩余请求并向上抛出
+    """
+    name = _MARKET_ENDPOINTS[freq]
+    endpoint = getattr(pro, name)
+    if scheduler is not None:
+        futures = [scheduler.submit(name, endpoint, trade_date=trade_date) for trade_date in trade_dates]
+        frames = []
+        try:
+            for future in futures:
+                frames.append(future.result())
+                if progress is not None:
+                    progress(len(frames), len(futures))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            frames = []
+            for df in executor.map(lambda trade_date: endpoint(trade_date=trade_date), trade_dates):
+                frames.append(df)
+                if progress is not None:
+                    progress(len(frames), len(trade_dates))
+    frames = [df for df in frames if df is not None and len(df) > 0]
+    if not frames:
+        return pd.DataFrame(columns=['ts_code', 'trade_date'] + PANEL_FIELDS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def pivot_panel(bars: pd.DataFrame, ts_codes: List[str] = None, fields: List[str] = PANEL_FIELDS) -> Dict[str, pd.DataFrame]:
+    """
+    将长表透视成面板：{字段: DataFrame(index=trade_date 升序, columns=ts_code)}
+    停牌日没有 K 线，对应位置为 NaN
+    """
+    panel = {}
+    for field in [field for field in fields if field in bars.columns]:
+        frame = bars.pivot(index='trade_date', columns='ts_code', values=field).sort_index()
+        if ts_codes is not None:
+            frame = frame.reindex(columns=ts_codes)
+        panel[field] = frame.astype(float)
+    return panel
+
+
+def add_panel_moving_averages(panel: Dict[str, pd.DataFrame], ma: list = DEFAULT_MA) -> Dict[str, pd.DataFrame]:
+    """ 逐只股票只在有成交的 K 线上计算均线（与 pro_bar 一致跳过停牌日），保留两位小数 """
+    close = panel['close']
+    for days, values in moving_averages(close.to_numpy(), ma, skipna=True, rounded=True).items():
+        panel[f'ma{days}'] = pd.DataFrame(values, index=close.index, columns=close.columns)
+    return panel
+
+
+def load_market_panel(pro, start_date: str, end_date: str, freq: str = 'D', ma: list = DEFAULT_MA,
+                      ts_codes: List[str] = None, scheduler=None,
+                      progress: Callable[[int, int], None] = None) -> Dict[str, pd.DataFrame]:
+    """
+    拉取 [start_date, end_date] 的全市场面板，自动向前多取均线所需的历史
+    请求次数约等于交易日数量，而不是股票数量
+    :param progress: 见 fetch_market_bars
+    """
+    trade_dates = get_trade_dates(pro, lookback_start(start_date, freq, ma), end_date, freq, scheduler)
+    logger.info("fetching %d trade dates for freq=%s", len(trade_dates), freq)
+    bars = fetch_market_bars(pro, trade_dates, freq, scheduler=scheduler, progress=progress)
+    with span("frame_build", source="panel"):
+        panel = add_panel_moving_averages(pivot_panel(bars, ts_codes), ma)
+    return {field: frame[frame.index >= start_date] for field, frame in panel.items()}
+
+
+def match_days_from_panel(panel: Dict[str, pd.DataFrame], ma: list = DEFAULT_MA) -> Dict[str, list]:
+    """
+    在整个面板上一次性执行策略
+    停牌日为 NaN，逐只股票跳过停牌日求值，停牌前后的 K 线直接相邻（与逐只 pro_bar 路径一致）
+    :return: {ts_code: 满足策略的日期列表}，只包含有匹配的股票
+    """
+    close = panel['close']
+    moving_averages = np.stack([panel[f'ma{days}'].to_numpy() for days in ma])
+    with span("policy_eval", path="panel"):
+        mask = match_policy_mask_by_symbol(
+            panel['open'].to_numpy(),
+            close.to_numpy(),
+            panel['pre_close'].to_numpy(),
+            panel['vol'].to_numpy(),
+            moving_averages,
+        )
+    dates = close.index.to_numpy()
+    return {ts_code: dates[mask[:, i]].tolist()
+            for i, ts_code in enumerate(close.columns) if mask[:, i].any()}
@@ -0,0 +1,153 @@
+import logging
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+# Lightweight in-process instrumentation: counters and latency histograms, exported in the
+# Prometheus text format. Spans wrap the hot paths (LLM calls, Tushare fetches, frame building,
+# policy evaluation) so we can see where time and tokens go.
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9100"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+logger = logging.getLogger("tushare_agent")
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Registry:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = Lock()
+        self._counters = defaultdict(lambda: defaultdict(float))
+        self._histograms = defaultdict(dict)
+        self._help = {}
+
+    def inc(self, name: str, value: float = 1, help: str = None, **labels):
+        """Increase a counter."""
+        with self._lock:
+            if help:
+                self._help.setdefault(name, help)
+            self._counters[name][_label_key(labels)] += value
+
+    def observe(self, name: str, value: float, help: str = None, **labels):
+        """Record one observation (e.g. a duration in seconds) in a histogram."""
+        key = _label_key(labels)
+        with self._lock:
+            if help:
+                self._help.setdefault(name, help)
+            histogram = self._histograms[name].get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def snapshot(self) -> dict:
+        """Plain-dict copy of all counters and histogram sums/counts, for logs and benchmarks."""
+        with self._lock:
+            counters = {name: {_format_labels(key): value for key, value in series.items()}
+                        for name, series in self._counters.items()}
+            histograms = {name: {_format_labels(key): {"sum": h["sum"], "count": h["count"]}
+                                 for key, h in series.items()}
+                          for name, series in self._histograms.items()}
+        return {"counters": counters, "histograms": histograms}
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    for bound, count in zip(self.buckets, histogram["buckets"]):
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', bound),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {histogram['count']}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram['sum']}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+@contextmanager
+def span(name: str, **labels):
+    """Time a block into the <name>_seconds histogram; failures also count into <name>_errors_total."""
+    t_start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        registry.inc(f"{name}_errors_total", **labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - t_start
+        registry.observe(f"{name}_seconds", elapsed, **labels)
+        logger.debug("%s %s took %.3fs", name, labels, elapsed)
+
+
+def timed(name: str, **labels):
+    """Decorator form of span()."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_llm_usage(usage: dict, model: str = "deepseek-chat"):
+    """Count tokens from an OpenAI-compatible usage block, including DeepSeek prompt cache hits."""
+    if not usage:
+        return
+    for field in ("prompt_tokens", "completion_tokens", "prompt_cache_hit_tokens", "prompt_cache_miss_tokens"):
+        if usage.get(field):
+            registry.inc(f"llm_{field}_total", usage[field], model=model)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /metrics in a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -6,7 +6,6 @@ from typing import Annotated, List, TypedDict
 # 使用 OpenAI 兼容库即可，DeepSeek 官方推荐
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage
-from langchain_core.tools import tool
 from langgraph.graph import StateGraph, END
 
 from dotenv import load_dotenv
@@ -29,16 +28,11 @@ llm = ChatOpenAI(
 )
 
 # --- 3. 定义异步工具 ---
-@tool
-async def get_market_data(pair: str):
-    """查询 Gate.io 上的交易对行情数据（如 BTC_USDT）。"""
-    await asyncio.sleep(0.3) # 模拟网络延迟
-    # 模拟返回
-    market_data = {"BTC_USDT": "96500", "ETH_USDT": "2700", "GT_USDT": "9.5"}
-    price = market_data.get(pair.upper(), "Price not found")
-    return f"The current price of {pair} is {price} USDT."
-
-tools = [get_market_data]
+# 真实的 Tushare 工具：在有界线程池中执行，每个工具有并发上限和超时，不阻塞事件循环
+from async_tools import langchain_tools
+
+tools = langchain_tools()
+tools_by_name = {t.name: t for t in tools}
 # 将工具绑定到 DeepSeek 模型
 model_with_tools = llm.bind_tools(tools)
 
@@ -55,7 +49,7 @@ async def call_deepseek(state: AgentState):
     # 引导模型一次性识别所有需求，不要分步执行
     prompt_guidance = (
         "你是一个极其高效的金融分析助手。"
-        "当用户要求查询多个信息（如多个交易对的价格）时，请务必在【单次回复】中"
+        "当用户要求查询多个信息（如多只股票的行情或策略匹配日）时，请务必在【单次回复】中"
         "生成【所有的工具调用指令】，以便系统能够并行处理。"
         "不要一个一个地查，效率对我们非常重要。"
     )
@@ -77,6 +71,9 @@ async def call_deepseek(state: AgentState):
 
     return {"messages": [response]}
 
+async def _unknown_tool(name: str):
+    raise ValueError(f"unknown tool '{name}'")
+
 async def execute_tools_parallel(state: AgentState):
     """
     高性能并行执行：面试官最看重的工程细节
@@ -87,9 +84,13 @@ async def execute_tools_parallel(state: AgentState):
     # 构建并发任务池
     tasks = []
     for call in tool_calls:
-        # 通过工具名映射并异步执行
+        # 通过工具名映射并异步执行，未知工具直接返回错误
         # 在实际生产中，这里可以接入 MCP 协议驱动的远程工具服务器
-        tasks.append(get_market_data.ainvoke(call["args"]))
+        selected = tools_by_name.get(call["name"])
+        if selected is None:
+            tasks.append(_unknown_tool(call["name"]))
+        else:
+            tasks.append(selected.ainvoke(call["args"]))
     print("execute_tools_parallel", state, tasks)
     # 并行等待所有结果
     results = await asyncio.gather(*tasks, return_exceptions=True)
@@ -123,7 +124,7 @@ app = workflow.compile()
 
 # --- 6. 运行测试 ---
 async def main():
-    inputs = {"messages": [HumanMessage(content="帮我查一下 BTC_USDT 和 GT_USDT 的价格，两个都需要")]}
+    inputs = {"messages": [HumanMessage(content="帮我查一下 600519.SH 和 000001.SZ 在 20240101 到 20240131 的日线行情，两个都需要")]}
     async for output in app.astream(inputs, config={"recursion_limit": 15}):
         print(output)
 
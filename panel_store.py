@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import shutil
+from typing import Dict, List, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from strategy_engine import DEFAULT_MA
+
+# 列式面板文件：每个字段一个连续的文件，形状为 (股票 × 日期)，再加一个 index.json 记录股票、日期和各字段的 dtype
+# 读取时用 numpy.memmap 打开，切片不复制数据；多个进程打开同一组文件时共享操作系统的页缓存
+# 全市场两年日线约 5000 × 500 × 13 个字段 × 4~8 字节 ≈ 150MB，远小于 5000 个 DataFrame 的内存占用
+# 价格和均线用 float32：两位小数的价格在 float32 下足够精确，比较运算的结果与 float64 一致（等号两侧舍入方式相同）
+# 成交量和成交额用 float64：它们可以超过 2^24（float32 只有 24 位有效位），放量倍数的比较会因舍入而改变
+PANEL_STORE_PATH = os.environ.get("PANEL_STORE_PATH", "data/panel")
+
+STORE_FIELDS = ['open', 'high', 'low', 'close', 'pre_close', 'vol', 'amount'] + [f'ma{days}' for days in DEFAULT_MA]
+
+# 需要 float64 的字段，其余字段为 float32
+WIDE_FIELDS = ('vol', 'amount')
+
+_INDEX_FILE = 'index.json'
+_SUFFIXES = {'float32': 'f32', 'float64': 'f64'}
+
+
+def store_dir(root: str, freq: str = 'D') -> str:
+    return os.path.join(root, freq)
+
+
+def field_dtype(field: str) -> str:
+    return 'float64' if field in WIDE_FIELDS else 'float32'
+
+
+def field_file(path: str, field: str, dtype: str) -> str:
+    return os.path.join(path, f'{field}.{_SUFFIXES[dtype]}')
+
+
+def write_panel(path: str, panel: Dict[str, pd.DataFrame], fields: List[str] = None) -> str:
+    """
+    把 (日期 × 股票) 面板写成列式文件，先写到临时目录再整体替换，读者不会看到写了一半的文件
+    :param panel: market_panel.load_market_panel 的返回值
+    """
+    close = panel['close']
+    fields = [field for field in (fields or STORE_FIELDS) if field in panel]
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for field in fields:
+        # 转置成 (股票 × 日期) 后按行连续写出，同一只股票的整段历史在文件里是连续的
+        dtype = field_dtype(field)
+        values = panel[field].reindex(index=close.index, columns=close.columns).to_numpy(dtype=dtype).T
+        np.ascontiguousarray(values).tofile(field_file(tmp_path, field, dtype))
+    index = {
+        'symbols': close.columns.tolist(),
+        'dates': close.index.tolist(),
+        'fields': fields,
+        'dtype': 'float32',
+        'dtypes': {field: field_dtype(field) for field in fields},
+        'layout': 'symbol_major',
+    }
+    with open(os.path.join(tmp_path, _INDEX_FILE), 'w') as f:
+        json.dump(index, f)
+    old_path = path + '.old'
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return path
+
+
+class PanelStore:
+    """
+    只读打开列式面板
+    field() 返回 (股票 × 日期) 的 memmap；view() 返回策略和回测使用的 (日期 × 股票) 视图，均不复制数据
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, _INDEX_FILE)) as f:
+            index = json.load(f)
+        self.symbols: List[str] = index['symbols']
+        self.dates = np.array(index['dates'])
+        self.fields: List[str] = index['fields']
+        # 旧版本写出的面板没有 dtypes，所有字段都是 index['dtype']
+        self.dtypes: Dict[str, str] = {field: index.get('dtypes', {}).get(field, index['dtype'])
+                                       for field in self.fields}
+        self.shape = (len(self.symbols), len(self.dates))
+        self.rows = {ts_code: row for row, ts_code in enumerate(self.symbols)}
+        self._maps = {}
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return os.path.exists(os.path.join(path, _INDEX_FILE))
+
+    def field(self, name: str) -> np.memmap:
+        if name not in self.fields:
+            raise KeyError(f"field '{name}' is not stored, available: {self.fields}")
+        if name not in self._maps:
+            dtype = self.dtypes[name]
+            self._maps[name] = np.memmap(field_file(self.path, name, dtype), dtype=dtype, mode='r', shape=self.shape)
+        return self._maps[name]
+
+    def covers(self, start_date: str, end_date: str, fields: Sequence[str] = ()) -> bool:
+        return (len(self.dates) > 0 and self.dates[0] <= start_date and end_date <= self.dates[-1]
+                and all(field in self.fields for field in fields))
+
+    def date_slice(self, start_date: str = None, end_date: str = None) -> slice:
+        start = np.searchsorted(self.dates, start_date, 'left') if start_date else 0
+        stop = np.searchsorted(self.dates, end_date, 'right') if end_date else len(self.dates)
+        return slice(int(start), int(stop))
+
+    def symbol_rows(self, symbols: Union[slice, Sequence[str], None]):
+        """ None 为全部股票；slice 按行号切片（零拷贝）；ts_code 列表会按行号取数（会复制） """
+        if symbols is None:
+            return slice(None)
+        if isinstance(symbols, slice):
+            return symbols
+        return np.array([self.rows[ts_code] for ts_code in symbols], dtype=int)
+
+    def view(self, fields: Sequence[str] = None, start_date: str = None, end_date: str = None,
+             symbols: Union[slice, Sequence[str], None] = None) -> Dict[str, np.ndarray]:
+        """
+        :return: {字段: (日期 × 股票) 数组}，日期和 slice 切片都是 memmap 上的视图，不复制数据
+        """
+        dates = self.date_slice(start_date, end_date)
+        rows = self.symbol_rows(symbols)
+        return {field: self.field(field)[rows, dates].T for field in (fields or self.fields)}
+
+    def view_symbols(self, symbols: Union[slice, Sequence[str], None] = None) -> List[str]:
+        rows = self.symbol_rows(symbols)
+        return np.asarray(self.symbols)[rows].tolist()
+
+    def to_frames(self, fields: Sequence[str] = None, start_date: str = None, end_date: str = None,
+                  symbols: Union[slice, Sequence[str], None] = None) -> Dict[str, pd.DataFrame]:
+        """ 转成 market_panel 格式的 DataFrame 面板（会复制成 float64），用于兼容旧接口 """
+        dates = self.dates[self.date_slice(start_date, end_date)]
+        columns = self.view_symbols(symbols)
+        return {field: pd.DataFrame(values.astype(float), index=dates, columns=columns)
+                for field, values in self.view(fields, start_date, end_date, symbols).items()}
+
+    def match_days(self, start_date: str = None, end_date: str = None, ma: list = DEFAULT_MA,
+                   strategy: str = 'match_policy', strategy_params: dict = None,
+                   symbols: Union[slice, Sequence[str], None] = None) -> Dict[str, list]:
+        """ 直接在 memmap 视图上执行策略，返回 {ts_code: 匹配日期列表} """
+        from strategies import build_strategy, evaluate_strategies
+
+        fields = ['open', 'close', 'pre_close', 'vol'] + [f'ma{days}' for days in ma]
+        arrays = self.view(fields, start_date, end_date, symbols)
+        mask = evaluate_strategies(arrays, {strategy: build_strategy(strategy, strategy_params)}, ma)[strategy]
+        dates = self.dates[self.date_slice(start_date, end_date)]
+        ts_codes = self.view_symbols(symbols)
+        return {ts_codes[i]: dates[mask[:, i]].tolist() for i in np.flatnonzero(mask.any(axis=0))}
+
+
+def build_panel_store(root: str, pro, start_date: str, end_date: str, freq: str = 'D', ma: list = DEFAULT_MA,
+                      scheduler=None) -> PanelStore:
+    """ 按交易日拉取全市场面板并写成列式文件 """
+    from market_panel import load_market_panel
+
+    panel = load_market_panel(pro, start_date, end_date, freq=freq, ma=ma, scheduler=scheduler)
+    fields = [field for field in STORE_FIELDS if not field.startswith('ma')] + [f'ma{days}' for days in ma]
+    return PanelStore(write_panel(store_dir(root, freq), panel, fields))
+
+
+def open_panel_store(root: str = PANEL_STORE_PATH, freq: str = 'D'):
+    """ 面板文件存在时返回 PanelStore，否则返回 None """
+    if not root or not PanelStore.exists(store_dir(root, freq)):
+        return None
+    return PanelStore(store_dir(root, freq))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the memory-mapped market panel")
+    parser.add_argument('command', choices=['build', 'info'])
+    parser.add_argument('--start', help="YYYYMMDD, required for build")
+    parser.add_argument('--end')
+    parser.add_argument('--freq', default='D')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        from datetime import datetime
+        from tushare_tools import get_pro, scheduler
+        store = build_panel_store(PANEL_STORE_PATH, get_pro(), args.start,
+                                  args.end or datetime.now().strftime('%Y%m%d'), args.freq, scheduler=scheduler)
+    else:
+        store = open_panel_store(PANEL_STORE_PATH, args.freq)
+        if store is None:
+            print("no panel store, run build first")
+            return
+    size = sum(os.path.getsize(field_file(store.path, field, store.dtypes[field])) for field in store.fields)
+    print(f"{store.path}: {store.shape[0]} symbols × {store.shape[1]} dates "
+          f"({store.dates[0]}..{store.dates[-1]}), {len(store.fields)} fields, {size / 1e6:.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from metrics import span
+from panel_store import PanelStore
+from strategy_engine import DEFAULT_MA, match_policy_mask_by_symbol
+
+# 多进程分片执行策略：面板数据放进共享内存，子进程按股票列切片读取，不再通过 pickle 传 DataFrame
+
+
+def _share(array: np.ndarray) -> Tuple[shared_memory.SharedMemory, tuple]:
+    """ 把数组复制到一块共享内存，返回共享内存对象和 (名称, 形状, dtype) 描述 """
+    array = np.ascontiguousarray(array, dtype=np.float64)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _evaluate_shard(specs: Dict[str, tuple], columns: Tuple[int, int], ma: list) -> np.ndarray:
+    """ 子进程：挂载共享内存，对 [start, stop) 列的股票执行策略，返回布尔掩码 """
+    start, stop = columns
+    handles = []
+    arrays = {}
+    try:
+        for field, (name, shape, dtype) in specs.items():
+            shm = shared_memory.SharedMemory(name=name)
+            handles.append(shm)
+            # 只取本分片对应的列，切片是视图，不会复制
+            arrays[field] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)[..., start:stop]
+        moving_averages = np.stack([arrays[f'ma{days}'] for days in ma])
+        return match_policy_mask_by_symbol(arrays['open'], arrays['close'], arrays['pre_close'], arrays['vol'],
+                                 moving_averages)
+    finally:
+        arrays.clear()
+        for shm in handles:
+            shm.close()
+
+
+def shard_bounds(count: int, shards: int) -> List[Tuple[int, int]]:
+    """ 把 count 只股票尽量均匀地切成 shards 段 """
+    shards = max(1, min(shards, count))
+    edges = np.linspace(0, count, shards + 1).astype(int)
+    return [(int(edges[i]), int(edges[i + 1])) for i in range(shards) if edges[i] < edges[i + 1]]
+
+
+def parallel_match_days(panel: Dict[str, pd.DataFrame], ma: list = DEFAULT_MA,
+                        max_workers: int = None, shards: int = None) -> Dict[str, list]:
+    """
+    在进程池中按股票分片执行策略，结果与 market_panel.match_days_from_panel 相同
+    :param panel: market_panel.load_market_panel 返回的 (日期 × 股票) 面板
+    :return: {ts_code: 满足策略的日期列表}，按面板中的股票顺序合并
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    fields = ['open', 'close', 'pre_close', 'vol'] + [f'ma{days}' for days in ma]
+    close = panel['close']
+    bounds = shard_bounds(close.shape[1], shards or max_workers * 4)
+
+    handles = []
+    try:
+        specs = {}
+        for field in fields:
+            shm, spec = _share(panel[field].to_numpy())
+            handles.append(shm)
+            specs[field] = spec
+        with span("policy_eval", path="parallel"), ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # map 按提交顺序返回，合并结果与分片完成的先后无关
+            masks = list(executor.map(_evaluate_shard, [specs] * len(bounds), bounds, [ma] * len(bounds)))
+    finally:
+        for shm in handles:
+            shm.close()
+            shm.unlink()
+
+    dates = close.index.to_numpy()
+    ts_codes = close.columns
+    result = {}
+    for (start, _), mask in zip(bounds, masks):
+        for offset in np.flatnonzero(mask.any(axis=0)):
+            result[ts_codes[start + offset]] = dates[mask[:, offset]].tolist()
+    return result
+
+
+def _evaluate_store_shard(path: str, start_date: str, end_date: str, rows: Tuple[int, int], ma: list) -> np.ndarray:
+    """ 子进程：自行以 memmap 打开面板文件，只读取 [start, stop) 行的股票，页缓存由所有进程共享 """
+    store = PanelStore(path)
+    fields = ['open', 'close', 'pre_close', 'vol'] + [f'ma{days}' for days in ma]
+    arrays = store.view(fields, start_date, end_date, symbols=slice(*rows))
+    moving_averages = np.stack([arrays[f'ma{days}'] for days in ma])
+    return match_policy_mask_by_symbol(arrays['open'], arrays['close'], arrays['pre_close'], arrays['vol'], moving_averages)
+
+
+def parallel_match_days_from_store(store: PanelStore, start_date: str = None, end_date: str = None,
+                                   ma: list = DEFAULT_MA, max_workers: int = None,
+                                   shards: int = None) -> Dict[str, list]:
+    """
+    与 parallel_match_days 相同，但数据来自 panel_store 的列式文件：
+    不需要先把面板复制进共享内存，子进程只传文件路径和行号范围
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    bounds = shard_bounds(len(store.symbols), shards or max_workers * 4)
+    count = len(bounds)
+    with span("policy_eval", path="parallel_store"), ProcessPoolExecutor(max_workers=max_workers) as executor:
+        masks = list(executor.map(_evaluate_store_shard, [store.path] * count, [start_date] * count,
+                                  [end_date] * count, bounds, [ma] * count))
+
+    dates = store.dates[store.date_slice(start_date, end_date)]
+    result = {}
+    for (start, _), mask in zip(bounds, masks):
+        for offset in np.flatnonzero(mask.any(axis=0)):
+            result[store.symbols[start + offset]] = dates[mask[:, offset]].tolist()
+    return result
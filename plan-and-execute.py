@@ -5,14 +5,18 @@ from pydantic import BaseModel, Field
 from langchain_openai import ChatOpenAI
 # from langchain_core.messages import HumanMessage
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_core.tools import tool
 from langgraph.graph import StateGraph, END
 from langchain.callbacks.base import AsyncCallbackHandler
 
+from async_tools import langchain_tools
+from metrics import logger, record_llm_usage
+
 class UsageCallback(AsyncCallbackHandler):
     async def on_llm_end(self, response, **kwargs):
         usage = response.llm_output.get("token_usage", {})
-        print("[callback]", usage)
+        # 记录 token 用量（含 prompt_cache_hit_tokens），通过 /metrics 暴露
+        record_llm_usage(usage)
+        logger.debug("[callback] %s", usage)
 
 from dotenv import load_dotenv
 import os
@@ -40,13 +44,18 @@ def log_llm_usage(tag: str, response):
 
 # --- 1. 定义状态和数据结构 ---
 
+class ToolTask(BaseModel):
+    """一次工具调用"""
+    tool: str = Field(description="工具名称：get_stock_data / get_stock_match_days / get_all_live_stocks")
+    args: dict = Field(default_factory=dict, description="工具参数，日期格式 YYYYMMDD")
+
 class Plan(BaseModel):
     """计划的任务列表，每个步骤可以包含多个可并行的任务"""
-    steps: List[List[str]] = Field(description="有序的步骤列表。每个内部列表包含可以并行执行的任务（如查询不同币种）。")
+    steps: List[List[ToolTask]] = Field(description="有序的步骤列表。每个内部列表包含可以并行执行的工具调用（如查询不同股票）。")
 
 class PlanExecuteState(TypedDict):
     input: str
-    plan: List[List[str]]
+    plan: List[List[dict]]
     past_steps: Annotated[List[str], operator.add]
     response: str
 
@@ -56,23 +65,23 @@ llm = ChatOpenAI(model='deepseek-chat',
                  openai_api_base='https://api.deepseek.com',
                  callbacks=[UsageCallback()],)
 
-@tool
-async def get_market_data(pair: str):
-    """查询交易对行情数据（如 BTC_USDT）。"""
-    await asyncio.sleep(0.5)  # 模拟网络延迟
-    data = {"BTC_USDT": "96500", "GT_USDT": "9.5"}
-    price = data.get(pair.upper(), "Unknown")
-    return f"{pair}: {price} USDT"
+# 真实的 Tushare 工具：在有界线程池中执行，每个工具有并发上限和超时，不阻塞事件循环
+tools_by_name = {t.name: t for t in langchain_tools()}
 
 # --- 3. 节点逻辑 ---
 # --- 定义静态的 System Prompt ---
 PLANNER_SYSTEM_PROMPT = """你是一个专业的金融任务规划专家。
 你的职责是根据用户需求拆解执行计划。
 
+可用工具：
+- get_stock_data(ts_code, start_date, end_date)：单只股票的日线行情和均线
+- get_stock_match_days(ts_code, start_date, end_date)：单只股票满足策略的交易日
+- get_all_live_stocks()：当前上市的全部股票
+
 规则（请严格遵守以触发缓存）：
-1. 识别所有需要查询的资产（如 BTC_USDT, GT_USDT）。
+1. 识别所有需要查询的股票（如 600519.SH, 000001.SZ），每只股票一次工具调用。
 2. 将互不依赖的任务放在同一个子列表中进行【并行执行】。
-3. 即使只有一个任务，也请嵌套在两层列表内，例如：[['BTC_USDT']]。
+3. 即使只有一个任务，也请嵌套在两层列表内，例如：[[{"tool": "get_stock_data", "args": {...}}]]。
 4. 仅输出计划，不要有任何多余的解释。
 """
 
@@ -93,15 +102,22 @@ async def planner(state: PlanExecuteState):
     response = await planner_llm.ainvoke(messages)
     # ⭐ 关键：打印 prompt cache
     # log_llm_usage("planner", response)
-    return {"plan": response.steps}
+    return {"plan": [[task.model_dump() for task in step] for step in response.steps]}
+
+async def run_task(task: dict):
+    selected = tools_by_name.get(task["tool"])
+    if selected is None:
+        raise ValueError(f"unknown tool '{task['tool']}'")
+    return await selected.ainvoke(task.get("args") or {})
 
 async def executor(state: PlanExecuteState):
     """执行者：负责并行处理当前步骤中的所有任务"""
     current_step_tasks = state["plan"][0]
 
-    # 核心并行逻辑：使用 asyncio.gather 同时执行当前步骤的所有工具调用
-    tasks = [get_market_data.ainvoke({"pair": task}) for task in current_step_tasks]
-    results = await asyncio.gather(*tasks)
+    # 核心并行逻辑：使用 asyncio.gather 同时执行当前步骤的所有工具调用，单个失败或超时不影响其余调用
+    tasks = [run_task(task) for task in current_step_tasks]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    results = [f"Error: {result!r}" if isinstance(result, Exception) else result for result in results]
 
     step_output = f"执行步骤 {current_step_tasks} 的结果: {results}"
     return {"past_steps": [step_output], "plan": state["plan"][1:]}
@@ -141,9 +157,9 @@ app = workflow.compile()
 # --- 5. 测试运行 ---
 async def main():
     config = {"recursion_limit": 20,
-              "run_name": "BTC_GT_Parallel_Test_001" # 在 LangSmith 中显示的名称
+              "run_name": "Stock_Parallel_Test_001" # 在 LangSmith 中显示的名称
               }
-    inputs = {"input": "帮我查一下 BTC_USDT 和 GT_USDT 的价格", "past_steps": []}
+    inputs = {"input": "帮我查一下 600519.SH 和 000001.SZ 在 20240101 到 20240131 的行情和策略匹配日", "past_steps": []}
     async for event in app.astream(inputs, config):
         print(event)
         for node_name, output in event.items():
@@ -0,0 +1,127 @@
+import json
+
+# Incremental parser for the {function, params, reasoning} plan streamed by the LLM.
+# Each top-level field becomes available as soon as its value is complete, so the agent can
+# dispatch the Tushare call before the model has finished writing the reasoning.
+
+
+class PlanStreamParser:
+    def __init__(self):
+        self.buffer = ""
+        self.fields = {}
+        self.partial = {}
+        self.complete = False
+
+    def feed(self, chunk: str) -> dict:
+        """Append a streamed chunk and return the top-level fields parsed so far."""
+        self.buffer += chunk
+        self._scan()
+        return self.fields
+
+    def ready(self, *keys) -> bool:
+        return all(key in self.fields for key in keys)
+
+    def partial_string(self, key: str) -> str:
+        """Text of a string field, including the part still being streamed."""
+        if key in self.fields:
+            value = self.fields[key]
+            return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+        return self.partial.get(key, "")
+
+    def _scan(self):
+        # Re-scan the whole buffer: plans are a few hundred bytes, so this stays cheap and simple
+        text = self.buffer
+        start = text.find("{")
+        if start < 0:
+            return
+        i = start + 1
+        while i < len(text):
+            i = _skip_space(text, i)
+            if i >= len(text):
+                return
+            if text[i] == "}":
+                self.complete = True
+                return
+            if text[i] == ",":
+                i += 1
+                continue
+            if text[i] != '"':
+                return
+            key_end = _string_end(text, i)
+            if key_end < 0:
+                return
+            key = json.loads(text[i:key_end])
+            i = _skip_space(text, key_end)
+            if i >= len(text) or text[i] != ":":
+                return
+            value_start = _skip_space(text, i + 1)
+            value_end = _value_end(text, value_start)
+            if value_end < 0:
+                if value_start < len(text) and text[value_start] == '"':
+                    self.partial[key] = _decode_partial_string(text[value_start + 1:])
+                return
+            if key not in self.fields:
+                try:
+                    self.fields[key] = json.loads(text[value_start:value_end])
+                except json.JSONDecodeError:
+                    return
+            i = value_end
+
+
+def _skip_space(text: str, i: int) -> int:
+    while i < len(text) and text[i] in " \t\r\n":
+        i += 1
+    return i
+
+
+def _string_end(text: str, i: int) -> int:
+    """Index just past the closing quote of the string starting at text[i], or -1 if incomplete."""
+    i += 1
+    while i < len(text):
+        if text[i] == "\\":
+            i += 2
+            continue
+        if text[i] == '"':
+            return i + 1
+        i += 1
+    return -1
+
+
+def _value_end(text: str, i: int) -> int:
+    """Index just past the JSON value starting at text[i], or -1 if it is not complete yet."""
+    if i >= len(text):
+        return -1
+    if text[i] == '"':
+        return _string_end(text, i)
+    if text[i] in "{[":
+        depth = 0
+        while i < len(text):
+            char = text[i]
+            if char == '"':
+                i = _string_end(text, i)
+                if i < 0:
+                    return -1
+                continue
+            if char in "{[":
+                depth += 1
+            elif char in "}]":
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+            i += 1
+        return -1
+    # number / true / false / null: complete once followed by a delimiter
+    end = i
+    while end < len(text) and text[end] not in ",}] \t\r\n":
+        end += 1
+    return end if end < len(text) else -1
+
+
+def _decode_partial_string(raw: str) -> str:
+    # Drop a trailing incomplete escape sequence before decoding
+    for cut in range(0, 6):
+        try:
+            return json.loads('"' + raw[:len(raw) - cut] + '"')
+        except json.JSONDecodeError:
+            continue
+    return raw
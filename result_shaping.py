@@ -0,0 +1,231 @@
+import json
+import os
+import uuid
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, List
+
+import numpy as np
+import pandas as pd
+
+# Shapes tool results for the LLM context: summaries and statistics first, then as many rows as fit
+# the token budget in a columnar encoding ({columns, rows} instead of one dict per row). When rows
+# are dropped, the full result is kept under a handle that get_result_page() can read from later.
+# The UI keeps receiving the full result; only what goes back into a prompt is shaped.
+
+RESULT_TOKEN_BUDGET = int(os.environ.get("RESULT_TOKEN_BUDGET", "1500"))
+RESULT_STORE_SIZE = int(os.environ.get("RESULT_STORE_SIZE", "64"))
+
+OHLC_COLUMNS = ['trade_date', 'open', 'high', 'low', 'close', 'vol']
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: ~4 ASCII characters per token, one token per CJK / other non-ASCII character."""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+def dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if hasattr(value, '__dict__'):
+        return vars(value)
+    return str(value)
+
+
+class ResultStore:
+    """Keeps the most recent full results (LRU) so a truncated result can be paged through by handle."""
+
+    def __init__(self, size: int = RESULT_STORE_SIZE):
+        self.size = size
+        self._lock = Lock()
+        self._results = OrderedDict()
+
+    def put(self, value) -> str:
+        handle = f"res_{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            self._results[handle] = value
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)
+        return handle
+
+    def get(self, handle: str):
+        with self._lock:
+            if handle not in self._results:
+                raise KeyError(f"unknown or expired result handle '{handle}'")
+            self._results.move_to_end(handle)
+            return self._results[handle]
+
+
+result_store = ResultStore()
+
+
+def _round(value, digits: int = 4):
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else round(float(value), digits)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def columnar(rows: List[dict], columns: List[str] = None) -> dict:
+    """[{a: 1, b: 2}, ...] -> {columns: [a, b], rows: [[1, 2], ...]}"""
+    if columns is None:
+        columns = []
+        for row in rows:
+            columns.extend(key for key in row if key not in columns)
+    return {"columns": columns, "rows": [[_round(row.get(column)) for column in columns] for row in rows]}
+
+
+def _frame_columnar(df: pd.DataFrame) -> dict:
+    return {"columns": df.columns.tolist(),
+            "rows": [[_round(value) for value in row] for row in df.itertuples(index=False, name=None)]}
+
+
+def _as_rows(value) -> List[dict]:
+    """Objects such as Stock become their attribute dicts; dicts pass through."""
+    return [item if isinstance(item, dict) else vars(item) for item in value]
+
+
+def _fit(base: dict, encode, count: int, budget: int) -> dict:
+    """
+    Add encode(n) as base["data"] with the largest n <= count that keeps the whole result within budget.
+    """
+    def build(n):
+        return dict(base, data=encode(n), shown=n)
+
+    if estimate_tokens(dumps(build(count))) <= budget:
+        return build(count)
+    low, high = 0, count
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(dumps(build(mid))) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return build(low)
+
+
+def _ohlc_summary(df: pd.DataFrame) -> dict:
+    ordered = df.sort_values('trade_date')
+    first, last = ordered.iloc[0], ordered.iloc[-1]
+    summary = {
+        "ts_code": _round(last.get('ts_code')),
+        "bars": len(ordered),
+        "first_date": first['trade_date'],
+        "last_date": last['trade_date'],
+        "open": _round(first['open']),
+        "close": _round(last['close']),
+        "change_pct": _round((last['close'] / first['open'] - 1) * 100, 2) if first['open'] else None,
+    }
+    if 'high' in ordered:
+        summary["high"] = _round(ordered['high'].max())
+    if 'low' in ordered:
+        summary["low"] = _round(ordered['low'].min())
+    if 'vol' in ordered:
+        summary["avg_vol"] = _round(ordered['vol'].mean(), 0)
+    return summary
+
+
+def _shape_frame(df: pd.DataFrame) -> tuple:
+    if len(df) and all(column in df for column in ('trade_date', 'open', 'close')):
+        # Bars: summary plus the most recent rows, newest first (pro_bar order)
+        df = df.sort_values('trade_date', ascending=False)
+        columns = [column for column in df.columns
+                   if column in OHLC_COLUMNS or (column.startswith('ma') and not column.startswith('ma_v_'))]
+        base = {"type": "bars", "summary": _ohlc_summary(df), "total": len(df)}
+        return base, lambda n: _frame_columnar(df[columns].head(n)), len(df)
+    numeric = df.select_dtypes('number')
+    stats = {column: {"min": _round(numeric[column].min()), "max": _round(numeric[column].max()),
+                      "mean": _round(numeric[column].mean())} for column in numeric.columns}
+    base = {"type": "table", "summary": {"rows": len(df), "stats": stats}, "total": len(df)}
+    return base, lambda n: _frame_columnar(df.head(n)), len(df)
+
+
+def _shape_mapping(value: dict) -> tuple:
+    lists = [item for item in value.values() if isinstance(item, list)]
+    if value and len(lists) == len(value):
+        # {key: [items]}, e.g. {ts_code: match days}: keys with the most items first
+        ranked = sorted(value.items(), key=lambda item: -len(item[1]))
+        base = {"type": "groups", "summary": {"keys": len(value), "items": sum(len(items) for items in lists)},
+                "total": len(value)}
+        return base, lambda n: {key: items for key, items in ranked[:n]}, len(ranked)
+    items = list(value.items())
+    base = {"type": "mapping", "total": len(items)}
+    return base, lambda n: dict(items[:n]), len(items)
+
+
+def _shape_list(value: list) -> tuple:
+    if value and all(isinstance(item, (str, int, float)) for item in value):
+        # Plain values, e.g. match days: the summary keeps both ends visible even when data is cut
+        base = {"type": "values", "summary": {"count": len(value), "first": value[0], "last": value[-1]},
+                "total": len(value)}
+        return base, lambda n: value[:n], len(value)
+    rows = _as_rows(value)
+    base = {"type": "records", "total": len(rows)}
+    return base, lambda n: columnar(rows[:n]), len(rows)
+
+
+def shape_result(value: Any, budget: int = RESULT_TOKEN_BUDGET, store: bool = True) -> dict:
+    """
+    Compact, budgeted representation of a tool result for the LLM.
+    :param store: keep the full value in result_store when rows are left out
+    :return: {type, summary?, data, shown, total, handle?}; handle is set when rows were left out
+    """
+    if isinstance(value, pd.DataFrame):
+        base, encode, count = _shape_frame(value)
+    elif isinstance(value, dict):
+        base, encode, count = _shape_mapping(value)
+    elif isinstance(value, (list, tuple)):
+        base, encode, count = _shape_list(list(value))
+    else:
+        text = value if isinstance(value, str) else dumps(value)
+        # Roughly cut to the budget; strings are error messages or short answers in practice
+        limit = budget * 2
+        return {"type": "text", "data": text[:limit], "truncated": len(text) > limit}
+
+    # Reserve room for the handle so adding it cannot push the result over budget
+    shaped = _fit(dict(base, handle="res_000000000000"), encode, count, budget)
+    if store and shaped["shown"] < count:
+        shaped["handle"] = result_store.put(value)
+    else:
+        del shaped["handle"]
+    return shaped
+
+
+def shape_for_llm(value: Any, budget: int = RESULT_TOKEN_BUDGET) -> str:
+    """shape_result serialized compactly, ready to put into a prompt or a tool message."""
+    return dumps(shape_result(value, budget))
+
+
+def get_result_page(handle: str, offset: int = 0, limit: int = 50, budget: int = RESULT_TOKEN_BUDGET) -> dict:
+    """Rows [offset, offset + limit) of a stored full result, shaped to the same budget; total is the full size."""
+    value = result_store.get(handle)
+    if isinstance(value, pd.DataFrame):
+        if 'trade_date' in value:
+            value = value.sort_values('trade_date', ascending=False)
+        page = value.iloc[offset:offset + limit]
+    elif isinstance(value, dict):
+        if all(isinstance(items, list) for items in value.values()):
+            page = dict(sorted(value.items(), key=lambda item: -len(item[1]))[offset:offset + limit])
+        else:
+            page = dict(list(value.items())[offset:offset + limit])
+    else:
+        page = list(value)[offset:offset + limit]
+    return dict(shape_result(page, budget, store=False), offset=offset, total=len(value), handle=handle)
+
+
+if __name__ == "__main__":
+    from strategy_engine import _synthetic_bars
+
+    bars = _synthetic_bars(days=500, seed=0)
+    stocks = [{"ts_code": f"{i:06d}.SZ", "name": f"股票{i}"} for i in range(5000)]
+    for name, value in [("bars", bars), ("stocks", stocks), ("match_days", bars['trade_date'].tolist())]:
+        raw = estimate_tokens(dumps(value.to_dict(orient='records') if isinstance(value, pd.DataFrame) else value))
+        shaped = shape_for_llm(value)
+        print(f"{name}: ~{raw} tokens raw -> ~{estimate_tokens(shaped)} shaped")
+    print(shape_for_llm(bars, budget=300))
@@ -0,0 +1,407 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from typing import Callable, List, Optional
+
+from metrics import logger, registry
+
+# 全市场扫描任务队列：任务参数、进度和结果都存在 SQLite 里，由后台线程池执行
+# 每处理完一批股票就写入结果，结果表同时作为断点：进程崩溃后重新启动，任务从未完成的股票继续
+SCAN_JOB_DB = os.environ.get("SCAN_JOB_DB", "data/jobs.sqlite")
+SCAN_WORKERS = int(os.environ.get("SCAN_WORKERS", "2"))
+# 每处理多少只股票写一次断点并检查是否被取消（面板模式为每拉取多少个交易日）
+CHECKPOINT_EVERY = 20
+# 任务租约（秒）：执行中的 worker 每隔 1/3 租约续期，租约过期的 running 任务视为执行进程已经不在，重新排队
+SCAN_JOB_LEASE = float(os.environ.get("SCAN_JOB_LEASE", "60"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    matched INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    owner_pid INTEGER,
+    owner_boot TEXT,
+    lease_until REAL,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_results (
+    job_id TEXT NOT NULL,
+    ts_code TEXT NOT NULL,
+    name TEXT,
+    match_days TEXT NOT NULL,
+    PRIMARY KEY (job_id, ts_code)
+);
+"""
+
+# 任务状态：queued -> running -> done / failed / cancelled；崩溃时停在 running 的任务租约过期后重新放回 queued
+# 共享同一个数据库的可能是不同容器里的进程，PID 无法判断对方是否存活，只看租约
+FINISHED = ('done', 'failed', 'cancelled')
+
+# 本进程的标识，记录在它领取的任务上：续期和结束任务时只改自己领取的任务
+BOOT_ID = uuid.uuid4().hex
+
+
+class JobCancelled(Exception):
+    """ 任务在执行过程中被取消 """
+
+
+def _now() -> str:
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class JobQueue:
+    def __init__(self, path: str = SCAN_JOB_DB, lease: float = SCAN_JOB_LEASE):
+        self.path = path
+        self.lease = lease
+        self._lock = Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.executescript(_SCHEMA)
+            columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            # 旧版本创建的数据库没有这些列
+            for column, column_type in (('owner_boot', 'TEXT'), ('lease_until', 'REAL')):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+    def submit(self, params: dict) -> str:
+        """ 提交任务，返回 job_id """
+        job_id = uuid.uuid4().hex[:12]
+        now = _now()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, params, status, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, json.dumps(params, ensure_ascii=False), now, now))
+        registry.inc("scan_jobs_total", status="queued")
+        return job_id
+
+    def claim(self) -> Optional[dict]:
+        """
+        取出最早的排队任务并标记为 running，没有任务时返回 None
+        界面进程和 python scan_jobs.py worker 可能同时抢同一个任务：UPDATE 只在任务仍为 queued 时生效，
+        没抢到就换下一个
+        """
+        while True:
+            with self._lock, self._conn:
+                row = self._conn.execute(
+                    "SELECT job_id FROM jobs WHERE status='queued' ORDER BY created_at LIMIT 1").fetchone()
+                if row is None:
+                    return None
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status='running', owner_pid=?, owner_boot=?, lease_until=?, updated_at=? "
+                    "WHERE job_id=? AND status='queued'",
+                    (os.getpid(), BOOT_ID, time.time() + self.lease, _now(), row['job_id']))
+            if cursor.rowcount:
+                return self.get(row['job_id'])
+
+    def renew(self, job_id: str) -> bool:
+        """ 续期本进程领取的任务，任务已结束或已被其它进程接手时返回 False """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until=? WHERE job_id=? AND status='running' AND owner_boot=?",
+                (time.time() + self.lease, job_id, BOOT_ID))
+        return bool(cursor.rowcount)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id=?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        return job
+
+    def list_jobs(self, limit: int = 20) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, status, done, total, matched, failed, created_at, updated_at "
+                "FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def checkpoint(self, job_id: str) -> set:
+        """ 已处理过的股票（包括没有匹配的），恢复任务时跳过 """
+        with self._lock:
+            rows = self._conn.execute("SELECT ts_code FROM job_results WHERE job_id=?", (job_id,)).fetchall()
+        return {row[0] for row in rows}
+
+    def record(self, job_id: str, items: List[tuple], failed: int = None):
+        """
+        写入一批结果并推进进度，同一事务内完成，保证断点与进度一致
+        :param items: [(ts_code, name, 匹配日期列表)]
+        """
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO job_results VALUES (?, ?, ?, ?)",
+                [(job_id, ts_code, name, json.dumps(days)) for ts_code, name, days in items])
+            self._conn.execute(
+                "UPDATE jobs SET done=(SELECT COUNT(*) FROM job_results WHERE job_id=?), "
+                "matched=(SELECT COUNT(*) FROM job_results WHERE job_id=? AND match_days!='[]'), "
+                "failed=COALESCE(?, failed), updated_at=? WHERE job_id=?",
+                (job_id, job_id, failed, _now(), job_id))
+
+    def set_total(self, job_id: str, total: int):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET total=?, updated_at=? WHERE job_id=?", (total, _now(), job_id))
+
+    def finish(self, job_id: str, status: str, error: str = None) -> bool:
+        """ 结束本进程领取的任务；租约过期后任务已被重新排队或被其它进程接手时不做修改，返回 False """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status=?, error=?, lease_until=NULL, updated_at=? "
+                "WHERE job_id=? AND status='running' AND owner_boot=?",
+                (status, error, _now(), job_id, BOOT_ID))
+        if not cursor.rowcount:
+            logger.warning("scan job %s was taken over before it finished, %s not recorded", job_id, status)
+            return False
+        registry.inc("scan_jobs_total", status=status)
+        return True
+
+    def cancel(self, job_id: str) -> bool:
+        """ 排队中的任务直接取消；运行中的任务打上标记，由执行线程在下一个断点停止 """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status='cancelled', updated_at=? WHERE job_id=? AND status='queued'",
+                (_now(), job_id))
+            if cursor.rowcount:
+                return True
+            cursor = self._conn.execute(
+                "UPDATE jobs SET cancel_requested=1, updated_at=? WHERE job_id=? AND status='running'",
+                (_now(), job_id))
+            return bool(cursor.rowcount)
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE job_id=?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def results(self, job_id: str) -> List[dict]:
+        """ 有匹配的股票 """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ts_code, name, match_days FROM job_results WHERE job_id=? AND match_days!='[]' "
+                "ORDER BY ts_code", (job_id,)).fetchall()
+        return [{'ts_code': row[0], 'name': row[1], 'match_days': json.loads(row[2])} for row in rows]
+
+    def recover(self) -> int:
+        """
+        把租约已经过期（执行进程崩溃或被停止）的 running 任务放回队列，返回恢复的任务数
+        已经请求取消的直接标记为 cancelled
+        """
+        with self._lock, self._conn:
+            stale = [row[0] for row in self._conn.execute(
+                "SELECT job_id FROM jobs WHERE status='running' AND (lease_until IS NULL OR lease_until < ?)",
+                (time.time(),))]
+            self._conn.executemany(
+                "UPDATE jobs SET status=CASE WHEN cancel_requested THEN 'cancelled' ELSE 'queued' END, "
+                "lease_until=NULL, updated_at=? "
+                "WHERE job_id=? AND status='running'", [(_now(), job_id) for job_id in stale])
+        if stale:
+            logger.info("re-queued %d interrupted scan jobs: %s", len(stale), stale)
+        return len(stale)
+
+
+def default_scan_params(start_date: str = None, end_date: str = None, freq: str = 'D', mode: str = 'per_stock',
+                        strategy: str = None, strategy_params: dict = None, ma: list = None) -> dict:
+    """ 任务参数，缺省为最近两年 """
+    current_date = datetime.now()
+    params = {
+        'start_date': start_date or (current_date - timedelta(days=365 * 2)).strftime('%Y%m%d'),
+        'end_date': end_date or current_date.strftime('%Y%m%d'),
+        'freq': freq,
+        'mode': mode,
+    }
+    if strategy:
+        params['strategy'] = strategy
+    if strategy_params:
+        params['strategy_params'] = strategy_params
+    if ma:
+        params['ma'] = ma
+    return params
+
+
+def run_scan_job(queue: JobQueue, job: dict):
+    """ 执行一个扫描任务：跳过断点中已处理的股票，逐批写入结果，在断点处响应取消 """
+    from tushare_tools import get_all_live_stocks, match_days_for_market, scan_match_days
+
+    job_id = job['job_id']
+    params = dict(job['params'])
+    mode = params.pop('mode', 'per_stock')
+    stocks = get_all_live_stocks()
+    processed = queue.checkpoint(job_id)
+    pending = [stock for stock in stocks if stock.ts_code not in processed]
+    queue.set_total(job_id, len(stocks))
+    logger.info("scan job %s: %d/%d stocks left, mode=%s", job_id, len(pending), len(stocks), mode)
+
+    def check_cancel():
+        if queue.is_cancel_requested(job_id):
+            raise JobCancelled(job_id)
+
+    if mode in ('batch', 'parallel'):
+        # 面板模式一次算完全部股票，断点粒度是整个任务；拉取面板时每 CHECKPOINT_EVERY 个交易日检查一次取消，
+        # 剩余请求随之取消
+        def progress(done, total):
+            if done % CHECKPOINT_EVERY == 0:
+                check_cancel()
+
+        check_cancel()
+        match_days = match_days_for_market(mode=mode, ts_codes=[stock.ts_code for stock in pending],
+                                           progress=progress, **params)
+        check_cancel()
+        queue.record(job_id, [(stock.ts_code, stock.name, match_days.get(stock.ts_code, [])) for stock in pending])
+        return
+
+    # 与 count_avg_stocks 相同：失败的股票在最后再补跑一轮，仍失败的不写断点，恢复任务时会重试
+    failed = []
+    for _ in range(2):
+        batch = []
+        failed = []
+        by_code = {stock.ts_code: stock for stock in pending}
+        for progress in scan_match_days(stocks=pending, **params):
+            if progress['error']:
+                failed.append(by_code[progress['ts_code']])
+                continue
+            batch.append((progress['ts_code'], progress['name'], progress['match_days']))
+            if len(batch) >= CHECKPOINT_EVERY:
+                queue.record(job_id, batch, failed=len(failed))
+                batch = []
+                check_cancel()
+        queue.record(job_id, batch, failed=len(failed))
+        pending = failed
+        if not pending:
+            break
+    if failed:
+        raise RuntimeError(f"{len(failed)} stocks failed: {[stock.ts_code for stock in failed[:20]]}")
+
+
+class WorkerPool:
+    """
+    后台线程池，从队列中领取任务执行
+    :param runner: runner(queue, job)，正常返回即任务完成，抛出 JobCancelled 表示已取消
+    """
+
+    def __init__(self, queue: JobQueue, runner: Callable = run_scan_job, workers: int = SCAN_WORKERS,
+                 poll_interval: float = 1.0):
+        self.queue = queue
+        self.runner = runner
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._stop = Event()
+        self._threads = []
+
+    def start(self):
+        self.queue.recover()
+        for i in range(self.workers):
+            thread = Thread(target=self._loop, name=f"scan-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, wait: bool = True):
+        self._stop.set()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            job = self.queue.claim()
+            if job is None:
+                # 空闲时接手其它进程留下的、租约已过期的任务
+                self.queue.recover()
+                self._stop.wait(self.poll_interval)
+                continue
+            self.run(job)
+
+    def run(self, job: dict):
+        job_id = job['job_id']
+        t_start = time.time()
+        # 任务执行期间在后台续租，面板模式一次计算可能持续很久，不能依赖断点续期
+        finished = Event()
+        heartbeat = Thread(target=self._heartbeat, args=(job_id, finished), name=f"scan-lease-{job_id}", daemon=True)
+        heartbeat.start()
+        try:
+            self.runner(self.queue, job)
+        except JobCancelled:
+            status, error = 'cancelled', None
+        except Exception as e:
+            logger.exception("scan job %s failed", job_id)
+            status, error = 'failed', str(e)
+        else:
+            # 最后一批处理完之后才收到的取消请求不再生效
+            status, error = 'done', None
+        finished.set()
+        heartbeat.join()
+        self.queue.finish(job_id, status, error)
+        logger.info("scan job %s finished in %.1fs", job_id, time.time() - t_start)
+
+    def _heartbeat(self, job_id: str, finished: Event):
+        while not finished.wait(self.queue.lease / 3):
+            if not self.queue.renew(job_id):
+                logger.warning("scan job %s: lease lost, another worker may have taken it over", job_id)
+                return
+
+
+def format_job(job: Optional[dict]) -> str:
+    """ 界面上展示的一行任务状态 """
+    if job is None:
+        return "Job not found"
+    text = f"Job {job['job_id']}: {job['status']}, {job['done']}/{job['total']} stocks, {job['matched']} matched"
+    if job.get('failed'):
+        text += f", {job['failed']} failed"
+    if job.get('cancel_requested') and job['status'] == 'running':
+        text += " (cancelling)"
+    if job.get('error'):
+        text += f"\n{job['error']}"
+    return text
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Submit, inspect or run market scan jobs")
+    parser.add_argument('command', choices=['submit', 'status', 'cancel', 'results', 'worker'])
+    parser.add_argument('job_id', nargs='?')
+    parser.add_argument('--start')
+    parser.add_argument('--end')
+    parser.add_argument('--freq', default='D')
+    parser.add_argument('--mode', default='per_stock', choices=['per_stock', 'batch', 'parallel'])
+    parser.add_argument('--strategy')
+    args = parser.parse_args()
+
+    queue = JobQueue()
+    if args.command == 'submit':
+        print(queue.submit(default_scan_params(args.start, args.end, args.freq, args.mode, args.strategy)))
+    elif args.command == 'status':
+        jobs = [queue.get(args.job_id)] if args.job_id else queue.list_jobs()
+        for job in jobs:
+            print(format_job(job))
+    elif args.command == 'cancel':
+        print("cancelled" if queue.cancel(args.job_id) else "job is not queued or running")
+    elif args.command == 'results':
+        print(json.dumps(queue.results(args.job_id), ensure_ascii=False, indent=2))
+    else:
+        # 前台运行 worker，Ctrl+C 退出；未完成的任务下次启动时从断点继续
+        pool = WorkerPool(queue).start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pool.stop(wait=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import argparse
+import os
+import sqlite3
+from datetime import datetime
+from threading import Lock
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from bar_store import shift_date
+
+# 预计算信号索引：对全市场每只股票、每个交易日执行 match_policy，结果按日期和 ts_code 建索引
+# 查询 get_stock_match_days 时直接查表，不再临时拉数据计算
+SIGNAL_INDEX_PATH = os.environ.get("SIGNAL_INDEX_PATH", "data/signals.sqlite")
+DEFAULT_STRATEGY = 'match_policy'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS signals (
+    strategy TEXT NOT NULL,
+    freq TEXT NOT NULL,
+    ts_code TEXT NOT NULL,
+    trade_date TEXT NOT NULL,
+    PRIMARY KEY (strategy, freq, ts_code, trade_date)
+);
+CREATE INDEX IF NOT EXISTS signals_by_date ON signals (strategy, freq, trade_date);
+CREATE TABLE IF NOT EXISTS signal_coverage (
+    strategy TEXT NOT NULL,
+    freq TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    PRIMARY KEY (strategy, freq)
+);
+"""
+
+
+class SignalIndex:
+    """
+    SQLite 信号索引
+    覆盖区间的结束日是最后一个已确认的信号日：策略需要后一天的 K 线，最新一天要等下一根 K 线到达才能确认
+    """
+
+    def __init__(self, path: str = SIGNAL_INDEX_PATH):
+        self.path = path
+        self._lock = Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.executescript(_SCHEMA)
+
+    def coverage(self, freq: str = 'D', strategy: str = DEFAULT_STRATEGY):
+        """ 返回已索引的 (start_date, end_date)，没有时为 None """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT start_date, end_date FROM signal_coverage WHERE strategy=? AND freq=?",
+                (strategy, freq)).fetchone()
+
+    def covers(self, start_date: str, end_date: str, freq: str = 'D', strategy: str = DEFAULT_STRATEGY) -> bool:
+        """
+        结束日晚于覆盖区间的结束日时，最多允许相差一根 K 线：覆盖结束日之后的最新一根 K 线还没有下一根，
+        实时计算同样无法确认它；相差更多说明 update 没有按时运行，返回 False 让调用方实时计算
+        """
+        coverage = self.coverage(freq, strategy)
+        if coverage is None or start_date < coverage[0]:
+            return False
+        if end_date <= coverage[1]:
+            return True
+        return bars_between(coverage[1], min(end_date, datetime.now().strftime('%Y%m%d')), freq) <= 1
+
+    def write(self, match_days: Dict[str, list], start_date: str, end_date: str,
+              freq: str = 'D', strategy: str = DEFAULT_STRATEGY):
+        """
+        写入 [start_date, end_date] 内的全部信号（先删除该区间的旧结果），并合并覆盖区间
+        :param match_days: {ts_code: 信号日期列表}
+        """
+        rows = [(strategy, freq, ts_code, trade_date)
+                for ts_code, days in match_days.items() for trade_date in days
+                if start_date <= trade_date <= end_date]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM signals WHERE strategy=? AND freq=? AND trade_date BETWEEN ? AND ?",
+                               (strategy, freq, start_date, end_date))
+            self._conn.executemany("INSERT OR REPLACE INTO signals VALUES (?, ?, ?, ?)", rows)
+            coverage = self._conn.execute(
+                "SELECT start_date, end_date FROM signal_coverage WHERE strategy=? AND freq=?",
+                (strategy, freq)).fetchone()
+            # 只有与已有区间相连时才合并，否则以新区间为准
+            if coverage is not None and start_date <= shift_date(coverage[1], 1) and coverage[0] <= end_date:
+                start_date, end_date = min(start_date, coverage[0]), max(end_date, coverage[1])
+            self._conn.execute("INSERT OR REPLACE INTO signal_coverage VALUES (?, ?, ?, ?)",
+                               (strategy, freq, start_date, end_date))
+
+    def lookup(self, start_date: str, end_date: str, ts_code: str = None, freq: str = 'D',
+               strategy: str = DEFAULT_STRATEGY):
+        """
+        查询区间内的信号
+        :return: 指定 ts_code 时为日期列表（升序），否则为 {ts_code: 日期列表}
+        """
+        with self._lock:
+            if ts_code is not None:
+                rows = self._conn.execute(
+                    "SELECT trade_date FROM signals WHERE strategy=? AND freq=? AND ts_code=? "
+                    "AND trade_date BETWEEN ? AND ? ORDER BY trade_date",
+                    (strategy, freq, ts_code, start_date, end_date)).fetchall()
+                return [row[0] for row in rows]
+            rows = self._conn.execute(
+                "SELECT ts_code, trade_date FROM signals WHERE strategy=? AND freq=? "
+                "AND trade_date BETWEEN ? AND ? ORDER BY ts_code, trade_date",
+                (strategy, freq, start_date, end_date)).fetchall()
+        result = {}
+        for code, trade_date in rows:
+            result.setdefault(code, []).append(trade_date)
+        return result
+
+
+def bars_between(start_date: str, end_date: str, freq: str = 'D') -> int:
+    """
+    (start_date, end_date] 内最多可能有几根 K 线：日线按工作日计，周线/月线按跨过的周/月计
+    不考虑节假日，结果只会偏多，据此判断索引是否过期时偏向实时计算
+    """
+    if end_date <= start_date:
+        return 0
+    if freq == 'D':
+        return int(np.busday_count(pd.Timestamp(shift_date(start_date, 1)).date(),
+                                   pd.Timestamp(shift_date(end_date, 1)).date()))
+    period = 'W' if freq == 'W' else 'M'
+    return pd.Period(end_date, period).ordinal - pd.Period(start_date, period).ordinal
+
+
+def confirmed_end(trade_dates: List[str]) -> Optional[str]:
+    """ 最后一个有下一根 K 线的日期，即最后一个可确认信号的日期 """
+    return trade_dates[-2] if len(trade_dates) >= 2 else None
+
+
+# 向前多加载的自然日数，保证区间第一天也有前一根 K 线
+_PREVIOUS_BAR_DAYS = {'D': 10, 'W': 21, 'M': 62}
+
+
+def build_index(index: SignalIndex, pro, start_date: str, end_date: str, freq: str = 'D', scheduler=None,
+                strategy_names: List[str] = None):
+    """
+    按交易日批量拉取全市场面板，一次性执行全部策略，写入 [start_date, 最后确认日] 的信号
+    多个策略共用同一份面板和派生列，增加策略不需要额外拉数据
+    """
+    from market_panel import load_market_panel
+    from strategies import match_days_from_panel
+
+    strategy_names = strategy_names or [DEFAULT_STRATEGY]
+    load_start = shift_date(start_date, -_PREVIOUS_BAR_DAYS.get(freq, 10))
+    panel = load_market_panel(pro, load_start, end_date, freq=freq, scheduler=scheduler)
+    last = confirmed_end(panel['close'].index.tolist())
+    if last is None or last < start_date:
+        return None
+    for strategy, match_days in match_days_from_panel(panel, strategy_names).items():
+        index.write(match_days, start_date, last, freq, strategy)
+    return start_date, last
+
+
+def update_index(index: SignalIndex, pro, end_date: str = None, freq: str = 'D', scheduler=None,
+                 strategy_names: List[str] = None):
+    """
+    增量更新：只写入上次最后确认日之后的日期
+    策略只计算新增的几天，但均线仍需回看约 max(ma) 根 K 线的历史
+    """
+    end_date = end_date or datetime.now().strftime('%Y%m%d')
+    strategy_names = strategy_names or [DEFAULT_STRATEGY]
+    coverages = [index.coverage(freq, strategy) for strategy in strategy_names]
+    if None in coverages:
+        raise ValueError("signal index is empty, run build first")
+    # 从覆盖最少的策略之后开始补，其它策略重写的几天结果相同
+    start_date = shift_date(min(coverage[1] for coverage in coverages), 1)
+    return build_index(index, pro, start_date, end_date, freq, scheduler, strategy_names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the precomputed signal index")
+    parser.add_argument('command', choices=['build', 'update'])
+    parser.add_argument('--start', help="YYYYMMDD, required for build")
+    parser.add_argument('--end', default=datetime.now().strftime('%Y%m%d'))
+    parser.add_argument('--freq', default='D')
+    parser.add_argument('--strategy', action='append', dest='strategies',
+                        help="strategy name from strategies.STRATEGIES, repeatable (default: match_policy)")
+    args = parser.parse_args()
+
+    from tushare_tools import get_pro, scheduler, signal_index
+    pro = get_pro()
+    if args.command == 'build':
+        covered = build_index(signal_index, pro, args.start, args.end, args.freq, scheduler, args.strategies)
+    else:
+        covered = update_index(signal_index, pro, args.end, args.freq, scheduler, args.strategies)
+    print("indexed range:", covered)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import asyncio
+import inspect
+import json
+from concurrent.futures import Future
+from functools import wraps
+from threading import Lock
+from typing import Callable, Hashable
+
+from metrics import registry
+
+# Request coalescing: concurrent identical calls share one in-flight execution instead of each
+# hitting Tushare / DeepSeek. Only calls that overlap in time are merged; nothing is cached after
+# the leader finishes (that is what bar_store and llm_cache are for).
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers arriving while a call with the same key is in
+    flight wait for it and get its result (or its exception). Works across threads and event loops:
+    the in-flight call is tracked as a concurrent.futures.Future, which asyncio callers await through
+    asyncio.wrap_future.
+    :param clone: applied to the shared result for each waiting caller (and for the leader when anyone
+                  waited), e.g. DataFrame.copy, so that callers mutating their result do not affect each other
+    """
+
+    def __init__(self, name: str, clone: Callable = None):
+        self.name = name
+        self.clone = clone
+        self._lock = Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, key: Hashable):
+        """Return (future, is_leader)."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                # [future, number of waiters]
+                call = self._calls[key] = [Future(), 0]
+                self.leaders += 1
+                leader = True
+            else:
+                call[1] += 1
+                self.coalesced += 1
+                leader = False
+            future = call[0]
+        registry.inc("singleflight_calls_total", result="leader" if leader else "coalesced", call=self.name,
+                      help="Calls that ran (leader) or waited on an identical in-flight call (coalesced)")
+        return future, leader
+
+    def _finish(self, key: Hashable, future: Future, result=None, error: BaseException = None) -> int:
+        """Publish the outcome to the waiters; returns how many there were."""
+        with self._lock:
+            waiters = self._calls.pop(key)[1]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+        return waiters
+
+    def _shared(self, result):
+        return self.clone(result) if self.clone is not None else result
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs):
+        future, leader = self._join(key)
+        if not leader:
+            return self._shared(future.result())
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        # Waiters clone the published object, so the leader must not hand out that same object
+        return self._shared(result) if self._finish(key, future, result) else result
+
+    async def ado(self, key: Hashable, func: Callable, *args, **kwargs):
+        """Async variant: func is a coroutine function."""
+        future, leader = self._join(key)
+        if not leader:
+            return self._shared(await asyncio.wrap_future(future))
+        try:
+            result = await func(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        return self._shared(result) if self._finish(key, future, result) else result
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.leaders + self.coalesced
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls),
+                    "coalesce_rate": self.coalesced / total if total else 0.0}
+
+
+def call_key(func: Callable, args: tuple, kwargs: dict) -> str:
+    """Key from the bound arguments with defaults applied, so f(x) and f(x, freq='D') coalesce."""
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    return json.dumps(bound.arguments, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def single_flight(name: str = None, key: Callable = None, clone: Callable = None):
+    """
+    Decorator form. key(*args, **kwargs) builds the coalescing key; by default all bound arguments.
+    Coroutine functions get an async wrapper. The SingleFlight is exposed as wrapper.flight.
+    """
+    def decorator(func):
+        flight = SingleFlight(name or func.__name__, clone)
+        make_key = key or (lambda *args, **kwargs: call_key(func, args, kwargs))
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await flight.ado(make_key(*args, **kwargs), func, *args, **kwargs)
+            async_wrapper.flight = flight
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return flight.do(make_key(*args, **kwargs), func, *args, **kwargs)
+        wrapper.flight = flight
+        return wrapper
+    return decorator
@@ -0,0 +1,387 @@
+import inspect
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from strategy_engine import DEFAULT_MA, is_up, moving_averages_in_range, put_mask, take_bars, trading_order, volume_ratios
+
+# 声明式策略：规则对象可以用 & | ~ 组合，并可前后平移到前一天 / 后一天，最终都编译成整列的布尔运算
+# 多个策略共用同一份 BarColumns，上涨、量比、均线区间等派生列只计算一次，增加策略不需要额外拉数据
+# 数组约定与 strategy_engine 相同：第 0 维为时间（由旧到新），一维为单只股票，二维为 (日期 × 股票) 面板
+
+
+def _as_float(values) -> np.ndarray:
+    """ 浮点数组（包括 panel_store 的 float32 memmap 视图）原样使用，不复制 """
+    values = np.asarray(values)
+    return values if values.dtype.kind == 'f' else values.astype(float)
+
+
+class BarColumns:
+    """
+    策略求值的上下文：原始列 + 按需计算并缓存的派生列
+    :param arrays: {'open', 'close', 'pre_close', 'vol', 'ma5', ...} -> 数组
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], ma: list = DEFAULT_MA, order=None):
+        self.arrays = arrays
+        self.ma = list(ma)
+        # strategy_engine.trading_order：面板上逐只股票跳过停牌日，列在首次使用时按它重排
+        self.order = order
+        self._cache = {}
+
+    def _cached(self, key, compute: Callable):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def column(self, name: str) -> np.ndarray:
+        if name not in self.arrays:
+            raise KeyError(f"unknown column '{name}', available: {sorted(self.arrays)}")
+        return self._cached(('column', name), lambda: _as_float(take_bars(self.arrays[name], self.order)))
+
+    def moving_average(self, window: int) -> np.ndarray:
+        """ ma{window} 列；数据中没有预先计算该均线时抛出 ValueError，并列出已有的均线 """
+        name = f'ma{window}'
+        if name not in self.arrays:
+            windows = sorted(int(key[2:]) for key in self.arrays if key.startswith('ma') and key[2:].isdigit())
+            raise ValueError(f"moving average window {window} is not available, precomputed windows: {windows} "
+                             f"(add {window} to ma to compute it)")
+        return self.column(name)
+
+    @property
+    def shape(self):
+        return self.column('close').shape
+
+    def up(self) -> np.ndarray:
+        return self._cached('up', lambda: is_up(self.column('open'), self.column('close'), self.column('pre_close')))
+
+    def volume_ratios(self):
+        return self._cached('volume_ratios', lambda: volume_ratios(self.column('vol')))
+
+    def ma_in_range_count(self, windows: tuple) -> np.ndarray:
+        """ 落在当天 K 线范围内的均线条数 """
+        def compute():
+            moving_averages = np.stack([self.moving_average(days) for days in windows])
+            return moving_averages_in_range(self.column('open'), self.column('close'), self.column('pre_close'),
+                                            moving_averages).sum(axis=0)
+        return self._cached(('ma_in_range_count', windows), compute)
+
+
+class Rule:
+    """ 规则基类，evaluate 返回与时间维同形状的布尔数组 """
+
+    def evaluate(self, columns: BarColumns) -> np.ndarray:
+        raise NotImplementedError
+
+    def __and__(self, other: 'Rule') -> 'Rule':
+        return All(self, other)
+
+    def __or__(self, other: 'Rule') -> 'Rule':
+        return Any(self, other)
+
+    def __invert__(self) -> 'Rule':
+        return Not(self)
+
+    def shift(self, offset: int) -> 'Rule':
+        """ 用 offset 天之后（负数为之前）的结果作为当天的结果，越界处为 False """
+        return Shift(self, offset)
+
+    def prev(self) -> 'Rule':
+        return self.shift(-1)
+
+    def next(self) -> 'Rule':
+        return self.shift(1)
+
+
+class All(Rule):
+    def __init__(self, *rules: Rule):
+        self.rules = rules
+
+    def evaluate(self, columns):
+        result = self.rules[0].evaluate(columns).copy()
+        for rule in self.rules[1:]:
+            result &= rule.evaluate(columns)
+        return result
+
+    def __repr__(self):
+        return "(" + " & ".join(map(repr, self.rules)) + ")"
+
+
+class Any(Rule):
+    def __init__(self, *rules: Rule):
+        self.rules = rules
+
+    def evaluate(self, columns):
+        result = self.rules[0].evaluate(columns).copy()
+        for rule in self.rules[1:]:
+            result |= rule.evaluate(columns)
+        return result
+
+    def __repr__(self):
+        return "(" + " | ".join(map(repr, self.rules)) + ")"
+
+
+class Not(Rule):
+    def __init__(self, rule: Rule):
+        self.rule = rule
+
+    def evaluate(self, columns):
+        return ~self.rule.evaluate(columns)
+
+    def __repr__(self):
+        return f"~{self.rule!r}"
+
+
+class Shift(Rule):
+    def __init__(self, rule: Rule, offset: int):
+        self.rule = rule
+        self.offset = offset
+
+    def evaluate(self, columns):
+        values = self.rule.evaluate(columns)
+        result = np.zeros_like(values, dtype=bool)
+        if self.offset < 0:
+            result[-self.offset:] = values[:self.offset]
+        elif self.offset > 0:
+            result[:-self.offset] = values[self.offset:]
+        else:
+            result[...] = values
+        return result
+
+    def __repr__(self):
+        return f"{self.rule!r}.shift({self.offset})"
+
+
+class Up(Rule):
+    """ 当天上涨：收盘价高于昨收，或高于开盘价 """
+
+    def evaluate(self, columns):
+        return columns.up()
+
+    def __repr__(self):
+        return "Up()"
+
+
+class VolumeRatio(Rule):
+    """ 当天成交量是前一天 / 后一天的 threshold 倍以上，side 为 'pre'、'next' 或 'both' """
+
+    def __init__(self, threshold: float = 3, side: str = 'both'):
+        if side not in ('pre', 'next', 'both'):
+            raise ValueError(f"side must be 'pre', 'next' or 'both', got {side!r}")
+        self.threshold = threshold
+        self.side = side
+
+    def evaluate(self, columns):
+        pre_ratio, next_ratio = columns.volume_ratios()
+        if self.side == 'pre':
+            return pre_ratio > self.threshold
+        if self.side == 'next':
+            return next_ratio > self.threshold
+        return (pre_ratio > self.threshold) & (next_ratio > self.threshold)
+
+    def __repr__(self):
+        return f"VolumeRatio({self.threshold}, side={self.side!r})"
+
+
+class MaInRange(Rule):
+    """ 至少 min_count 条均线落在当天 K 线范围内，min_count 为 None 时要求全部均线 """
+
+    def __init__(self, min_count: int = None, windows: list = None):
+        self.min_count = min_count
+        self.windows = windows
+
+    def evaluate(self, columns):
+        windows = tuple(self.windows or columns.ma)
+        count = columns.ma_in_range_count(windows)
+        return count >= (len(windows) if self.min_count is None else self.min_count)
+
+    def __repr__(self):
+        return f"MaInRange({self.min_count}, windows={self.windows})"
+
+
+class Column:
+    """
+    列表达式，支持四则运算，与数字或其它列比较时得到规则
+    例如 Column('close') > Column('ma20') * 1.02
+    """
+
+    def __init__(self, name: str = None, compute: Callable = None, text: str = None):
+        self._compute = compute or (lambda columns: columns.column(name))
+        self.text = text or name
+
+    def values(self, columns: BarColumns) -> np.ndarray:
+        return self._compute(columns)
+
+    def _binary(self, other, op, symbol: str) -> 'Column':
+        other_values = other.values if isinstance(other, Column) else (lambda columns: other)
+        return Column(compute=lambda columns: op(self.values(columns), other_values(columns)),
+                      text=f"({self.text} {symbol} {getattr(other, 'text', other)})")
+
+    def __add__(self, other):
+        return self._binary(other, np.add, '+')
+
+    def __sub__(self, other):
+        return self._binary(other, np.subtract, '-')
+
+    def __mul__(self, other):
+        return self._binary(other, np.multiply, '*')
+
+    def __truediv__(self, other):
+        return self._binary(other, np.divide, '/')
+
+    def _compare(self, other, op, symbol: str) -> 'Compare':
+        expression = self._binary(other, op, symbol)
+        return Compare(expression)
+
+    def __gt__(self, other):
+        return self._compare(other, np.greater, '>')
+
+    def __ge__(self, other):
+        return self._compare(other, np.greater_equal, '>=')
+
+    def __lt__(self, other):
+        return self._compare(other, np.less, '<')
+
+    def __le__(self, other):
+        return self._compare(other, np.less_equal, '<=')
+
+
+def MovingAverage(window: int) -> Column:
+    """ 均线列，例如 Column('close') > MovingAverage(20)；窗口没有预先计算时求值抛出 ValueError """
+    return Column(compute=lambda columns: columns.moving_average(window), text=f'ma{window}')
+
+
+class Compare(Rule):
+    """ 由 Column 比较得到的规则，NaN 参与比较时为 False """
+
+    def __init__(self, expression: Column):
+        self.expression = expression
+
+    def evaluate(self, columns):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.asarray(self.expression.values(columns), dtype=bool)
+
+    def __repr__(self):
+        return self.expression.text
+
+
+def three_up_days() -> Rule:
+    """ 前一天、当天、后一天均上涨 """
+    return Up().prev() & Up() & Up().next()
+
+
+# 策略注册表：名称 -> (构造函数, 说明)，构造函数的关键字参数即可调的阈值，默认值就是策略默认参数
+def _match_policy(volume_ratio: float = 3, min_ma_in_range: int = 4) -> Rule:
+    return three_up_days() & VolumeRatio(volume_ratio) & MaInRange(min_ma_in_range)
+
+
+def _all_ma_in_range(volume_ratio: float = 3) -> Rule:
+    return three_up_days() & VolumeRatio(volume_ratio) & MaInRange()
+
+
+def _all_ma_in_range_pre_or_cur(volume_ratio: float = 3) -> Rule:
+    return three_up_days() & VolumeRatio(volume_ratio) & (MaInRange().prev() | MaInRange())
+
+
+def _volume_breakout(volume_ratio: float = 3) -> Rule:
+    return three_up_days() & VolumeRatio(volume_ratio)
+
+
+def _close_above_ma(window: int = 20, margin: float = 0.0) -> Rule:
+    if isinstance(window, bool) or not isinstance(window, int) or window <= 0:
+        raise ValueError(f"window must be a positive integer, got {window!r}")
+    return Up() & (Column('close') > MovingAverage(window) * (1 + margin))
+
+
+STRATEGIES = {
+    'match_policy': (_match_policy,
+                     "3 up days, volume > volume_ratio x both neighbours, >= min_ma_in_range MAs inside the bar"),
+    'all_ma_in_range': (_all_ma_in_range,
+                        "3 up days, volume > volume_ratio x both neighbours, every MA inside the bar"),
+    'all_ma_in_range_pre_or_cur': (_all_ma_in_range_pre_or_cur,
+                                   "like all_ma_in_range, but every MA inside the previous or the current bar"),
+    'volume_breakout': (_volume_breakout, "3 up days, volume > volume_ratio x both neighbours, no MA condition"),
+    'close_above_ma': (_close_above_ma, "up day closing above ma{window} by at least margin (fraction)"),
+}
+
+
+def strategy_params(name: str) -> dict:
+    """ 策略可调参数及默认值 """
+    factory, _ = STRATEGIES[name]
+    return {param.name: param.default for param in inspect.signature(factory).parameters.values()}
+
+
+def describe_strategies() -> List[dict]:
+    """ 列出全部策略、说明和默认参数，供 LLM 选择 """
+    return [{'name': name, 'description': description, 'params': strategy_params(name)}
+            for name, (_, description) in STRATEGIES.items()]
+
+
+def build_strategy(name: str, params: dict = None) -> Rule:
+    if name not in STRATEGIES:
+        raise ValueError(f"unknown strategy '{name}', available: {list(STRATEGIES)}")
+    params = params or {}
+    unknown = set(params) - set(strategy_params(name))
+    if unknown:
+        raise ValueError(f"unknown params {sorted(unknown)} for strategy '{name}', "
+                         f"available: {strategy_params(name)}")
+    return STRATEGIES[name][0](**params)
+
+
+def evaluate_strategies(arrays: Dict[str, np.ndarray], strategies: Dict[str, Rule],
+                        ma: list = DEFAULT_MA) -> Dict[str, np.ndarray]:
+    """
+    在同一份数据上一次求出多个策略的布尔掩码，派生列在策略之间共享
+    (日期 × 股票) 面板上逐只股票跳过停牌日求值，与逐只 pro_bar 路径的相邻关系一致
+    """
+    order = trading_order(np.asarray(arrays['close'])) if 'close' in arrays else None
+    columns = BarColumns(arrays, ma, order)
+    return {name: put_mask(rule.evaluate(columns), order) for name, rule in strategies.items()}
+
+
+def _as_rules(strategies) -> Dict[str, Rule]:
+    """ 接受策略名列表、{名称: 参数} 或 {名称: Rule} """
+    if isinstance(strategies, str):
+        strategies = [strategies]
+    if not isinstance(strategies, dict):
+        strategies = {name: None for name in strategies}
+    return {name: rule if isinstance(rule, Rule) else build_strategy(name, rule)
+            for name, rule in strategies.items()}
+
+
+def match_days_from_frame(df: pd.DataFrame, strategies, ma: list = DEFAULT_MA) -> Dict[str, list]:
+    """
+    对 pro_bar 返回的单只股票 DataFrame 执行多个策略
+    :return: {策略名: 满足策略的 trade_date 列表}，顺序与 strategy_engine.match_days_from_frame 相同
+    """
+    rules = _as_rules(strategies)
+    if df is None or len(df) < 3:
+        return {name: [] for name in rules}
+    # 与 strategy_engine 一致，按行号反转为由旧到新
+    df = df.iloc[::-1]
+    arrays = {name: df[name].to_numpy(dtype=float) for name in df.columns if name not in ('ts_code', 'trade_date')}
+    masks = evaluate_strategies(arrays, rules, ma)
+    dates = df['trade_date'].to_numpy()
+    return {name: dates[mask].tolist() for name, mask in masks.items()}
+
+
+def match_days_from_panel(panel: Dict[str, pd.DataFrame], strategies, ma: list = DEFAULT_MA) -> Dict[str, Dict[str, list]]:
+    """
+    在 (日期 × 股票) 面板上一次执行多个策略
+    :return: {策略名: {ts_code: 满足策略的日期列表}}
+    """
+    rules = _as_rules(strategies)
+    close = panel['close']
+    arrays = {name: frame.to_numpy() for name, frame in panel.items()}
+    masks = evaluate_strategies(arrays, rules, ma)
+    dates = close.index.to_numpy()
+    result = {}
+    for name, mask in masks.items():
+        result[name] = {close.columns[i]: dates[mask[:, i]].tolist() for i in np.flatnonzero(mask.any(axis=0))}
+    return result
+
+
+if __name__ == "__main__":
+    for strategy in describe_strategies():
+        print(strategy)
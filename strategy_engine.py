@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+from indicators import rolling_mean
+
+DEFAULT_MA = [5, 10, 20, 30, 60, 120]
+
+
+# 列式策略引擎：与 tushare_tools.match_policy 规则一致，但整列计算
+# 所有数组约定第 0 维为时间（由旧到新），既支持单只股票的一维数组，也支持 (日期 × 股票) 的二维面板
+
+def is_up(open_price: np.ndarray, close_price: np.ndarray, pre_close: np.ndarray) -> np.ndarray:
+    """ 判断每一天是否上涨：收盘价高于昨收，或高于开盘价 """
+    return (close_price > pre_close) | (close_price > open_price)
+
+
+def volume_ratios(volume: np.ndarray):
+    """
+    计算当天成交量与前一天、后一天成交量之比
+    :return: (vol / 前一天 vol, vol / 后一天 vol)，首尾无邻居的位置为 NaN
+    """
+    volume = np.asarray(volume, dtype=float)
+    pre_ratio = np.full(volume.shape, np.nan)
+    next_ratio = np.full(volume.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pre_ratio[1:] = volume[1:] / volume[:-1]
+        next_ratio[:-1] = volume[:-1] / volume[1:]
+    return pre_ratio, next_ratio
+
+
+def moving_averages_in_range(open_price, close_price, pre_close, moving_averages) -> np.ndarray:
+    """
+    判断每条均线是否在 [min(开盘, 收盘, 昨收), max(开盘, 收盘)] 之间
+    :param moving_averages: 形如 (均线数量, *时间维) 的数组
+    :return: 与 moving_averages 同形状的布尔数组，均线缺失时为 False
+    """
+    # 与 Python 内置 min/max 的 NaN 行为保持一致：开盘价缺失时区间无效，昨收缺失时忽略昨收
+    low = np.fmin(np.minimum(open_price, close_price), pre_close)
+    high = np.maximum(open_price, close_price)
+    moving_averages = np.asarray(moving_averages, dtype=float)
+    return (low <= moving_averages) & (moving_averages <= high)
+
+
+def match_policy_mask(open_price, close_price, pre_close, volume, moving_averages,
+                      volume_ratio: float = 3, min_ma_in_range: int = 4) -> np.ndarray:
+    """
+    整列执行 match_policy：前一天、当天、后一天均上涨，当天成交量是前后两天的 volume_ratio 倍以上，
+    且至少 min_ma_in_range 条均线落在当天 K 线实体内
+    :return: 布尔数组，True 表示该位置（作为 cur_day）满足策略
+    """
+    up = is_up(open_price, close_price, pre_close)
+    pre_ratio, next_ratio = volume_ratios(volume)
+    ma_count = moving_averages_in_range(open_price, close_price, pre_close, moving_averages).sum(axis=0)
+
+    mask = up & (pre_ratio > volume_ratio) & (next_ratio > volume_ratio) & (ma_count >= min_ma_in_range)
+    # 前后一天也必须上涨，首尾两天没有完整的邻居
+    mask[1:] &= up[:-1]
+    mask[:-1] &= up[1:]
+    mask[0] = False
+    mask[-1] = False
+    return mask
+
+
+def trading_order(close_price: np.ndarray):
+    """
+    (日期 × 股票) 面板中停牌日为 NaN，会打断前后三天的连续性；逐只 pro_bar 路径只有交易日，停牌前后的 K 线直接相邻
+    返回逐列把有 K 线（收盘价非 NaN）的行按原顺序排到前面的行号，用 take_bars / put_mask 在紧凑序列上求值
+    没有停牌日时返回 None，不复制数据
+    """
+    missing = np.isnan(close_price)
+    if close_price.ndim != 2 or not missing.any():
+        return None
+    return np.argsort(missing, axis=0, kind='stable')
+
+
+def take_bars(values: np.ndarray, order) -> np.ndarray:
+    """ 按 trading_order 重排；values 的最后两维为 (日期 × 股票)，例如均线堆叠后的 (均线数量, 日期, 股票) """
+    if order is None:
+        return values
+    values = np.asarray(values)
+    return np.take_along_axis(values, order.reshape((1,) * (values.ndim - 2) + order.shape), axis=-2)
+
+
+def put_mask(mask: np.ndarray, order) -> np.ndarray:
+    """ 把紧凑序列上的掩码放回原来的日期位置 """
+    if order is None:
+        return mask
+    out = np.zeros_like(mask)
+    np.put_along_axis(out, order, mask, axis=0)
+    return out
+
+
+def match_policy_mask_by_symbol(open_price, close_price, pre_close, volume, moving_averages, **thresholds) -> np.ndarray:
+    """ 与 match_policy_mask 相同，但面板中每只股票跳过停牌日求值，结果与逐只 pro_bar 路径一致 """
+    close_price = np.asarray(close_price)
+    order = trading_order(close_price)
+    mask = match_policy_mask(take_bars(open_price, order), take_bars(close_price, order),
+                             take_bars(pre_close, order), take_bars(volume, order),
+                             take_bars(moving_averages, order), **thresholds)
+    return put_mask(mask, order)
+
+
+def match_days_from_frame(df: pd.DataFrame, ma: list = DEFAULT_MA) -> list:
+    """
+    对 pro_bar 返回的 DataFrame 执行策略，返回满足策略的 trade_date 列表
+    与旧的 StatInfo 逐行路径返回完全相同的日期和顺序
+    """
+    if df is None or len(df) < 3:
+        return []
+    # pro_bar 返回按日期倒序，旧路径会先反转列表，这里同样按行号反转（而不是按日期排序）
+    df = df.iloc[::-1]
+    moving_averages = np.vstack([df[f'ma{days}'].to_numpy(dtype=float) for days in ma])
+    mask = match_policy_mask(
+        df['open'].to_numpy(dtype=float),
+        df['close'].to_numpy(dtype=float),
+        df['pre_close'].to_numpy(dtype=float),
+        df['vol'].to_numpy(dtype=float),
+        moving_averages,
+    )
+    return df['trade_date'].to_numpy()[mask].tolist()
+
+
+def _synthetic_bars(days: int, seed: int) -> pd.DataFrame:
+    """ 生成按日期倒序排列的随机 OHLCV 数据，格式与 pro_bar(ma=DEFAULT_MA) 一致，均线与 indicators 的计算一致 """
+    rng = np.random.default_rng(seed)
+    close = np.round(10 * np.cumprod(1 + rng.normal(0, 0.03, days)), 2)
+    pre_close = np.concatenate([[close[0]], close[:-1]])
+    open_price = np.round(pre_close * (1 + rng.normal(0, 0.02, days)), 2)
+    # 偶尔放量，保证能触发策略
+    vol = rng.uniform(1e4, 2e4, days) * np.where(rng.random(days) < 0.15, 5, 1)
+    df = pd.DataFrame({
+        'ts_code': '000001.SZ',
+        'trade_date': pd.date_range('20200101', periods=days, freq='D').strftime('%Y%m%d'),
+        'open': open_price,
+        'close': close,
+        'pre_close': pre_close,
+        'vol': vol,
+    })
+    for n in DEFAULT_MA:
+        df[f'ma{n}'] = rolling_mean(close, n, rounded=True)
+    return df.iloc[::-1].reset_index(drop=True)
@@ -0,0 +1,195 @@
+import difflib
+import os
+import time
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from threading import Lock
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from metrics import logger
+
+# 股票代码表缓存：每天刷新一次并落盘快照，提供按代码、名称前缀、拼音首字母、交易所、行业的索引和模糊查找
+SYMBOL_MASTER_PATH = os.environ.get("SYMBOL_MASTER_PATH", "data/stock_basic.csv")
+
+STOCK_BASIC_FIELDS = 'ts_code,symbol,name,area,industry,cnspell,market,exchange,list_date'
+# 当天的代码表拉取失败后，继续使用旧代码表，至少间隔这么多秒再重试
+SYMBOL_RETRY_INTERVAL = float(os.environ.get("SYMBOL_RETRY_INTERVAL", "300"))
+
+
+# 一天的代码表及其全部索引，整体替换，不单独修改其中的字段
+SymbolIndexes = namedtuple('SymbolIndexes', ['df', 'records', 'by_code', 'by_name', 'by_exchange', 'by_industry',
+                                             'names', 'spells'])
+
+
+class SymbolMaster:
+    """
+    :param loader: 无参函数，返回 pro.stock_basic(list_status='L', fields=STOCK_BASIC_FIELDS) 的结果
+    """
+
+    def __init__(self, loader: Callable[[], pd.DataFrame], path: str = SYMBOL_MASTER_PATH):
+        self.loader = loader
+        self.path = path
+        self._lock = Lock()
+        self._loaded_on = None
+        self._failed_at = None
+        self._indexes: Optional[SymbolIndexes] = None
+
+    def _ensure_fresh(self):
+        """
+        当天已加载过则直接返回；否则优先读当天的快照，快照过期时重新拉取
+        拉取失败（配额、网络）时继续使用已加载的代码表，没有时使用最近一次的快照，都没有才抛出异常
+        """
+        today = datetime.now().strftime('%Y%m%d')
+        if self._loaded_on == today:
+            return
+        with self._lock:
+            if self._loaded_on == today:
+                return
+            if self._indexes is not None and self._failed_at is not None \
+                    and time.monotonic() - self._failed_at < SYMBOL_RETRY_INTERVAL:
+                return
+            df = self._read_snapshot(today)
+            if df is None:
+                try:
+                    df = self.loader()
+                except Exception as e:
+                    self._fall_back(e)
+                    return
+                self._write_snapshot(df)
+            self._build_indexes(df)
+            self._loaded_on = today
+            self._failed_at = None
+
+    def _fall_back(self, error: Exception):
+        """ 拉取失败：已加载过代码表时继续使用，否则加载最近一次的快照（不限日期），都没有时抛出异常 """
+        self._failed_at = time.monotonic()
+        if self._indexes is None:
+            df = self._read_snapshot()
+            if df is None:
+                raise error
+            self._build_indexes(df)
+        logger.warning("stock list refresh failed, using the last loaded list and retrying in %gs: %s",
+                       SYMBOL_RETRY_INTERVAL, error)
+
+    def refresh(self):
+        """ 强制重新拉取 """
+        with self._lock:
+            df = self.loader()
+            self._write_snapshot(df)
+            self._build_indexes(df)
+            self._loaded_on = datetime.now().strftime('%Y%m%d')
+
+    def _read_snapshot(self, day: str = None) -> Optional[pd.DataFrame]:
+        """ 读取快照；指定 day 时只接受当天写入的快照 """
+        if not self.path or not os.path.exists(self.path):
+            return None
+        if day is not None and datetime.fromtimestamp(os.path.getmtime(self.path)).strftime('%Y%m%d') != day:
+            return None
+        return pd.read_csv(self.path, dtype=str, keep_default_na=False)
+
+    def _write_snapshot(self, df: pd.DataFrame):
+        """ 先写临时文件再替换，其它进程不会读到写了一半的快照 """
+        if not self.path:
+            return
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+
+    def _build_indexes(self, df: pd.DataFrame):
+        """
+        所有索引先建在局部变量里，最后作为一个 SymbolIndexes 一次性替换；读者不加锁，
+        每次查询开始时取一次 self._indexes，不会混用新旧两份索引
+        """
+        df = df.fillna('').astype(str).reset_index(drop=True)
+        records = df.to_dict(orient='records')
+        by_code = {}
+        by_name = {}
+        by_exchange = defaultdict(list)
+        by_industry = defaultdict(list)
+        for record in records:
+            by_code[record['ts_code'].upper()] = record
+            if record.get('symbol'):
+                by_code[record['symbol']] = record
+            by_name[record['name']] = record
+            by_exchange[record.get('exchange', '')].append(record)
+            by_industry[record.get('industry', '')].append(record)
+        # 有序的 (键, 序号) 列表，用于名称 / 拼音首字母的前缀查找
+        names = sorted((record['name'], i) for i, record in enumerate(records))
+        spells = sorted((record.get('cnspell', '').lower(), i) for i, record in enumerate(records))
+        self._indexes = SymbolIndexes(df, records, by_code, by_name, dict(by_exchange), dict(by_industry),
+                                      names, spells)
+
+    @property
+    def df(self) -> Optional[pd.DataFrame]:
+        return self._indexes.df if self._indexes else None
+
+    def _current(self) -> 'SymbolIndexes':
+        self._ensure_fresh()
+        return self._indexes
+
+    def all(self) -> List[dict]:
+        """ 当天的全部记录，返回内部列表本身（代码表刷新前保持同一个对象），调用方不要修改 """
+        return self._current().records
+
+    def get(self, code: str) -> Optional[dict]:
+        """ 按 ts_code（600519.SH）或 6 位代码（600519）查找 """
+        return self._current().by_code.get(code.strip().upper())
+
+    def by_prefix(self, prefix: str, limit: int = 10) -> List[dict]:
+        """ 名称前缀或拼音首字母前缀匹配 """
+        return self._by_prefix(self._current(), prefix, limit)
+
+    @staticmethod
+    def _by_prefix(indexes: 'SymbolIndexes', prefix: str, limit: int) -> List[dict]:
+        result = []
+        for keys, key in ((indexes.names, prefix), (indexes.spells, prefix.lower())):
+            i = bisect_left(keys, (key, -1))
+            while i < len(keys) and keys[i][0].startswith(key) and len(result) < limit:
+                record = indexes.records[keys[i][1]]
+                if record not in result:
+                    result.append(record)
+                i += 1
+        return result
+
+    def filter(self, exchange: str = None, industry: str = None) -> List[dict]:
+        """ 按交易所和/或行业筛选，只给一个条件时直接取对应索引；返回新列表，调用方可以修改 """
+        indexes = self._current()
+        if exchange and industry:
+            return [record for record in indexes.by_industry.get(industry, [])
+                    if record.get('exchange') == exchange.upper()]
+        if exchange:
+            return list(indexes.by_exchange.get(exchange.upper(), []))
+        if industry:
+            return list(indexes.by_industry.get(industry, []))
+        return list(indexes.records)
+
+    def resolve(self, query: str, limit: int = 5) -> List[dict]:
+        """
+        把自由文本解析成股票：依次尝试代码、精确名称、名称/拼音前缀、名称包含，最后用 difflib 模糊匹配
+        例如 "贵州茅台"、"茅台"、"gzmt"、"600519" 都能解析到 600519.SH
+        """
+        indexes = self._current()
+        query = query.strip()
+        if not query:
+            return []
+        exact = indexes.by_code.get(query.upper()) or indexes.by_name.get(query)
+        if exact:
+            return [exact]
+        result = self._by_prefix(indexes, query, limit)
+        if len(result) < limit:
+            result += [record for record in indexes.records
+                       if query in record['name'] and record not in result][:limit - len(result)]
+        if not result:
+            names = difflib.get_close_matches(query, indexes.by_name.keys(), n=limit, cutoff=0.5)
+            result = [indexes.by_name[name] for name in names]
+        return result[:limit]
+
+
+def summarize_record(record: dict) -> Dict[str, str]:
+    """ 返回给 LLM 的精简字段 """
+    return {key: record.get(key, '') for key in ('ts_code', 'name', 'industry', 'exchange')}
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# 测试不读写开发机上的本地缓存和索引，必须在导入项目模块之前设置
+for name in ("TUSHARE_BAR_STORE", "SIGNAL_INDEX_PATH", "PANEL_STORE_PATH", "SYMBOL_MASTER_PATH"):
+    os.environ[name] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import agent
+import deepseek_client
+
+
+@pytest.fixture
+def tushare_agent(monkeypatch):
+    monkeypatch.setattr(deepseek_client, 'DEEPSEEK_API_URL', 'http://127.0.0.1:1/chat/completions')
+    calls = []
+    release = threading.Event()
+
+    def quote(ts_code):
+        calls.append(ts_code)
+        return {'ts_code': ts_code}
+
+    def slow(ts_code):
+        release.wait(5)
+        return ts_code
+
+    monkeypatch.setattr(agent, 'SAFE_FUNCTIONS', {'quote': quote, 'slow': slow})
+    tushare_agent = agent.TushareAgent()
+    tushare_agent.calls = calls
+    tushare_agent.release = release
+    yield tushare_agent
+    release.set()
+
+
+PLAN = {"calls": [{"function": "quote", "params": {"ts_code": "600519.SH"}},
+                  {"function": "quote", "params": {"ts_code": "000858.SZ"}},
+                  {"function": "quote", "params": {"ts_code": "600519.SH"}}],
+        "reasoning": "compare"}
+
+
+def test_multi_call_plan_runs_distinct_calls(tushare_agent):
+    response = tushare_agent.execute_decision(PLAN)
+    assert response["function_called"] == ["quote", "quote"]
+    assert [item["result"] for item in response["result"]] == [{'ts_code': '600519.SH'}, {'ts_code': '000858.SZ'}]
+    assert sorted(tushare_agent.calls) == ['000858.SZ', '600519.SH']
+
+
+def test_execute_decision_inside_a_running_loop(tushare_agent):
+    async def handler():
+        # 例如 Gradio 的 async 处理函数里直接调用同步接口
+        return tushare_agent.execute_decision(PLAN), await tushare_agent.aexecute_decision(PLAN)
+
+    sync_response, async_response = asyncio.run(handler())
+    assert sync_response == async_response
+    assert len(sync_response["result"]) == 2
+
+
+def test_single_call_and_rejected_plans(tushare_agent):
+    decision = {"function": "quote", "params": {"ts_code": "600519.SH"}, "reasoning": "r"}
+    expected = {"function_called": "quote", "params_used": {"ts_code": "600519.SH"}, "reasoning": "r",
+                "result": {'ts_code': '600519.SH'}}
+    assert tushare_agent.execute_decision(decision) == expected
+    assert asyncio.run(tushare_agent.aexecute_decision(decision)) == expected
+    assert "error" in tushare_agent.execute_decision({"function": "os.system", "params": {}})
+    assert "error" in tushare_agent.execute_decision({"calls": []})
+
+
+def test_timed_out_call_is_reported_and_observed(tushare_agent, caplog):
+    plan = {"calls": [{"function": "slow", "params": {"ts_code": "x"}},
+                      {"function": "quote", "params": {"ts_code": "y"}}]}
+    with caplog.at_level('WARNING', logger=agent.logger.name):
+        merged = asyncio.run(tushare_agent.execute_calls(agent.decision_calls(plan), timeout=0.05))
+        assert "timed out" in merged[0]["result"]
+        assert merged[1]["result"] == {'ts_code': 'y'}
+        # 超时的线程结束后留下日志
+        tushare_agent.release.set()
+        deadline = time.monotonic() + 5
+        while "slow finished" not in caplog.text:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+
+def test_ahandle_query(tushare_agent, monkeypatch):
+    async def achat(messages, **params):
+        assert messages[-1]["content"] == "茅台行情"
+        return json.dumps({"function": "quote", "params": {"ts_code": "600519.SH"}, "reasoning": "r"})
+
+    monkeypatch.setattr(tushare_agent.llm, 'achat', achat)
+    response = asyncio.run(tushare_agent.ahandle_query("茅台行情"))
+    assert response["result"] == {'ts_code': '600519.SH'}
@@ -0,0 +1,45 @@
+import asyncio
+import threading
+
+import pytest
+
+import async_tools
+
+
+def test_timed_out_call_keeps_its_slot(monkeypatch):
+    monkeypatch.setitem(async_tools.TOOL_CONCURRENCY, 'slow', 1)
+    release = threading.Event()
+    started = []
+
+    def slow(label):
+        started.append(label)
+        release.wait(5)
+        return label
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await async_tools.run_tool('slow', slow, 'first', timeout=0.05)
+        # 第一个线程还在执行，第二个调用只能排队等待名额
+        second = asyncio.ensure_future(async_tools.run_tool('slow', slow, 'second', timeout=5))
+        await asyncio.sleep(0.1)
+        assert started == ['first']
+        release.set()
+        assert await second == 'second'
+        assert started == ['first', 'second']
+
+    asyncio.run(run())
+
+
+def test_run_tool_returns_results_and_errors():
+    def fail():
+        raise ValueError("bad params")
+
+    async def run():
+        results = await asyncio.gather(*(async_tools.run_tool('get_stock_data', pow, i, 2) for i in range(6)))
+        assert results == [0, 1, 4, 9, 16, 25]
+        with pytest.raises(ValueError):
+            await async_tools.run_tool('get_stock_data', fail)
+        # 失败的调用同样归还名额
+        assert await async_tools.run_tool('get_stock_data', pow, 3, 2) == 9
+
+    asyncio.run(run())
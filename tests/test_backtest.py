@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from backtest import run_sweep
+from strategies import match_days_from_panel
+from strategy_engine import DEFAULT_MA, _synthetic_bars
+
+
+def _panel(stocks: int = 40, days: int = 400):
+    bars = pd.concat([_synthetic_bars(days, seed).assign(ts_code=f'{seed:06d}.SZ') for seed in range(stocks)])
+    fields = ['open', 'close', 'pre_close', 'vol'] + [f'ma{days}' for days in DEFAULT_MA]
+    return {field: bars.pivot(index='trade_date', columns='ts_code', values=field).sort_index() for field in fields}
+
+
+def test_sweep_matches_a_loop_over_signals():
+    # 向量化结果与逐个信号循环计算的结果一致：次日开盘后入场（entry_lag=1），持有 horizon 根 K 线
+    panel = _panel()
+    close = panel['close']
+    result = run_sweep(panel, 'volume_breakout', {'volume_ratio': [2, 3]}, horizons=[5, 10])
+    assert len(result) == 4
+
+    expected_days = match_days_from_panel(panel, {'volume_breakout': {'volume_ratio': 2}})['volume_breakout']
+    returns = []
+    for ts_code, days in expected_days.items():
+        for day in days:
+            t = close.index.get_loc(day)
+            if t + 6 < len(close):
+                returns.append(close[ts_code].iloc[t + 6] / close[ts_code].iloc[t + 1] - 1)
+    row = result[(result['horizon'] == 5)].iloc[0]
+    assert row['signals'] == len(returns)
+    assert np.isclose(row['mean_return'], np.mean(returns))
+    assert np.isclose(row['hit_rate'], np.mean(np.array(returns) > 0))
+
+
+def test_suspended_days_do_not_drop_signals():
+    # 停牌日在面板中为 NaN：入场和持有期按每只股票自己的交易日计数，与逐只 pro_bar 路径一致
+    panel = _panel(stocks=20, days=300)
+    rng = np.random.default_rng(0)
+    for ts_code in panel['close'].columns[::2]:
+        days = rng.choice(panel['close'].index[5:], size=30, replace=False)
+        for frame in panel.values():
+            frame.loc[days, ts_code] = np.nan
+    result = run_sweep(panel, 'volume_breakout', {'volume_ratio': [2]}, horizons=[5])
+
+    expected_days = match_days_from_panel(panel, {'volume_breakout': {'volume_ratio': 2}})['volume_breakout']
+    returns = []
+    for ts_code, days in expected_days.items():
+        close = panel['close'][ts_code].dropna()
+        for day in days:
+            t = close.index.get_loc(day)
+            if t + 6 < len(close):
+                returns.append(close.iloc[t + 6] / close.iloc[t + 1] - 1)
+    row = result.iloc[0]
+    assert row['signals'] == len(returns)
+    assert np.isclose(row['mean_return'], np.mean(returns))
+    assert np.isclose(row['hit_rate'], np.mean(np.array(returns) > 0))
@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bar_store import BarStore, shift_date
+from indicators import add_moving_averages
+
+MA = [5, 10]
+
+
+class FakeFetcher:
+    """ 按工作日生成确定的 K 线，记录每次请求的区间 """
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, ts_code, start_date, end_date, freq='D', adj=None):
+        self.calls.append((start_date, end_date))
+        dates = pd.bdate_range(start_date, end_date).strftime('%Y%m%d')
+        close = np.array([10 + (int(date) % 97) / 10 for date in dates])
+        return pd.DataFrame({'ts_code': ts_code, 'trade_date': dates, 'open': close - 0.1, 'high': close + 0.2,
+                             'low': close - 0.2, 'close': close, 'pre_close': close, 'change': 0.0,
+                             'pct_chg': 0.0, 'vol': 1e4, 'amount': 1e5}).iloc[::-1]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BarStore(str(tmp_path / 'bars.sqlite'), fetcher=FakeFetcher())
+
+
+def test_cached_range_is_not_fetched_again(store):
+    first = store.get_bars('000001.SZ', '20240201', '20240229')
+    assert store.fetcher.calls == [('20240201', '20240229')]
+    second = store.get_bars('000001.SZ', '20240205', '20240220')
+    assert store.fetcher.calls == [('20240201', '20240229')]
+    assert second['trade_date'].tolist() == [day for day in first['trade_date'] if '20240205' <= day <= '20240220']
+    # pro_bar 格式：按日期倒序
+    assert first['trade_date'].is_monotonic_decreasing
+
+
+def test_only_missing_ends_are_fetched(store):
+    store.get_bars('000001.SZ', '20240201', '20240229')
+    store.get_bars('000001.SZ', '20240115', '20240315')
+    assert store.fetcher.calls == [('20240201', '20240229'), ('20240115', '20240131'), ('20240301', '20240315')]
+    assert store._coverage('000001.SZ', 'D', None) == ('20240115', '20240315')
+
+
+def test_keys_are_cached_separately(store):
+    store.get_bars('000001.SZ', '20240201', '20240229')
+    store.get_bars('000001.SZ', '20240201', '20240229', adj='qfq')
+    store.get_bars('000001.SZ', '20240201', '20240229', freq='W')
+    store.get_bars('600000.SH', '20240201', '20240229')
+    assert len(store.fetcher.calls) == 4
+
+
+def test_today_is_fetched_again(store):
+    today = datetime.now().strftime('%Y%m%d')
+    start = shift_date(today, -20)
+    store.get_bars('000001.SZ', start, today)
+    assert store._coverage('000001.SZ', 'D', None) == (start, shift_date(today, -1))
+    store.get_bars('000001.SZ', start, today)
+    assert store.fetcher.calls[-1] == (today, today)
+
+
+def test_moving_averages_use_the_lookback(store):
+    df = store.get_bars('000001.SZ', '20240201', '20240229', ma=MA)
+    start, end = store.fetcher.calls[0]
+    assert start < '20240201' and end == '20240229'
+    assert df['trade_date'].min() >= '20240201'
+    assert not df[[f'ma{days}' for days in MA]].isna().any().any()
+    full = add_moving_averages(FakeFetcher()('000001.SZ', start, end), MA, ascending=False)
+    full = full[full['trade_date'] >= '20240201'].reset_index(drop=True)
+    for days in MA:
+        np.testing.assert_array_equal(df[f'ma{days}'].to_numpy(), full[f'ma{days}'].to_numpy())
+
+
+def test_invalidate(store):
+    store.get_bars('000001.SZ', '20240201', '20240229')
+    store.invalidate('000001.SZ')
+    assert store._coverage('000001.SZ', 'D', None) is None
+    store.get_bars('000001.SZ', '20240201', '20240229')
+    assert len(store.fetcher.calls) == 2
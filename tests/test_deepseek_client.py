@@ -0,0 +1,84 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from deepseek_client import DeepSeekClient
+from llm_cache import MemoryCache
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        Handler.requests_seen.append(payload)
+        if self.path == '/error':
+            self.send_response(500)
+            self.end_headers()
+            self.wfile.write(b'{"error": "overloaded"}')
+            return
+        body = json.dumps({"choices": [{"message": {"content": payload["messages"][-1]["content"].upper()}}],
+                           "usage": {"prompt_tokens": 3, "completion_tokens": 2}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+
+
+def _messages(text):
+    return [{"role": "user", "content": text}]
+
+
+def test_chat(server):
+    assert DeepSeekClient(url=f'{server}/chat', api_key='x').chat(_messages('hi')) == 'HI'
+
+
+def test_chat_raises_on_http_errors(server):
+    client = DeepSeekClient(url=f'{server}/error', api_key='x')
+    with pytest.raises(requests.HTTPError):
+        client.chat(_messages('hi'))
+    with pytest.raises(Exception):
+        asyncio.run(client.achat(_messages('hi')))
+
+
+def test_achat_works_across_event_loops(server):
+    client = DeepSeekClient(url=f'{server}/chat', api_key='x', max_concurrency=2)
+
+    async def ask(texts):
+        return await asyncio.gather(*(client.achat(_messages(text)) for text in texts))
+
+    # 每次 asyncio.run 都是新的事件循环，例如每个请求单独运行一次
+    assert asyncio.run(ask(['a', 'b', 'c'])) == ['A', 'B', 'C']
+    assert asyncio.run(ask(['d'])) == ['D']
+    results = []
+    thread = threading.Thread(target=lambda: results.append(asyncio.run(ask(['e']))))
+    thread.start()
+    thread.join()
+    assert results == [['E']]
+
+
+def test_responses_are_cached(server):
+    client = DeepSeekClient(url=f'{server}/chat', api_key='x', cache=MemoryCache())
+    before = len(Handler.requests_seen)
+    assert client.chat(_messages('cached')) == 'CACHED'
+    assert client.chat(_messages(' cached ')) == 'CACHED'
+    assert asyncio.run(client.achat(_messages('cached'))) == 'CACHED'
+    assert len(Handler.requests_seen) == before + 1
+    assert client.cache_stats()['hits'] == 2
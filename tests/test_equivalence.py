@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import strategies
+from indicators import MovingAverageState, add_moving_averages, rolling_mean
+from live_signals import LiveSignalEvaluator, bars_from_frame, replay_bars
+from market_panel import add_panel_moving_averages, match_days_from_panel
+from strategy_engine import DEFAULT_MA, _synthetic_bars, match_days_from_frame
+from tushare_tools import match_days_from_stat_infos, stat_infos_from_frame
+
+# 等价性检查：在随机 OHLCV 数据上对比各条计算路径，结果必须逐日相同
+
+SEEDS = range(300)
+
+
+@pytest.fixture(scope="module")
+def frames():
+    return [_synthetic_bars(days=300, seed=seed) for seed in SEEDS]
+
+
+def test_engine_matches_legacy_path(frames):
+    for seed, frame in zip(SEEDS, frames):
+        assert match_days_from_frame(frame) == match_days_from_stat_infos(stat_infos_from_frame(frame)), seed
+
+
+def test_dsl_matches_engine(frames):
+    for seed, frame in zip(SEEDS, frames):
+        expected = match_days_from_frame(frame)
+        actual = strategies.match_days_from_frame(frame, list(strategies.STRATEGIES))
+        assert actual['match_policy'] == expected, seed
+        assert set(actual['all_ma_in_range']) <= set(expected), seed
+        assert set(expected) <= set(actual['volume_breakout']), seed
+
+
+def test_live_evaluator_matches_engine(frames):
+    total = 0
+    for seed, frame in zip(SEEDS, frames):
+        expected = match_days_from_frame(frame)
+        actual = [signal.trade_date for signal in LiveSignalEvaluator().run(bars_from_frame(frame))]
+        assert actual == expected, seed
+        total += len(expected)
+    assert total > 0
+
+
+@pytest.mark.parametrize("cut", [3, 100, 150, 297])
+def test_live_evaluator_after_warm_up(frames, cut):
+    # 前 cut 根之前的历史只用来预热，之后逐根到达；信号日最早可以是预热的最后一根
+    for seed, frame in zip(SEEDS[:50], frames[:50]):
+        evaluator = LiveSignalEvaluator()
+        evaluator.warm_up(frame.iloc[cut:])
+        actual = [signal.trade_date for signal in evaluator.run(replay_bars([frame.iloc[:cut]]))]
+        first = frame['trade_date'].iloc[cut]
+        assert actual == [day for day in match_days_from_frame(frame) if day >= first], seed
+
+
+def test_moving_average_independent_of_start():
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        close = np.round(10 * np.cumprod(1 + rng.normal(0, 0.03, 600)), 2)
+        for window in DEFAULT_MA:
+            full = rolling_mean(close, window, rounded=True)
+            for offset in (1, 37, 200):
+                part = rolling_mean(close[offset:], window, rounded=True)
+                valid = ~np.isnan(part)
+                np.testing.assert_array_equal(full[offset:][valid], part[valid])
+
+
+def test_incremental_moving_average_matches_batch():
+    rng = np.random.default_rng(1)
+    close = np.round(10 * np.cumprod(1 + rng.normal(0, 0.03, 2000)), 2)
+    close[rng.integers(0, len(close), 10)] = np.nan
+    state = MovingAverageState(DEFAULT_MA)
+    incremental = np.array([list(state.update(value, rounded=True).values()) for value in close])
+    batch = np.stack([rolling_mean(close, window, rounded=True) for window in DEFAULT_MA], axis=1)
+    np.testing.assert_array_equal(incremental, batch)
+
+
+def test_panel_skips_suspensions_like_per_stock_path(frames):
+    # 面板上停牌日为 NaN，逐只 pro_bar 只返回交易日；两条路径的匹配日必须相同
+    rng = np.random.default_rng(2)
+    bars, expected = [], {}
+    for seed, frame in zip(SEEDS[:80], frames[:80]):
+        ts_code = f'{seed:06d}.SZ'
+        frame = frame[rng.random(len(frame)) >= 0.05].iloc[::-1].copy()
+        frame = add_moving_averages(frame.assign(ts_code=ts_code), DEFAULT_MA).iloc[::-1]
+        bars.append(frame)
+        days = match_days_from_frame(frame)
+        if days:
+            expected[ts_code] = days
+    bars = pd.concat(bars)
+    panel = {field: bars.pivot(index='trade_date', columns='ts_code', values=field)
+             for field in ['open', 'close', 'pre_close', 'vol']}
+    panel = add_panel_moving_averages(panel, DEFAULT_MA)
+    assert expected
+    assert match_days_from_panel(panel) == expected
+    assert strategies.match_days_from_panel(panel, ['match_policy'])['match_policy'] == expected
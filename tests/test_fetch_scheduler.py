@@ -0,0 +1,94 @@
+import pytest
+
+from fetch_scheduler import FetchScheduler, NoDataError, RateLimitError, TokenBucket, is_retryable
+
+
+class Flaky:
+    """ 前 failures 次调用抛出 error，之后返回 'ok' """
+
+    def __init__(self, error: Exception, failures: int):
+        self.error = error
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return 'ok'
+
+
+class CountingBucket(TokenBucket):
+    def __init__(self):
+        super().__init__(6000)
+        self.drains = 0
+
+    def drain(self):
+        self.drains += 1
+        super().drain()
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = FetchScheduler(base_delay=0, max_retries=3)
+    yield scheduler
+    scheduler.shutdown()
+
+
+def _with_bucket(scheduler, endpoint='pro_bar'):
+    bucket = scheduler._buckets[endpoint] = CountingBucket()
+    return bucket
+
+
+def test_is_retryable():
+    assert is_retryable(RateLimitError())
+    assert is_retryable(Exception('抱歉，您每分钟最多访问该接口200次'))
+    assert is_retryable(ConnectionError())
+    assert is_retryable(NoDataError())
+    assert not is_retryable(ValueError('bad ts_code'))
+
+
+def test_rate_limit_is_retried_and_drains_the_bucket(scheduler):
+    bucket = _with_bucket(scheduler)
+    func = Flaky(Exception('每分钟最多访问该接口200次'), failures=2)
+    assert scheduler.call('pro_bar', func) == 'ok'
+    assert func.calls == 3
+    assert bucket.drains == 2
+    assert scheduler.stats()['pro_bar']['retries'] == 2
+
+
+def test_network_error_is_retried_without_draining(scheduler):
+    bucket = _with_bucket(scheduler)
+    func = Flaky(ConnectionResetError(), failures=3)
+    assert scheduler.call('pro_bar', func) == 'ok'
+    assert func.calls == 4
+    assert bucket.drains == 0
+
+
+def test_retries_are_bounded(scheduler):
+    func = Flaky(ConnectionResetError(), failures=10)
+    with pytest.raises(ConnectionResetError):
+        scheduler.call('pro_bar', func)
+    assert func.calls == 4
+    assert scheduler.stats()['pro_bar']['failures'] == 1
+
+
+def test_no_data_is_retried_once_without_draining(scheduler):
+    bucket = _with_bucket(scheduler)
+    func = Flaky(NoDataError('pro_bar returned no data'), failures=10)
+    with pytest.raises(NoDataError):
+        scheduler.call('pro_bar', func)
+    assert func.calls == 2
+    assert bucket.drains == 0
+
+
+def test_other_errors_are_not_retried(scheduler):
+    func = Flaky(ValueError('bad ts_code'), failures=10)
+    with pytest.raises(ValueError):
+        scheduler.call('pro_bar', func)
+    assert func.calls == 1
+
+
+def test_submit_and_map(scheduler):
+    assert scheduler.submit('daily', lambda trade_date: trade_date, trade_date='20240102').result() == '20240102'
+    assert [future.result() for future in scheduler.map(lambda x: x * 2, range(5))] == [0, 2, 4, 6, 8]
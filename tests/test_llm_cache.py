@@ -0,0 +1,73 @@
+import pytest
+
+import llm_cache
+from llm_cache import MemoryCache, SQLiteCache, create_cache, make_cache_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_cache(request, tmp_path):
+    def make(**kwargs):
+        if request.param == 'memory':
+            return MemoryCache(**kwargs)
+        return SQLiteCache(str(tmp_path / 'llm_cache.sqlite'), **kwargs)
+    return make
+
+
+def test_cache_key_normalizes_whitespace_and_width():
+    key = make_cache_key([{"role": "user", "content": "查询  600519.SH\n的均线"}], model="deepseek-chat")
+    assert key == make_cache_key([{"role": "user", "content": "查询 ６００５１９.SH 的均线"}], model="deepseek-chat")
+    assert key != make_cache_key([{"role": "user", "content": "查询 600519.SH 的均线"}], model="deepseek-reasoner")
+    assert key != make_cache_key([{"role": "system", "content": "查询 600519.SH 的均线"}], model="deepseek-chat")
+
+
+def test_ttl(make_cache, clock):
+    cache = make_cache(ttl=60, max_entries=10)
+    cache.set('a', 'A')
+    clock.now += 59
+    assert cache.get('a') == 'A'
+    clock.now += 2
+    assert cache.get('a') is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "hit_rate": 0.5}
+
+
+def test_lru_eviction(make_cache, clock):
+    cache = make_cache(ttl=3600, max_entries=2)
+    cache.set('a', 'A')
+    clock.now += 1
+    cache.set('b', 'B')
+    clock.now += 1
+    assert cache.get('a') == 'A'   # a 变为最近使用，b 先被淘汰
+    clock.now += 1
+    cache.set('c', 'C')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'A'
+    assert cache.get('c') == 'C'
+    assert cache.evictions == 1
+
+
+def test_sqlite_cache_survives_reopen(tmp_path, clock):
+    path = str(tmp_path / 'llm_cache.sqlite')
+    SQLiteCache(path).set('a', 'A')
+    assert SQLiteCache(path).get('a') == 'A'
+
+
+def test_create_cache():
+    assert create_cache('') is None
+    assert isinstance(create_cache('memory'), MemoryCache)
+    with pytest.raises(ValueError):
+        create_cache('redis')
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from panel_store import PanelStore, write_panel
+from strategies import match_days_from_panel
+from strategy_engine import DEFAULT_MA, _synthetic_bars
+
+
+def _panel(stocks: int = 10, days: int = 200, volume_scale: float = 1.0):
+    bars = pd.concat([_synthetic_bars(days, seed).assign(ts_code=f'{seed:06d}.SZ') for seed in range(stocks)])
+    bars['vol'] *= volume_scale
+    bars['amount'] = bars['vol'] * bars['close']
+    fields = ['open', 'high', 'low', 'close', 'pre_close', 'vol', 'amount'] + [f'ma{days}' for days in DEFAULT_MA]
+    return {field: bars.pivot(index='trade_date', columns='ts_code', values=field).sort_index()
+            for field in fields if field in bars}
+
+
+def test_round_trip(tmp_path):
+    panel = _panel()
+    store = PanelStore(write_panel(str(tmp_path / 'D'), panel))
+    frames = store.to_frames()
+    for field in ('close', 'vol', 'amount'):
+        assert np.allclose(frames[field].to_numpy(), panel[field].to_numpy(), equal_nan=True)
+    assert store.dtypes['close'] == 'float32' and store.dtypes['vol'] == 'float64'
+
+
+def test_large_volumes_compare_like_float64(tmp_path):
+    # 成交量超过 2^24 时 float32 会舍入；恰好等于放量倍数阈值的成交量仍要和 float64 路径得到相同的结果
+    panel = _panel(volume_scale=1e5)
+    vol = panel['vol']
+    vol.iloc[100] = vol.iloc[99] * 2 + 1
+    vol.iloc[101] = (vol.iloc[100] - 1) / 2
+    store = PanelStore(write_panel(str(tmp_path / 'D'), panel))
+    assert (store.field('vol') == vol.to_numpy().T).all()
+    assert (store.field('amount') == panel['amount'].to_numpy().T).all()
+    for params in ({'volume_ratio': 2}, {'volume_ratio': 3}):
+        expected = match_days_from_panel(panel, {'volume_breakout': params})['volume_breakout']
+        assert store.match_days(strategy='volume_breakout', strategy_params=params) == expected
@@ -0,0 +1,213 @@
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+import scan_jobs
+import tushare_tools
+from scan_jobs import JobCancelled, JobQueue, WorkerPool, default_scan_params, run_scan_job
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.sqlite'), lease=0.3)
+
+
+def _wait_for(predicate, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _expire_lease(queue, job_id, owner_boot='another-container'):
+    with sqlite3.connect(queue.path) as conn:
+        conn.execute("UPDATE jobs SET lease_until=?, owner_boot=? WHERE job_id=?", (time.time() - 1, owner_boot, job_id))
+
+
+def test_each_job_is_claimed_once(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite')
+    queues = [JobQueue(path) for _ in range(4)]
+    submitted = {queues[0].submit({'n': i}) for i in range(50)}
+    claimed = []
+
+    def worker(queue):
+        while True:
+            job = queue.claim()
+            if job is None:
+                return
+            claimed.append(job['job_id'])
+
+    threads = [threading.Thread(target=worker, args=(queue,)) for queue in queues]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert Counter(claimed) == Counter(submitted)
+
+
+def test_recover_requeues_only_expired_leases(queue):
+    job_id = queue.submit({})
+    queue.claim()
+    assert queue.recover() == 0
+    # 其它容器里的 worker 还在续租时不能接手，与 PID 是否在本机存活无关
+    with sqlite3.connect(queue.path) as conn:
+        conn.execute("UPDATE jobs SET owner_boot='another-container', owner_pid=999999 WHERE job_id=?", (job_id,))
+    assert queue.recover() == 0
+    _expire_lease(queue, job_id)
+    assert queue.recover() == 1
+    assert queue.get(job_id)['status'] == 'queued'
+
+
+def test_taken_over_job_cannot_be_renewed_or_finished(queue):
+    job_id = queue.submit({})
+    queue.claim()
+    assert queue.renew(job_id)
+    _expire_lease(queue, job_id)
+    assert not queue.renew(job_id)
+    assert not queue.finish(job_id, 'done')
+    assert queue.get(job_id)['status'] == 'running'
+
+
+def test_cancel(queue):
+    queued = queue.submit({})
+    running = queue.submit({})
+    assert queue.cancel(queued)
+    assert queue.get(queued)['status'] == 'cancelled'
+    assert queue.claim()['job_id'] == running
+    assert queue.cancel(running)
+    assert queue.get(running)['status'] == 'running' and queue.is_cancel_requested(running)
+    # 请求取消后执行进程崩溃：恢复时直接标记为 cancelled，不再重新排队
+    _expire_lease(queue, running)
+    queue.recover()
+    assert queue.get(running)['status'] == 'cancelled'
+    assert not queue.cancel(running)
+
+
+def test_record_and_results(queue):
+    job_id = queue.submit({})
+    queue.record(job_id, [('000001.SZ', '平安银行', ['20240102']), ('600000.SH', '浦发银行', [])], failed=1)
+    job = queue.get(job_id)
+    assert (job['done'], job['matched'], job['failed']) == (2, 1, 1)
+    assert queue.checkpoint(job_id) == {'000001.SZ', '600000.SH'}
+    assert queue.results(job_id) == [{'ts_code': '000001.SZ', 'name': '平安银行', 'match_days': ['20240102']}]
+
+
+def test_old_schema_is_migrated(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite')
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE jobs (job_id TEXT PRIMARY KEY, params TEXT NOT NULL, status TEXT NOT NULL, "
+                     "done INTEGER NOT NULL DEFAULT 0, total INTEGER NOT NULL DEFAULT 0, "
+                     "matched INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, "
+                     "cancel_requested INTEGER NOT NULL DEFAULT 0, owner_pid INTEGER, error TEXT, "
+                     "created_at TEXT NOT NULL, updated_at TEXT NOT NULL)")
+    queue = JobQueue(path)
+    job_id = queue.submit({})
+    assert queue.claim()['owner_boot'] == scan_jobs.BOOT_ID
+    assert queue.finish(job_id, 'done')
+
+
+class FakeMarket:
+    """ 替换 run_scan_job 用到的 tushare_tools 函数 """
+
+    def __init__(self, stocks: int = 50):
+        self.stocks = [tushare_tools.Stock(f'{i:06d}.SZ', f'股票{i}') for i in range(stocks)]
+        self.scanned = []
+
+    def match_days(self, ts_code):
+        return ['20240102'] if int(ts_code[:6]) % 7 == 0 else []
+
+    def scan_match_days(self, start_date, end_date, freq='D', stocks=None, **kwargs):
+        for i, stock in enumerate(stocks):
+            self.scanned.append(stock.ts_code)
+            yield {'done': i + 1, 'total': len(stocks), 'eta': 0, 'ts_code': stock.ts_code, 'name': stock.name,
+                   'match_days': self.match_days(stock.ts_code), 'error': None}
+
+    def match_days_for_market(self, start_date, end_date, mode='batch', freq='D', ts_codes=None, progress=None,
+                              **kwargs):
+        for day in range(100):
+            if progress is not None:
+                progress(day + 1, 100)
+        return {ts_code: self.match_days(ts_code) for ts_code in ts_codes}
+
+
+@pytest.fixture
+def market(monkeypatch):
+    market = FakeMarket()
+    monkeypatch.setattr(tushare_tools, 'get_all_live_stocks', lambda: list(market.stocks))
+    monkeypatch.setattr(tushare_tools, 'scan_match_days', market.scan_match_days)
+    monkeypatch.setattr(tushare_tools, 'match_days_for_market', market.match_days_for_market)
+    return market
+
+
+@pytest.mark.parametrize('mode', ['per_stock', 'batch'])
+def test_run_scan_job(queue, market, mode):
+    job_id = queue.submit(default_scan_params('20240101', '20240131', mode=mode))
+    run_scan_job(queue, queue.claim())
+    job = queue.get(job_id)
+    assert (job['done'], job['total'], job['matched']) == (50, 50, 8)
+    assert [row['ts_code'] for row in queue.results(job_id)] == [f'{i:06d}.SZ' for i in range(0, 50, 7)]
+
+
+def test_resume_skips_checkpointed_stocks(queue, market):
+    job_id = queue.submit(default_scan_params('20240101', '20240131'))
+    job = queue.claim()
+    queue.record(job_id, [(stock.ts_code, stock.name, market.match_days(stock.ts_code)) for stock in market.stocks[:30]])
+    run_scan_job(queue, job)
+    assert market.scanned == [stock.ts_code for stock in market.stocks[30:]]
+    assert queue.get(job_id)['done'] == 50
+
+
+@pytest.mark.parametrize('mode', ['per_stock', 'batch'])
+def test_cancel_stops_a_running_job(queue, market, mode):
+    job_id = queue.submit(default_scan_params('20240101', '20240131', mode=mode))
+    job = queue.claim()
+    queue.cancel(job_id)
+    with pytest.raises(JobCancelled):
+        run_scan_job(queue, job)
+    assert queue.get(job_id)['done'] < 50
+
+
+def test_worker_pool_renews_the_lease_and_finishes(queue):
+    release = threading.Event()
+
+    def runner(queue, job):
+        release.wait(5)
+        if job['params'].get('fail'):
+            raise ValueError('boom')
+
+    pool = WorkerPool(queue, runner=runner, workers=2, poll_interval=0.01).start()
+    try:
+        ok, failed = queue.submit({}), queue.submit({'fail': True})
+        _wait_for(lambda: queue.get(ok)['status'] == 'running' and queue.get(failed)['status'] == 'running')
+        # 运行时间超过租约：心跳续期，空闲 worker 的 recover 不会接手
+        time.sleep(queue.lease * 2)
+        assert queue.recover() == 0
+        release.set()
+        _wait_for(lambda: queue.get(ok)['status'] == 'done' and queue.get(failed)['status'] == 'failed')
+        assert queue.get(failed)['error'] == 'boom'
+    finally:
+        pool.stop()
+
+
+def test_agent_streams_market_scans_from_a_job(queue, market, monkeypatch):
+    import agent
+
+    monkeypatch.setattr(agent, 'JOB_POLL_INTERVAL', 0.01)
+    monkeypatch.setattr(agent, 'get_indexed_match_days', lambda **params: None)
+    tushare_agent = agent.TushareAgent.__new__(agent.TushareAgent)
+    tushare_agent.job_queue = queue
+    decision = {"function": "get_stock_match_days", "params": {"start_date": "20240101", "end_date": "20240131"}}
+    assert tushare_agent._is_market_scan(decision)
+
+    pool = WorkerPool(queue, workers=1, poll_interval=0.01).start()
+    try:
+        updates = list(tushare_agent._stream_scan_job(decision))
+    finally:
+        pool.stop()
+    assert updates[-1]['progress']['status'] == 'done'
+    assert updates[-1]['progress']['done'] == 50
+    assert len(updates[-1]['result']) == 8
+    assert market.scanned
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+from signal_index import SignalIndex, bars_between
+
+
+def _days_ago(days: int) -> str:
+    return (datetime.now() - timedelta(days=days)).strftime('%Y%m%d')
+
+
+def test_bars_between_counts_weekdays_and_periods():
+    assert bars_between('20240104', '20240105') == 1   # 周四 -> 周五
+    assert bars_between('20240105', '20240108') == 1   # 周五 -> 下周一，跨过周末
+    assert bars_between('20240105', '20240109') == 2
+    assert bars_between('20240105', '20240105') == 0
+    assert bars_between('20240105', '20240112', 'W') == 1
+    assert bars_between('20240131', '20240329', 'M') == 2
+
+
+def test_covers_allows_only_the_unconfirmed_latest_bar(tmp_path):
+    index = SignalIndex(str(tmp_path / 'signals.sqlite'))
+    assert not index.covers('20240101', '20240131')
+
+    index.write({'000001.SZ': ['20240110']}, '20240101', '20240131')
+    assert index.covers('20240101', '20240131')
+    assert index.covers('20240115', '20240120')
+    assert not index.covers('20231231', '20240120')
+    # 周三之后只差周四一根 K 线，可以由索引回答；到下周一就差了多根，索引已过期
+    assert index.covers('20240101', '20240201')
+    assert not index.covers('20240101', '20240205')
+
+
+def test_stale_index_is_not_used_for_queries_ending_today(tmp_path):
+    index = SignalIndex(str(tmp_path / 'signals.sqlite'))
+    index.write({}, '20200101', _days_ago(30))
+    assert not index.covers('20200101', _days_ago(0))
+    assert not index.covers('20200101', _days_ago(-10))
+
+
+def test_write_merges_adjacent_ranges_and_lookup(tmp_path):
+    index = SignalIndex(str(tmp_path / 'signals.sqlite'))
+    index.write({'000001.SZ': ['20240110'], '600000.SH': ['20240112']}, '20240101', '20240131')
+    index.write({'000001.SZ': ['20240205']}, '20240201', '20240229')
+    assert index.coverage() == ('20240101', '20240229')
+    assert index.lookup('20240101', '20240229', ts_code='000001.SZ') == ['20240110', '20240205']
+    assert index.lookup('20240111', '20240229') == {'000001.SZ': ['20240205'], '600000.SH': ['20240112']}
+    # 重写区间会先删除旧结果
+    index.write({}, '20240201', '20240229')
+    assert index.lookup('20240201', '20240229') == {}
@@ -0,0 +1,109 @@
+import asyncio
+import copy
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from single_flight import SingleFlight, call_key, single_flight
+
+
+def _wait_for_waiters(flight: SingleFlight, count: int):
+    deadline = time.monotonic() + 5
+    while flight.coalesced < count:
+        assert time.monotonic() < deadline, "waiters did not join"
+        time.sleep(0.001)
+
+
+def test_concurrent_identical_calls_run_once():
+    calls = []
+    release = threading.Event()
+
+    @single_flight()
+    def fetch(ts_code, freq='D'):
+        calls.append(ts_code)
+        release.wait(5)
+        return {ts_code: ['20240102']}
+
+    with ThreadPoolExecutor(8) as executor:
+        futures = [executor.submit(fetch, '000001.SZ') for _ in range(4)]
+        futures += [executor.submit(fetch, '000001.SZ', freq='D') for _ in range(4)]
+        _wait_for_waiters(fetch.flight, 7)
+        release.set()
+        results = [future.result() for future in futures]
+    assert calls == ['000001.SZ']
+    assert all(result == {'000001.SZ': ['20240102']} for result in results)
+    assert fetch.flight.stats()['in_flight'] == 0
+    # 调用结束后不再合并
+    fetch('000001.SZ')
+    assert len(calls) == 2
+
+
+def test_different_keys_are_not_coalesced():
+    @single_flight()
+    def fetch(ts_code):
+        return ts_code
+
+    assert [fetch(code) for code in ('a', 'b')] == ['a', 'b']
+    assert fetch.flight.leaders == 2 and fetch.flight.coalesced == 0
+
+
+def test_waiters_get_the_leaders_exception():
+    release = threading.Event()
+
+    @single_flight()
+    def fetch(ts_code):
+        release.wait(5)
+        raise IOError(ts_code)
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(fetch, 'x') for _ in range(4)]
+        _wait_for_waiters(fetch.flight, 3)
+        release.set()
+        for future in futures:
+            with pytest.raises(IOError):
+                future.result()
+
+
+def test_clone_isolates_every_caller():
+    release = threading.Event()
+
+    @single_flight(clone=copy.deepcopy)
+    def match_days():
+        release.wait(5)
+        return {'000001.SZ': ['20240102']}
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(match_days) for _ in range(4)]
+        _wait_for_waiters(match_days.flight, 3)
+        release.set()
+        results = [future.result() for future in futures]
+    results[0]['000001.SZ'].append('20240103')
+    results[1]['600000.SH'] = []
+    assert all(result == {'000001.SZ': ['20240102']} for result in results[2:])
+    assert len({id(result['000001.SZ']) for result in results}) == 4
+
+
+def test_async_calls_coalesce():
+    calls = []
+
+    @single_flight()
+    async def chat(prompt):
+        calls.append(prompt)
+        await asyncio.sleep(0.05)
+        return prompt.upper()
+
+    async def main():
+        return await asyncio.gather(*(chat('hi') for _ in range(5)))
+
+    assert asyncio.run(main()) == ['HI'] * 5
+    assert calls == ['hi']
+
+
+def test_call_key_applies_defaults():
+    def fetch(ts_code, start_date, freq='D'):
+        pass
+
+    assert call_key(fetch, ('a', '20240101'), {}) == call_key(fetch, ('a',), {'start_date': '20240101', 'freq': 'D'})
+    assert call_key(fetch, ('a', '20240101'), {}) != call_key(fetch, ('a', '20240101', 'W'), {})
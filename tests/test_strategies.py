@@ -0,0 +1,20 @@
+import pytest
+
+from indicators import add_moving_averages
+from strategies import build_strategy, match_days_from_frame
+from strategy_engine import _synthetic_bars
+
+
+def test_close_above_ma_with_a_window_that_was_not_computed():
+    frame = _synthetic_bars(days=200, seed=1)
+    with pytest.raises(ValueError, match=r"precomputed windows: \[5, 10, 20, 30, 60, 120\]"):
+        match_days_from_frame(frame, {'close_above_ma': {'window': 50}})
+    # 把窗口加入 ma 后可以计算
+    frame = add_moving_averages(frame, [50], ascending=False)
+    assert match_days_from_frame(frame, {'close_above_ma': {'window': 50}}, ma=[50])['close_above_ma']
+
+
+@pytest.mark.parametrize('window', [0, -5, 2.5, '20', True])
+def test_close_above_ma_rejects_invalid_windows(window):
+    with pytest.raises(ValueError, match="window must be a positive integer"):
+        build_strategy('close_above_ma', {'window': window})
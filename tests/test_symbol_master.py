@@ -0,0 +1,113 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import symbol_master
+from symbol_master import SymbolMaster
+
+STOCKS = pd.DataFrame([
+    ('600519.SH', '600519', '贵州茅台', '贵州', '白酒', 'gzmt', '主板', 'SSE', '20010827'),
+    ('000858.SZ', '000858', '五粮液', '四川', '白酒', 'wly', '主板', 'SZSE', '19980427'),
+    ('000001.SZ', '000001', '平安银行', '深圳', '银行', 'payh', '主板', 'SZSE', '19910403'),
+    ('601318.SH', '601318', '中国平安', '深圳', '保险', 'zgpa', '主板', 'SSE', '20070301'),
+], columns=symbol_master.STOCK_BASIC_FIELDS.split(','))
+
+
+class Loader:
+    def __init__(self, df=STOCKS):
+        self.df = df
+        self.calls = 0
+        self.error = None
+
+    def __call__(self):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return self.df.copy()
+
+
+@pytest.fixture
+def loader():
+    return Loader()
+
+
+@pytest.fixture
+def master(loader, tmp_path):
+    return SymbolMaster(loader, str(tmp_path / 'stock_basic.csv'))
+
+
+def _age_snapshot(path: str, days: int = 2):
+    old = time.time() - days * 86400
+    os.utime(path, (old, old))
+
+
+def _new_day(master):
+    master._loaded_on = '19700101'
+
+
+@pytest.mark.parametrize('query', ['贵州茅台', '茅台', 'gzmt', 'GZMT', '600519', '600519.sh', '贵州茅苔'])
+def test_resolve(master, query):
+    assert master.resolve(query)[0]['ts_code'] == '600519.SH'
+
+
+def test_resolve_prefix_and_contains(master):
+    assert [record['ts_code'] for record in master.resolve('平安')] == ['000001.SZ', '601318.SH']
+    assert master.resolve('   ') == []
+
+
+def test_lookup_and_filter(master):
+    assert master.get('000858')['name'] == '五粮液'
+    assert [record['name'] for record in master.by_prefix('p')] == ['平安银行']
+    assert len(master.filter(exchange='sse')) == 2
+    assert [record['name'] for record in master.filter(exchange='SZSE', industry='白酒')] == ['五粮液']
+    assert len(master.filter()) == 4
+
+
+def test_filter_returns_copies(master):
+    master.filter(industry='白酒').clear()
+    master.filter(exchange='SSE').append({})
+    master.filter().clear()
+    assert len(master.filter(industry='白酒')) == 2
+    assert len(master.filter(exchange='SSE')) == 2
+    assert len(master.all()) == 4
+
+
+def test_loaded_once_per_day_and_snapshot_reused(master, loader, tmp_path):
+    master.all()
+    master.resolve('茅台')
+    assert loader.calls == 1
+    # 同一天新进程直接读快照，不再请求
+    other = SymbolMaster(loader, master.path)
+    assert len(other.all()) == 4
+    assert loader.calls == 1
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_loader_failure_keeps_the_loaded_list(master, loader):
+    records = master.all()
+    _age_snapshot(master.path)
+    _new_day(master)
+    loader.error = IOError('抱歉，您每分钟最多访问该接口1次')
+    assert master.all() is records
+    assert master.resolve('茅台')[0]['ts_code'] == '600519.SH'
+    # 失败后一段时间内不再重试
+    assert loader.calls == 2
+    master.all()
+    assert loader.calls == 2
+
+
+def test_loader_failure_falls_back_to_an_old_snapshot(master, loader):
+    master.all()
+    _age_snapshot(master.path)
+    loader.error = IOError('network down')
+    restarted = SymbolMaster(loader, master.path)
+    assert restarted.resolve('gzmt')[0]['ts_code'] == '600519.SH'
+
+
+def test_loader_failure_without_any_list_raises(tmp_path):
+    loader = Loader()
+    loader.error = IOError('network down')
+    with pytest.raises(IOError):
+        SymbolMaster(loader, str(tmp_path / 'stock_basic.csv')).all()
@@ -1,26 +1,97 @@
+import copy
+import os
 from collections import defaultdict
+from threading import Lock
 from typing import List
 
-import tushare as ts
 import pandas as pd
 import time
 
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from backtest import DEFAULT_HORIZONS, run_sweep, run_sweep_arrays
+from bar_store import BAR_STORE_PATH, BarStore, lookahead_end, lookback_start
+from fetch_scheduler import FetchScheduler, NoDataError
+from indicators import add_moving_averages
+from market_panel import load_market_panel, match_days_from_panel, pivot_panel
+from metrics import logger, span
+from panel_store import PANEL_STORE_PATH, open_panel_store
+from parallel_scan import parallel_match_days, parallel_match_days_from_store
+from single_flight import single_flight
+from signal_index import DEFAULT_STRATEGY, SIGNAL_INDEX_PATH, SignalIndex
+import strategies
+from strategy_engine import match_days_from_frame
+from symbol_master import STOCK_BASIC_FIELDS, SYMBOL_MASTER_PATH, SymbolMaster, summarize_record
 
 # 初始化 tushare API
-token = '15a8b539980b03878d71c3e1d8a57d6e5a718e68e720e6c0b0e0dbce'
+token = os.environ.get('TUSHARE_TOKEN', '15a8b539980b03878d71c3e1d8a57d6e5a718e68e720e6c0b0e0dbce')
 pd.options.display.max_columns = None
-pro = ts.pro_api(token=token)
+# tushare 模块和 pro 接口在第一次使用时才导入 / 创建，导入本模块不会加载 tushare
+ts = None
+pro = None
+_client_lock = Lock()
+
+def get_ts():
+    global ts
+    if ts is None:
+        with _client_lock:
+            if ts is None:
+                import tushare
+                ts = tushare
+    return ts
+
+def get_pro():
+    global pro
+    if pro is None:
+        tushare = get_ts()
+        with _client_lock:
+            if pro is None:
+                pro = tushare.pro_api(token=token)
+    return pro
+
+# tushare 请求调度：按接口限流，超出配额时退避重试
+scheduler = FetchScheduler()
+
+def _pro_bar(**kwargs):
+    # pro_bar 内部会吞掉异常（包括超出配额）并返回 None，也可能是代码无效或区间内没有 K 线，
+    # 这里转成 NoDataError，调度器只重试一次
+    get_pro()
+    df = get_ts().pro_bar(**kwargs)
+    if df is None:
+        raise NoDataError(f"pro_bar returned no data for {kwargs.get('ts_code')}")
+    return df
+
+def fetch_bars(ts_code: str, start_date: str, end_date: str, freq='D', adj=None):
+    """ 从 tushare 拉取原始 K 线（不含均线） """
+    return scheduler.call('pro_bar', _pro_bar, ts_code=ts_code, start_date=start_date, end_date=end_date, freq=freq, adj=adj)
+
+# 本地 K 线缓存，TUSHARE_BAR_STORE 设为空字符串时关闭
+bar_store = BarStore(BAR_STORE_PATH, fetcher=fetch_bars) if BAR_STORE_PATH else None
 
 # 获取历史数据的函数
-def get_stock_data(ts_code: str, start_date: str, end_date: str, freq='D', ma: list = [5, 10, 20, 30, 60, 120]):
-    """ 获取指定股票的历史数据，包括均线 """
-    return ts.pro_bar(ts_code=ts_code, start_date=start_date, end_date=end_date, freq=freq, ma=ma)
+# 多个用户同时查询同一只股票、同一区间时只拉取一次，其余请求等待并共享结果（各自拿到一份拷贝）
+@single_flight(clone=lambda df: df.copy())
+def get_stock_data(ts_code: str, start_date: str, end_date: str, freq='D', ma: list = [5, 10, 20, 30, 60, 120], adj=None):
+    """ 获取指定股票的历史数据，包括均线；优先读取本地缓存，只补拉缺失的日期 """
+    if bar_store is None:
+        # 均线在本地按收盘价计算，不使用 pro_bar 的 ma 参数
+        df = fetch_bars(ts_code, lookback_start(start_date, freq, ma), end_date, freq, adj)
+        df = add_moving_averages(df, ma, ascending=False)
+        return df[df['trade_date'] >= start_date].reset_index(drop=True)
+    return bar_store.get_bars(ts_code, start_date, end_date, freq=freq, adj=adj, ma=ma)
+
+MA_DAYS = [5, 10, 20, 30, 60, 120]
+# 所有均线都在范围内时的位掩码
+ALL_MA_IN_RANGE = (1 << len(MA_DAYS)) - 1
 
 # 定义 StatInfo 类来封装每一天的统计数据
+# 使用 __slots__ 并把每条均线是否在范围内压缩成一个整数位掩码（第 i 位对应 MA_DAYS[i]），
+# 全市场扫描时不再为每根 K 线分配均线列表和字典
 class StatInfo:
+    __slots__ = ('ts_code', 'trade_date', 'open_price', 'close_price', 'pre_close', 'volume',
+                 'is_up', 'ma_in_range_mask', 'ma_in_range_count')
+
     def __init__(self, ts_code=None, trade_date=None, open_price=None, close_price=None,  pre_close=None, volume=None, moving_averages=None):
         self.ts_code = ts_code
         self.trade_date = trade_date
@@ -28,9 +99,9 @@ class StatInfo:
         self.close_price = close_price
         self.pre_close = pre_close
         self.volume = volume
-        self.moving_averages = moving_averages
         self.is_up = self._is_up()  # 判断当天是否上涨
-        self.moving_averages_in_range = self._moving_averages_in_range()
+        self.ma_in_range_mask = self._ma_in_range_mask(moving_averages or ())
+        self.ma_in_range_count = bin(self.ma_in_range_mask).count('1')
 
     def _is_up(self):
         """ 判断当天是否上涨 """
@@ -40,19 +111,28 @@ class StatInfo:
             return self.close_price > self.open_price
         return None
 
-    def _moving_averages_in_range(self):
+    def _ma_in_range_mask(self, moving_averages) -> int:
         """
         判断均线价格是否在开盘价和收盘价之间
-        :return: 字典 {均线名称: 是否在范围内}
+        :return: 位掩码，第 i 位为 1 表示 MA_DAYS[i] 对应的均线在范围内
         """
         if self.open_price is None or self.close_price is None:
-            return {f"MA_{days}": None for days in [5, 10, 20, 30, 60, 120]}
+            return 0
+
+        low = min(self.open_price, self.close_price, self.pre_close)
+        high = max(self.open_price, self.close_price)
+        mask = 0
+        for i, ma in enumerate(moving_averages):
+            if ma is not None and low <= ma <= high:
+                mask |= 1 << i
+        return mask
 
-        return {
-            f"MA_{days}": (min(self.open_price, self.close_price, self.pre_close) <= ma <= max(self.open_price, self.close_price))
-            if ma is not None else False
-            for days, ma in zip([5, 10, 20, 30, 60, 120], self.moving_averages)
-        }
+    @property
+    def moving_averages_in_range(self):
+        """ 字典 {均线名称: 是否在范围内}，仅用于展示 """
+        if self.open_price is None or self.close_price is None:
+            return {f"MA_{days}": None for days in MA_DAYS}
+        return {f"MA_{days}": bool(self.ma_in_range_mask >> i & 1) for i, days in enumerate(MA_DAYS)}
 
     def __repr__(self):
         return (f"StatInfo(ts_code={self.ts_code}, trade_date={self.trade_date}, is_up={self.is_up}, volume={self.volume}, "
@@ -64,42 +144,29 @@ def match_policy(pre_day: StatInfo, cur_day: StatInfo, next_day: StatInfo) -> bo
         return False
     if not (cur_day.volume / pre_day.volume > 3 and cur_day.volume / next_day.volume > 3):
         return False
-    return sum(value is True for value in cur_day.moving_averages_in_range.values()) >= 4
-    # return all(cur_day.moving_averages_in_range.values())
+    return cur_day.ma_in_range_count >= 4
+    # return cur_day.ma_in_range_mask == ALL_MA_IN_RANGE
     #return True
-    # return all(pre_day.moving_averages_in_range.values()) or all(cur_day.moving_averages_in_range.values())  # 检查均线是否都在范围内
+    # return pre_day.ma_in_range_mask == ALL_MA_IN_RANGE or cur_day.ma_in_range_mask == ALL_MA_IN_RANGE  # 检查均线是否都在范围内
 
-# 获取符合策略的日期（封装所有步骤）
-def get_stock_match_days(ts_code: str, start_date: str, end_date: str, freq = 'D', ma: list = [5, 10, 20, 30, 60, 120]) -> list:
-    """
-    获取符合策略的股票匹配日期
-    结合了获取股票数据、生成统计信息列表以及策略匹配的步骤
-    """
-    print("invoked ... get_stock_match_days ")
-    # 获取数据
-    df = get_stock_data(ts_code, start_date, end_date, freq, ma)
-    # print(df.info)
-
-    # 创建 StatInfo 实例列表
-    stat_info_list = []
-    for _, row in df.iterrows():
-        stat_info = StatInfo(
-            ts_code=row['ts_code'],
-            trade_date=row['trade_date'],
-            open_price=row['open'],
-            close_price=row['close'],
-            pre_close=row['pre_close'],
-            volume=row['vol'],
-            moving_averages=[row['ma5'], row['ma10'], row['ma20'], row['ma30'], row['ma60'], row['ma120']]
-            #moving_averages=[row['ma_v_5'], row['ma_v_10'], row['ma_v_20'], row['ma_v_30'], row['ma_v_60'], row['ma_v_120']]
-        )
-        # print(stat_info)
-        stat_info_list.append(stat_info)
+def stat_infos_from_frame(df: pd.DataFrame) -> List[StatInfo]:
+    """ 将 pro_bar 返回的 DataFrame 转换为 StatInfo 列表（逐行路径，保留用于对照） """
+    # 按列取出 Python 原生值再逐行组装，避免 iterrows 为每一行构造 Series
+    columns = [df[name].tolist() for name in ['ts_code', 'trade_date', 'open', 'close', 'pre_close', 'vol']]
+    moving_averages = list(zip(*[df[f'ma{days}'].tolist() for days in MA_DAYS]))
+    #moving_averages = list(zip(*[df[f'ma_v_{days}'].tolist() for days in MA_DAYS]))
+    stat_info_list = [
+        StatInfo(ts_code=ts_code, trade_date=trade_date, open_price=open_price, close_price=close_price,
+                 pre_close=pre_close, volume=volume, moving_averages=mas)
+        for ts_code, trade_date, open_price, close_price, pre_close, volume, mas in zip(*columns, moving_averages)
+    ]
 
     # 反转列表，使最新的数据在前
     stat_info_list.reverse()
-    print(len(stat_info_list))
-    # 获取符合策略的日期
+    return stat_info_list
+
+def match_days_from_stat_infos(stat_info_list: List[StatInfo]) -> list:
+    """ 在 StatInfo 列表上逐个三元组调用 match_policy，返回满足策略的日期 """
     stock_match_days = []
     for i in range(1, len(stat_info_list) - 1):
         pre_day = stat_info_list[i - 1]
@@ -108,9 +175,106 @@ def get_stock_match_days(ts_code: str, start_date: str, end_date: str, freq = 'D
         # print(cur_day.trade_date)
         if match_policy(pre_day, cur_day, next_day):
             stock_match_days.append(cur_day.trade_date)
-
     return stock_match_days
 
+# 预计算的信号索引（python signal_index.py build/update），SIGNAL_INDEX_PATH 设为空字符串时关闭
+signal_index = SignalIndex(SIGNAL_INDEX_PATH) if SIGNAL_INDEX_PATH else None
+
+def get_indexed_match_days(start_date: str, end_date: str, ts_code: str = None, freq='D',
+                           ma: list = [5, 10, 20, 30, 60, 120], strategy: str = DEFAULT_STRATEGY,
+                           strategy_params: dict = None):
+    """
+    从信号索引查询匹配日期，索引未覆盖该区间（或使用了非默认均线、非默认策略参数）时返回 None
+    :return: 指定 ts_code 时为日期列表，否则为 {ts_code: 日期列表}
+    """
+    if signal_index is None or list(ma) != MA_DAYS or strategy_params:
+        return None
+    if not signal_index.covers(start_date, end_date, freq, strategy):
+        return None
+    return signal_index.lookup(start_date, end_date, ts_code=ts_code, freq=freq, strategy=strategy)
+
+# 获取符合策略的日期（封装所有步骤）
+# 指定 ts_code 时返回日期列表，否则返回 {ts_code: 日期列表}，等待者各自拿到一份拷贝（包括内层列表）
+@single_flight(clone=copy.deepcopy)
+def get_stock_match_days(ts_code: str, start_date: str, end_date: str, freq = 'D', ma: list = [5, 10, 20, 30, 60, 120],
+                         strategy: str = DEFAULT_STRATEGY, strategy_params: dict = None) -> list:
+    """
+    获取符合策略的股票匹配日期
+    结合了获取股票数据、生成统计信息列表以及策略匹配的步骤；信号索引覆盖该区间时直接查表
+    :param ts_code: 为 None 时查询全市场，返回 {ts_code: 日期列表}（索引未覆盖时按交易日批量计算）
+    :param strategy: strategies.STRATEGIES 中的策略名，strategy_params 为该策略的阈值参数
+    """
+    logger.debug("get_stock_match_days %s %s-%s freq=%s strategy=%s", ts_code, start_date, end_date, freq, strategy)
+    indexed = get_indexed_match_days(start_date, end_date, ts_code, freq, ma, strategy, strategy_params)
+    if indexed is not None:
+        return indexed
+    if ts_code is None:
+        return match_days_for_market(start_date, end_date, 'batch', freq, ma, strategy=strategy,
+                                     strategy_params=strategy_params)
+    if strategy != DEFAULT_STRATEGY or strategy_params:
+        return get_strategy_match_days(ts_code, start_date, end_date, {strategy: strategy_params}, freq, ma)[strategy]
+    # 获取数据
+    df = get_stock_data(ts_code, start_date, end_date, freq, ma)
+    # print(df.info)
+
+    # 整列执行策略，结果与 match_days_from_stat_infos(stat_infos_from_frame(df)) 一致
+    with span("policy_eval", path="per_stock"):
+        return match_days_from_frame(df, ma)
+
+
+def get_strategy_match_days(ts_code: str, start_date: str, end_date: str, strategy_names=None, freq='D',
+                            ma: list = [5, 10, 20, 30, 60, 120]) -> dict:
+    """
+    只拉取一次数据，同时执行多个策略
+    :param strategy_names: 策略名列表，或 {策略名: 参数}；为空时执行全部策略
+    :return: {策略名: 匹配日期列表}
+    """
+    df = get_stock_data(ts_code, start_date, end_date, freq, ma)
+    with span("policy_eval", path="strategies"):
+        return strategies.match_days_from_frame(df, strategy_names or list(strategies.STRATEGIES), ma)
+
+
+def list_strategies() -> List[dict]:
+    """ 可选策略及其默认参数 """
+    return strategies.describe_strategies()
+
+
+def load_backtest_panel(start_date: str, end_date: str, ts_codes: List[str] = None, freq='D',
+                        ma: list = [5, 10, 20, 30, 60, 120]) -> dict:
+    """
+    回测用的面板：指定股票时从本地 K 线缓存逐只读取后透视，否则按交易日拉取全市场面板
+    """
+    if not ts_codes:
+        return load_market_panel(get_pro(), start_date, end_date, freq=freq, ma=ma, scheduler=scheduler)
+    futures = scheduler.map(lambda ts_code: get_stock_data(ts_code, start_date, end_date, freq, ma), ts_codes)
+    frames = [future.result().assign(ts_code=ts_code) for ts_code, future in zip(ts_codes, futures)]
+    fields = ['open', 'close', 'pre_close', 'vol'] + [f'ma{days}' for days in ma]
+    return pivot_panel(pd.concat(frames, ignore_index=True), ts_codes, fields=fields)
+
+
+def backtest_strategy(start_date: str, end_date: str, strategy: str = DEFAULT_STRATEGY, param_grid: dict = None,
+                      horizons: List[int] = DEFAULT_HORIZONS, ts_codes: List[str] = None, freq='D',
+                      ma: list = [5, 10, 20, 30, 60, 120], with_equity: bool = False) -> List[dict]:
+    """
+    回测 [start_date, end_date] 内的信号：信号后 N 根 K 线的收益、胜率、持有期回撤、等权净值曲线
+    :param param_grid: {参数: 取值列表}，所有组合在同一份面板上一次求出
+    :param ts_codes: 为空时回测全市场
+    :return: 每个 (参数组合, 持有期) 一条记录
+    """
+    # 多取 max(horizons) + 1 根 K 线，保证区间末尾的信号也能算出收益
+    panel_end = lookahead_end(end_date, freq, max(horizons) + 1)
+    store = None if ts_codes else open_panel_store(PANEL_STORE_PATH, freq)
+    fields = ['open', 'close', 'pre_close', 'vol'] + [f'ma{days}' for days in ma]
+    if store is not None and store.covers(start_date, panel_end, fields):
+        # 全市场回测直接在 memmap 视图上计算，不构造 DataFrame
+        dates = store.dates[store.date_slice(start_date, panel_end)]
+        result = run_sweep_arrays(store.view(fields, start_date, panel_end), dates, strategy, param_grid, horizons,
+                                  start_date, end_date, ma, with_equity=with_equity)
+        return result.to_dict(orient='records')
+    panel = load_backtest_panel(start_date, panel_end, ts_codes, freq, ma)
+    result = run_sweep(panel, strategy, param_grid, horizons, start_date, end_date, ma, with_equity=with_equity)
+    return result.to_dict(orient='records')
+
 # 使用示例
 # stock_match_days = get_stock_match_days(ts_code='601933.SH', start_date='20221110', end_date='20241110', freq='D')
 # #stock_match_days = get_stock_match_days(ts_code='601933.SH', start_date='20231110', end_date='20241110', freq='W', ma=[1, 2, 4, 6, 12, 24])
@@ -127,56 +291,158 @@ class Stock:
     def __repr__(self):
         return f"Stock(ts_code={self.ts_code}, name={self.name})"
 
+symbol_master = SymbolMaster(
+    lambda: scheduler.call('stock_basic', get_pro().stock_basic, list_status='L', fields=STOCK_BASIC_FIELDS),
+    SYMBOL_MASTER_PATH)
+_stock_list_cache = (None, [])
+
 def get_all_live_stocks() -> List[Stock]:
-    df = pro.stock_basic(list_status='L')
-    # 创建 Stock 对象列表 stock_list
-    stock_list = [Stock(ts_code=row['ts_code'], name=row['name']) for _, row in df.iterrows()]
-    return stock_list
+    # 代码表每天只拉取一次；Stock 对象列表跟随代码表缓存，刷新后才重新创建
+    global _stock_list_cache
+    records = symbol_master.all()
+    if _stock_list_cache[0] is not records:
+        _stock_list_cache = (records, [Stock(ts_code=record['ts_code'], name=record['name']) for record in records])
+    return list(_stock_list_cache[1])
+
+
+def resolve_stock(query: str, limit: int = 5) -> List[dict]:
+    """
+    把股票名称、代码或拼音首字母解析为 ts_code，例如 "贵州茅台" -> 600519.SH
+    :return: 候选列表，元素为 {ts_code, name, industry, exchange}
+    """
+    return [summarize_record(record) for record in symbol_master.resolve(query, limit)]
+
+
+def scan_match_days(start_date: str, end_date: str, freq='D', ma: list = [5, 10, 20, 30, 60, 120],
+                    stocks: List[Stock] = None, max_in_flight: int = 32, strategy: str = DEFAULT_STRATEGY,
+                    strategy_params: dict = None):
+    """
+    逐只股票扫描全市场，每完成一只股票就 yield 一次进度，调用方可以边扫描边展示结果
+    :return: 生成器，元素为 {done, total, eta, ts_code, name, match_days, error}
+    """
+    stocks = stocks if stocks is not None else get_all_live_stocks()
+    total = len(stocks)
+    t_start = time.time()
+    queue = iter(stocks)
+    running = {}
+
+    def submit_next():
+        stock = next(queue, None)
+        if stock is not None:
+            future = scheduler.submit_task(get_stock_match_days, stock.ts_code, start_date, end_date, freq, ma,
+                                           strategy, strategy_params)
+            running[future] = stock
+
+    # 只保持有限个任务在途，保证第一批结果能尽快返回
+    for _ in range(max_in_flight):
+        submit_next()
+    done = 0
+    while running:
+        finished, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in finished:
+            stock = running.pop(future)
+            submit_next()
+            done += 1
+            elapsed = time.time() - t_start
+            error = future.exception()
+            yield {
+                "done": done,
+                "total": total,
+                "eta": elapsed / done * (total - done),
+                "ts_code": stock.ts_code,
+                "name": stock.name,
+                "match_days": [] if error else future.result(),
+                "error": str(error) if error else None,
+            }
 
 
-lock = Lock()
-res = []
 # 定义处理单个股票的函数
-def process_stock(stock):
+def process_stock(stock, start_date: str, end_date: str, freq='M') -> list:
     t_start_in = time.time()
     print(f"Processing {stock.name}, {stock.ts_code}")
 
     # 调用 get_stock_match_days 以获取匹配日期
-    stock_match_days = get_stock_match_days(ts_code=stock.ts_code, start_date=start_day, end_date=end_day, freq='M')
+    stock_match_days = get_stock_match_days(ts_code=stock.ts_code, start_date=start_date, end_date=end_date, freq=freq)
 
     t_end_in = time.time()
     print(f"{stock.ts_code} processed in {t_end_in - t_start_in:.2f} seconds")
+    return stock_match_days
 
-    # 如果有匹配日期，用锁保护对 res 的访问
-    if stock_match_days:
-        with lock:
-            res.append((stock, stock_match_days))
-    return stock
 
-global end_day, start_day
+def match_days_for_market(start_date: str, end_date: str, mode: str = 'batch', freq='D',
+                          ma: list = [5, 10, 20, 30, 60, 120], ts_codes: List[str] = None,
+                          strategy: str = DEFAULT_STRATEGY, strategy_params: dict = None, progress=None) -> dict:
+    """
+    按交易日批量拉取全市场面板后一次性执行策略
+    :param mode: 'batch' 在面板上直接计算；'parallel' 按股票分片在多进程中计算（仅支持默认策略）
+    :param progress: 拉取面板时每完成一个交易日调用 progress(已完成数, 总数)，回调抛出异常可中止拉取
+    :return: {ts_code: 匹配日期列表}
+    本地列式面板（panel_store）覆盖所需区间和股票时直接在 memmap 上计算，不再请求 Tushare
+    """
+    store = open_panel_store(PANEL_STORE_PATH, freq)
+    fields = ['open', 'close', 'pre_close', 'vol'] + [f'ma{days}' for days in ma]
+    if (store is not None and store.covers(start_date, end_date, fields)
+            and all(ts_code in store.rows for ts_code in ts_codes or ())):
+        if mode == 'parallel' and strategy == DEFAULT_STRATEGY and not strategy_params:
+            match_days = parallel_match_days_from_store(store, start_date, end_date, ma)
+        else:
+            match_days = store.match_days(start_date, end_date, ma, strategy, strategy_params)
+        if ts_codes is not None:
+            wanted = set(ts_codes)
+            match_days = {ts_code: days for ts_code, days in match_days.items() if ts_code in wanted}
+        return match_days
+    panel = load_market_panel(get_pro(), start_date, end_date, freq=freq, ma=ma, ts_codes=ts_codes, scheduler=scheduler,
+                              progress=progress)
+    if strategy != DEFAULT_STRATEGY or strategy_params:
+        return strategies.match_days_from_panel(panel, {strategy: strategy_params}, ma)[strategy]
+    return parallel_match_days(panel, ma) if mode == 'parallel' else match_days_from_panel(panel, ma)
 
-def count_avg_stocks():
-    global end_day, start_day, res
+
+def count_avg_stocks(mode: str = 'per_stock', freq: str = 'M', start_date: str = None, end_date: str = None) -> list:
+    """
+    全市场扫描（同步执行，供命令行使用；界面上的扫描通过 scan_jobs 提交为后台任务）
+    :param mode: 'per_stock' 逐只股票调用 pro_bar；'batch' 按交易日批量拉取全市场后在面板上一次性计算；
+                 'parallel' 与 batch 相同的拉取方式，但按股票分片在多进程中计算
+    :return: [(stock, 匹配日期列表)]，所有状态都是局部变量，多个扫描可以同时进行
+    """
     current_date = datetime.now()
-    ten_days_ago = current_date - timedelta(days=365 * 2)
-    end_day = current_date.strftime('%Y%m%d')
-    start_day = ten_days_ago.strftime('%Y%m%d')
-    res = []
-    print("all stocks: ", len(get_all_live_stocks()))
-    # exit(0)
+    end_date = end_date or current_date.strftime('%Y%m%d')
+    start_date = start_date or (current_date - timedelta(days=365 * 2)).strftime('%Y%m%d')
+    stocks = get_all_live_stocks()
+    print("all stocks: ", len(stocks))
     # 记录总的开始时间
     t_start = time.time()
-    # 使用线程池执行任务
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = [executor.submit(process_stock, stock) for stock in get_all_live_stocks()]
-
-        # 确保每个线程正常执行并记录其结果
-        for future in as_completed(futures):
-            future.result()  # 确保捕获任务的返回值，但不使用
+    res = []
+    if mode in ('batch', 'parallel'):
+        match_days = match_days_for_market(start_date, end_date, mode, freq,
+                                           ts_codes=[stock.ts_code for stock in stocks])
+        res = [(stock, match_days[stock.ts_code]) for stock in stocks if stock.ts_code in match_days]
+    else:
+        # 由调度器控制并发和配额，重试耗尽的股票在最后再补跑一轮，避免丢失结果
+        pending = stocks
+        for _ in range(2):
+            futures = scheduler.map(lambda stock: process_stock(stock, start_date, end_date, freq), pending)
+            failed = []
+            for stock, future in zip(pending, futures):
+                try:
+                    stock_match_days = future.result()
+                except Exception as e:
+                    print(f"{stock.ts_code} failed: {e}")
+                    failed.append(stock)
+                    continue
+                if stock_match_days:
+                    res.append((stock, stock_match_days))
+            pending = failed
+            if not pending:
+                break
+        if pending:
+            print("Failed stocks:", [stock.ts_code for stock in pending])
+        print("Fetch stats:", scheduler.stats())
     # 记录总的结束时间
     t_end = time.time()
     print(f"Total processing time: {t_end - t_start:.2f} seconds")
     print("Result:", res)
+    return res
 
 
 if __name__ == "__main__":